@@ -0,0 +1,10 @@
+"""
+Benchmarks for gozbruh, runnable without Maya or ZBrush
+
+`fakes` provides stand-ins for maya.cmds, maya.utils, pymel.core and the
+osascript call that drives ZBrush, so the real gozbruh client and server
+code can be timed on any machine with python.
+
+Run from the root of the repository:
+    python -m benchmarks.roundtrip --help
+"""
@@ -0,0 +1,569 @@
+"""
+Stand-ins for Maya and ZBrush
+
+`install` registers fake `maya`, `maya.cmds`, `maya.utils`, `pymel` and
+`pymel.core` modules, they must be installed before gozbruh.maya_tools is
+imported. The fake maya.cmds works on a `FakeScene`, which writes and
+reads synthetic mayaAscii meshes of any size.
+
+`FakeZBrush` replaces `utils.send_osa`, it reads the loader zscript that
+ZBrushHandler wrote, and sleeps for a simulated import cost.
+
+`sandbox` points gozbruh's config, shared directory and ports at a
+temporary directory, so a benchmark never touches the user's setup.
+`slow_filesystem` adds latency to file access below a directory, like a
+config directory on a busy network share.
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import types
+import socket
+import random
+import shutil
+import __builtin__
+from threading import RLock
+from contextlib import contextmanager
+
+MESH_HEADER = """//Maya ASCII 2014 scene
+//Name: %(name)s.ma
+requires maya "2014";
+currentUnit -l centimeter -a degree -t film;
+createNode transform -n "%(name)s";
+createNode mesh -n "%(name)sShape" -p "%(name)s";
+\tsetAttr -k off ".v";
+"""
+
+_TRANSFORM_RE = re.compile(r'^createNode transform -n "([^"]+)";', re.M)
+_VERTS_RE = re.compile(r'setAttr -s (\d+) "\.vt')
+_FACES_RE = re.compile(r'setAttr -s (\d+) "\.fc')
+_OPEN_RE = re.compile(r'FileNameSetNext,"!:([^"]+)"')
+_MARK_RE = re.compile(r'trace_mark (\S+) (\S+) (\S+)"')
+
+_bodies = {}
+
+
+def mesh_body(verts, faces):
+    """Returns the mayaAscii vertex and face data for a mesh
+
+    Bodies are cached by size, generating them is not what is measured.
+    """
+    key = (verts, faces)
+    if key not in _bodies:
+        rand = random.Random(verts * 31 + faces)
+        lines = ['\tsetAttr -s %d ".vt[0:%d]"' % (verts, verts - 1)]
+        for _ in xrange(verts):
+            lines.append('\t\t%.6f %.6f %.6f' % (rand.uniform(-10, 10),
+                                                 rand.uniform(-10, 10),
+                                                 rand.uniform(-10, 10)))
+        lines[-1] += ';'
+        lines.append('\tsetAttr -s %d ".fc[0:%d]" -type "polyFaces"'
+                     % (faces, faces - 1))
+        for face in xrange(faces):
+            first = (face * 4) % max(verts - 3, 1)
+            lines.append('\t\tf 4 %d %d %d %d' % (first, first + 1,
+                                                 first + 2, first + 3))
+        lines[-1] += ';'
+        _bodies[key] = '\n'.join(lines) + '\n'
+    return _bodies[key]
+
+
+def _flatten(args):
+    """Flattens the positional arguments of a maya command into names
+    """
+    names = []
+    for arg in args:
+        if arg is None:
+            continue
+        if isinstance(arg, basestring):
+            names.append(arg)
+        else:
+            names.extend(arg)
+    return names
+
+
+class FakeScene(object):
+    """A scene of mesh transforms and their shapes, with the subset of
+    maya.cmds that gozbruh uses.
+
+    Attributes
+    ----------
+    nodes : dict
+        node name -> dict with 'type', 'attrs', 'uuid', 'parent',
+        'children', 'verts' and 'faces'
+    selection : list of str
+    option_vars : dict
+        values returned by optionVar
+    batch : bool
+        value of about(batch=True), True makes the import queue drain
+        right away instead of waiting for idle events
+    calls : dict
+        command name -> number of calls
+    """
+
+    def __init__(self, batch=True):
+        self.nodes = {}
+        self.uuids = {}
+        self.selection = []
+        self.option_vars = {}
+        self.batch = batch
+        self.calls = {}
+        self.lock = RLock()
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    # scene building
+    # --------------
+
+    def create_mesh(self, name, verts=1000, faces=None):
+        """Adds a mesh transform `name` with a shape of `verts` vertices
+        """
+        if faces is None:
+            faces = verts
+        with self.lock:
+            self._delete_node(name)
+            shape = name + 'Shape'
+            self._add_node(name, 'transform', verts=verts, faces=faces)
+            self._add_node(shape, 'mesh', parent=name)
+            self.nodes[name]['children'].append(shape)
+        return name
+
+    def _add_node(self, name, node_type, parent=None, **data):
+        node = {'type': node_type,
+                'attrs': {},
+                'uuid': uuid.uuid4().hex.upper(),
+                'parent': parent,
+                'children': []}
+        node.update(data)
+        self.nodes[name] = node
+        self.uuids[node['uuid']] = name
+
+    def _delete_node(self, name):
+        node = self.nodes.pop(name, None)
+        if node is None:
+            return
+        del self.uuids[node['uuid']]
+        for child in node['children']:
+            self._delete_node(child)
+
+    def _split(self, plug):
+        node, _, attr = plug.partition('.')
+        return self.nodes.get(node), node, attr
+
+    # maya.cmds
+    # ---------
+
+    def ls(self, *args, **kwargs):
+        self._count('ls')
+        with self.lock:
+            if kwargs.get('selection') or kwargs.get('sl'):
+                names = list(self.selection)
+            elif args:
+                names = _flatten(args)
+            else:
+                names = list(self.nodes)
+
+            found = []
+            for name in names:
+                if name in self.uuids:
+                    found.append(self.uuids[name])
+                    continue
+                if name.startswith('*.'):
+                    attr = name[2:]
+                    found.extend(n for n, node in self.nodes.iteritems()
+                                 if attr in node['attrs'])
+                    continue
+                node, node_name, attr = self._split(name)
+                if node is None or (attr and attr not in node['attrs']):
+                    continue
+                if attr and not kwargs.get('objectsOnly'):
+                    found.append(name)
+                else:
+                    found.append(node_name)
+
+            if kwargs.get('dag'):
+                for name in list(found):
+                    found.extend(self.nodes[name]['children'])
+            node_type = kwargs.get('type')
+            if node_type is not None:
+                found = [n for n in found if self.nodes.get(n, {}).get('type')
+                         == node_type]
+            if kwargs.get('transforms'):
+                found = [n for n in found
+                         if self.nodes[n]['type'] == 'transform']
+            if kwargs.get('uuid'):
+                found = [self.nodes[n]['uuid'] for n in found]
+            return found
+
+    def select(self, *args, **kwargs):
+        self._count('select')
+        with self.lock:
+            if kwargs.get('cl') or kwargs.get('clear'):
+                self.selection = []
+            else:
+                self.selection = [n for n in _flatten(args)
+                                  if n in self.nodes]
+
+    def delete(self, *args, **kwargs):
+        self._count('delete')
+        if kwargs.get('ch') or kwargs.get('constructionHistory'):
+            return
+        with self.lock:
+            for name in _flatten(args):
+                self._delete_node(name)
+
+    def rename(self, old, new):
+        self._count('rename')
+        with self.lock:
+            node = self.nodes.pop(old)
+            self.nodes[new] = node
+            self.uuids[node['uuid']] = new
+            for child in node['children']:
+                self.nodes[child]['parent'] = new
+        return new
+
+    def objExists(self, name):
+        self._count('objExists')
+        return bool(self.ls(name))
+
+    def attributeQuery(self, attr, node=None, exists=False):
+        self._count('attributeQuery')
+        with self.lock:
+            return attr in self.nodes[node]['attrs']
+
+    def addAttr(self, *args, **kwargs):
+        self._count('addAttr')
+        attr = kwargs.get('longName') or kwargs.get('ln')
+        with self.lock:
+            for name in _flatten(args):
+                self.nodes[name]['attrs'].setdefault(attr, None)
+
+    def setAttr(self, plug, value=None, **kwargs):
+        self._count('setAttr')
+        with self.lock:
+            node, _, attr = self._split(plug)
+            node['attrs'][attr] = value
+
+    def getAttr(self, plug):
+        self._count('getAttr')
+        with self.lock:
+            node, _, attr = self._split(plug)
+            return node['attrs'][attr]
+
+    def listRelatives(self, *args, **kwargs):
+        self._count('listRelatives')
+        with self.lock:
+            found = []
+            for name in _flatten(args):
+                node = self.nodes[name]
+                if kwargs.get('parent'):
+                    if node['parent'] is not None:
+                        found.append(node['parent'])
+                else:
+                    found.extend(node['children'])
+            return found
+
+    def listHistory(self, *args, **kwargs):
+        self._count('listHistory')
+        return []
+
+    def file(self, path, **kwargs):
+        self._count('file')
+        if kwargs.get('exportSelected'):
+            self._export_selected(path)
+        elif kwargs.get('i') or kwargs.get('import'):
+            self._import_file(path)
+
+    def _export_selected(self, path):
+        with self.lock:
+            meshes = [n for n in self.selection
+                      if self.nodes[n]['type'] == 'transform']
+            data = [(n, self.nodes[n]['verts'], self.nodes[n]['faces'])
+                    for n in meshes]
+        ma_write = open(path, 'w')
+        try:
+            for name, verts, faces in data:
+                ma_write.write(MESH_HEADER % {'name': name})
+                ma_write.write(mesh_body(verts, faces))
+        finally:
+            ma_write.close()
+
+    def _import_file(self, path):
+        ma_read = open(path, 'r')
+        try:
+            text = ma_read.read()
+        finally:
+            ma_read.close()
+        verts = [int(n) for n in _VERTS_RE.findall(text)]
+        faces = [int(n) for n in _FACES_RE.findall(text)]
+        for index, name in enumerate(_TRANSFORM_RE.findall(text)):
+            self.create_mesh(name, verts[index], faces[index])
+
+    def optionVar(self, ex=None, q=None, **kwargs):
+        self._count('optionVar')
+        if ex is not None:
+            return ex in self.option_vars
+        if q is not None:
+            return self.option_vars.get(q, 0)
+        for key, value in kwargs.iteritems():
+            # iv=(name, value), sv=(name, value)...
+            self.option_vars[value[0]] = value[1]
+
+    def about(self, batch=False, **kwargs):
+        self._count('about')
+        return self.batch if batch else ''
+
+    def _noop(self, *args, **kwargs):
+        return None
+
+    refresh = undoInfo = displaySmoothness = makeIdentity = _noop
+    commandPort = scriptJob = sets = _noop
+
+    def commands(self):
+        """Returns the maya.cmds functions, by name
+        """
+        names = ['ls', 'select', 'delete', 'rename', 'objExists',
+                 'attributeQuery', 'addAttr', 'setAttr', 'getAttr',
+                 'listRelatives', 'listHistory', 'file', 'optionVar',
+                 'about', 'refresh', 'undoInfo', 'displaySmoothness',
+                 'makeIdentity', 'commandPort', 'scriptJob', 'sets']
+        return dict((name, getattr(self, name)) for name in names)
+
+
+class FakeMainThread(object):
+    """maya.utils stand-in, commands queued for the main thread run one at
+    a time on the calling thread
+    """
+
+    def __init__(self):
+        self.lock = RLock()
+
+    def executeInMainThreadWithResult(self, func, *args, **kwargs):
+        with self.lock:
+            return func(*args, **kwargs)
+
+    def executeDeferred(self, func, *args, **kwargs):
+        with self.lock:
+            return func(*args, **kwargs)
+
+
+class FakeZBrush(object):
+    """Stand-in for ZBrush opening loader zscripts through osascript.
+
+    Each script costs `base_cost` seconds plus `cost_per_mb` seconds per MB
+    of the file it imports. The trace_mark line the loader appends is
+    recorded, as ZBrush would.
+
+    Attributes
+    ----------
+    imports : int
+        number of scripts opened
+    imported_bytes : int
+        total size of the imported files
+    tools : dict
+        tool name -> path of the file it was last imported from
+    """
+
+    def __init__(self, base_cost=0.005, cost_per_mb=0.02):
+        self.base_cost = base_cost
+        self.cost_per_mb = cost_per_mb
+        self.imports = 0
+        self.imported_bytes = 0
+        self.tools = {}
+        self.lock = RLock()
+
+    def send_osa(self, script_path):
+        zs_read = open(script_path, 'r')
+        try:
+            zscript = zs_read.read()
+        finally:
+            zs_read.close()
+
+        size = 0
+        path = None
+        match = _OPEN_RE.search(zscript)
+        if match and os.path.exists(match.group(1)):
+            path = match.group(1)
+            size = os.path.getsize(path)
+
+        time.sleep(self.base_cost + self.cost_per_mb * size / 1048576.0)
+
+        with self.lock:
+            self.imports += 1
+            self.imported_bytes += size
+            if path is not None:
+                self.tools[os.path.splitext(os.path.basename(path))[0]] = path
+
+        match = _MARK_RE.search(zscript)
+        if match:
+            from gozbruh import trace
+            trace.mark(match.group(2), trace_id=match.group(1),
+                       obj=match.group(3))
+
+
+    def export_tools(self, names):
+        """Writes the files ZBrush's send buttons export for `names` to the
+        shared directory
+        """
+        from gozbruh import utils
+
+        for name in names:
+            path = utils.make_maya_filepath(name)
+            if self.tools.get(name, path) != path:
+                shutil.copyfile(self.tools[name], path)
+
+
+def install(scene=None, pymel_import_cost=0.0):
+    """Registers the fake maya and pymel modules
+
+    Parameters
+    ----------
+    scene : `FakeScene`
+        (optional) scene for maya.cmds, a new batch mode scene by default
+    pymel_import_cost : float
+        seconds importing pymel.core takes, to check it is imported lazily
+
+    Returns
+    -------
+    `FakeScene`
+    """
+    if scene is None:
+        scene = FakeScene()
+
+    maya = types.ModuleType('maya')
+    maya.__path__ = []
+    cmds = types.ModuleType('maya.cmds')
+    cmds.__dict__.update(scene.commands())
+    main_thread = FakeMainThread()
+    maya_utils = types.ModuleType('maya.utils')
+    maya_utils.executeInMainThreadWithResult = \
+        main_thread.executeInMainThreadWithResult
+    maya_utils.executeDeferred = main_thread.executeDeferred
+    maya.cmds = cmds
+    maya.utils = maya_utils
+
+    pymel = types.ModuleType('pymel')
+    pymel.__path__ = []
+    sys.modules.update({'maya': maya,
+                        'maya.cmds': cmds,
+                        'maya.utils': maya_utils,
+                        'pymel': pymel})
+    # pymel.core is imported from a finder so the import cost is paid
+    # only if something imports it
+    sys.meta_path.insert(0, _PymelFinder(scene, pymel_import_cost))
+    return scene
+
+
+class _PymelFinder(object):
+    """Import hook creating the fake pymel.core on first import
+    """
+
+    def __init__(self, scene, import_cost):
+        self.scene = scene
+        self.import_cost = import_cost
+
+    def find_module(self, fullname, path=None):
+        if fullname == 'pymel.core':
+            return self
+        return None
+
+    def load_module(self, fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+        time.sleep(self.import_cost)
+        core = types.ModuleType(fullname)
+        core.__dict__.update(self.scene.commands())
+        core.confirmDialog = lambda *args, **kwargs: kwargs.get(
+            'defaultButton', 'Ok')
+        sys.modules[fullname] = core
+        sys.modules['pymel'].core = core
+        return core
+
+
+def free_port():
+    """Returns a TCP port on localhost that is not in use
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def sandbox(root):
+    """Points gozbruh at `root` for its config and shared directory, and at
+    free ports on localhost
+
+    Must be called after gozbruh.utils is imported.
+
+    Returns
+    -------
+    dict
+        the paths and ports used: config_path, shared_dir, maya_port,
+        maya_command_port, zbrush_port
+    """
+    from gozbruh import utils
+
+    config_path = os.path.join(root, 'config')
+    shared_dir = os.path.join(root, 'shared')
+    for path in (config_path, os.path.join(config_path, 'temp'), shared_dir):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    # the maya command server listens next to the commandPort
+    command_port = free_port()
+    maya_port = command_port - utils.MAYA_COMMAND_PORT_OFFSET
+    zbrush_port = free_port()
+
+    utils.CONFIG_PATH = config_path
+    os.environ[utils.SHARED_DIR_ENV] = shared_dir
+    os.environ[utils.MAYA_ENV] = 'localhost:%d' % maya_port
+    os.environ[utils.ZBRUSH_ENV] = 'localhost:%d' % zbrush_port
+    utils._config_cache.invalidate()
+
+    return {'config_path': config_path,
+            'shared_dir': shared_dir,
+            'maya_port': maya_port,
+            'maya_command_port': command_port,
+            'zbrush_port': zbrush_port}
+
+
+@contextmanager
+def slow_filesystem(root, latency):
+    """Adds `latency` seconds to every stat and open of a path below `root`
+
+    A `latency` of 0 leaves the filesystem alone.
+    """
+    if not latency:
+        yield
+        return
+
+    root = os.path.abspath(root)
+    real_stat = os.stat
+    real_open = __builtin__.open
+
+    def is_slow(path):
+        return isinstance(path, basestring) and \
+            os.path.abspath(path).startswith(root)
+
+    def slow_stat(path, *args, **kwargs):
+        if is_slow(path):
+            time.sleep(latency)
+        return real_stat(path, *args, **kwargs)
+
+    def slow_open(path, *args, **kwargs):
+        if is_slow(path):
+            time.sleep(latency)
+        return real_open(path, *args, **kwargs)
+
+    os.stat = slow_stat
+    __builtin__.open = slow_open
+    try:
+        yield
+    finally:
+        os.stat = real_stat
+        __builtin__.open = real_open
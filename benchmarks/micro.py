@@ -0,0 +1,168 @@
+"""
+Micro-benchmarks of the helpers that run on every send
+
+Each case is run `--warmup` times untimed, then timed over `--repeat`
+repetitions of `--number` calls. The per-call times of the repetitions
+are summarized with `results.summarize`.
+
+    python -m benchmarks.micro --latency 0.002
+    python -m benchmarks.micro --compare micro-1a2b3c4.json
+
+Cases marked slow_fs read the config from a directory with `--latency`
+seconds added to each stat and open, see `fakes.slow_filesystem`.
+"""
+
+import os
+import shutil
+import tempfile
+import argparse
+from timeit import default_timer as clock
+
+from . import fakes
+from . import results
+
+# realistic sizes: a send-all of a large tool
+OBJECT_COUNT = 500
+PARENT_NAME_LENGTH = 120
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.micro',
+        description='Time gozbruh helpers that run on every send')
+    parser.add_argument('--warmup', type=int, default=3,
+                        help='untimed runs before each case')
+    parser.add_argument('--repeat', type=int, default=30,
+                        help='timed repetitions per case')
+    parser.add_argument('--number', type=int, default=10,
+                        help='calls per repetition')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='seconds added to each config file access in '
+                             'the slow_fs cases')
+    parser.add_argument('--filter', default='',
+                        help='only run cases whose name contains this')
+    parser.add_argument('--output', default=None,
+                        help='result file, micro-<commit>.json by default')
+    parser.add_argument('--compare', default=None,
+                        help='result file of a baseline run to compare with')
+    return parser
+
+
+def measure(func, warmup, repeat, number):
+    """Returns the per-call time of `func` for each repetition
+    """
+    for _ in xrange(warmup):
+        func()
+    times = []
+    for _ in xrange(repeat):
+        started = clock()
+        for _ in xrange(number):
+            func()
+        times.append((clock() - started) / number)
+    return times
+
+
+def get_cases(config_path, latency):
+    """Returns a list of (name, setup, func), `setup` is a context manager
+    factory for the environment `func` runs in
+    """
+    import gozbruh.maya_tools as maya_tools
+    from gozbruh import utils
+    from gozbruh import zbrush_tools
+
+    parent = 'p' * PARENT_NAME_LENGTH
+    names = ['subtool_with_a_long_descriptive_name_%04d' % index
+             for index in xrange(OBJECT_COUNT)]
+    obj_parents = [(name, parent) for name in names]
+    uuids = dict((name, '%032X' % index) for index, name in enumerate(names))
+    client = maya_tools.MayaToZBrushClient()
+    handler = zbrush_tools.ZBrushHandler
+
+    def fast():
+        return fakes.slow_filesystem(config_path, 0.0)
+
+    def slow():
+        return fakes.slow_filesystem(config_path, latency)
+
+    def cold_net_info():
+        utils._config_cache.invalidate()
+        utils.get_net_info(utils.MAYA_ENV)
+
+    return [
+        ('make_maya_filepath x%d' % OBJECT_COUNT, fast,
+         lambda: [utils.make_maya_filepath(name) for name in names]),
+        # every call stats the shared dir config, keep this one short
+        ('make_maya_filepath x50 slow_fs', slow,
+         lambda: [utils.make_maya_filepath(name) for name in names[:50]]),
+        ('get_net_info', fast,
+         lambda: utils.get_net_info(utils.MAYA_ENV)),
+        ('get_net_info slow_fs', slow,
+         lambda: utils.get_net_info(utils.MAYA_ENV)),
+        ('get_net_info cold slow_fs', slow, cold_net_info),
+        ('format_message x%d' % OBJECT_COUNT, fast,
+         lambda: client.format_message('open', obj_parents, uuids,
+                                       '0123456789abcdef')),
+        ('get_loader_zscript', fast,
+         lambda: handler.get_loader_zscript(names[0] + '.ma', parent)),
+        ('get_loader_zscript traced', fast,
+         lambda: handler.get_loader_zscript(names[0] + '.ma', parent,
+                                            names[0], '0123456789abcdef')),
+        ('get_loader_zscript slow_fs', slow,
+         lambda: handler.get_loader_zscript(names[0] + '.ma', parent)),
+        ('activate_zscript_ui', fast, zbrush_tools.activate_zscript_ui),
+        ('activate_zscript_ui slow_fs', slow,
+         zbrush_tools.activate_zscript_ui),
+    ]
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    fakes.install()
+    from gozbruh import utils
+
+    root = tempfile.mkdtemp(prefix='gozbruh_micro_')
+    env = fakes.sandbox(root)
+    # read everything from the config files, as ZBrush does
+    for var, value in ((utils.SHARED_DIR_ENV, env['shared_dir']),
+                       (utils.MAYA_ENV, os.environ[utils.MAYA_ENV]),
+                       (utils.ZBRUSH_ENV, os.environ[utils.ZBRUSH_ENV])):
+        utils.config_write(var, value)
+        del os.environ[var]
+    utils.send_osa = fakes.FakeZBrush(0.0, 0.0).send_osa
+
+    cases = []
+    try:
+        print '%-40s %10s %10s %10s' % ('case', 'p50 us', 'p95 us', 'p99 us')
+        for name, setup, func in get_cases(env['config_path'], args.latency):
+            if args.filter not in name:
+                continue
+            with setup():
+                with results.quiet():
+                    times = measure(func, args.warmup, args.repeat,
+                                    args.number)
+            case = {'name': name, 'time': results.summarize(times)}
+            cases.append(case)
+            print '%-40s %10.1f %10.1f %10.1f' % (
+                name, case['time']['p50'] * 1e6, case['time']['p95'] * 1e6,
+                case['time']['p99'] * 1e6)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    meta = results.get_meta(args)
+    meta['config_cache'] = utils.get_config_cache_stats()
+    output = args.output or 'micro-%s.json' % (meta['commit'] or 'local')
+    results.save_results(output, meta, cases)
+    print 'saved %s' % output
+
+    if args.compare:
+        baseline = results.load_results(args.compare)
+        print 'compared with %s (%s)' % (args.compare,
+                                         baseline['meta'].get('commit'))
+        lines = results.compare(baseline['results'], cases, ('name',),
+                                ['time'])
+        print '\n'.join(lines) or 'no cases in common'
+
+
+if __name__ == '__main__':
+    main()
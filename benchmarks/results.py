@@ -0,0 +1,139 @@
+"""
+Statistics and result files shared by the benchmarks
+
+Results are saved as JSON together with the commit they were measured on,
+so a run can be compared with a baseline from another commit:
+    python -m benchmarks.roundtrip --compare roundtrip-1a2b3c4.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from contextlib import contextmanager
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    """Returns the `pct` percentile of `values`, interpolating between the
+    closest ranks
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(values):
+    """Returns the count, mean, min, max, p50, p95 and p99 of `values`
+    """
+    if not values:
+        return {'count': 0}
+    return {'count': len(values),
+            'mean': sum(values) / len(values),
+            'min': min(values),
+            'max': max(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99)}
+
+
+def get_commit():
+    """Returns the short hash of the checked out commit, None outside git
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_DIR, stderr=open(os.devnull, 'w'))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.strip()
+
+
+def get_meta(args=None):
+    """Returns where and when a benchmark ran
+    """
+    return {'commit': get_commit(),
+            'time': time.time(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'args': vars(args) if args is not None else {}}
+
+
+def save_results(path, meta, results):
+    """Writes `meta` and `results` to `path` as JSON
+    """
+    results_write = open(path, 'w')
+    try:
+        json.dump({'meta': meta, 'results': results}, results_write,
+                  indent=2, sort_keys=True)
+    finally:
+        results_write.close()
+
+
+def load_results(path):
+    """Reads a file written by `save_results`
+    """
+    results_read = open(path, 'r')
+    try:
+        return json.load(results_read)
+    finally:
+        results_read.close()
+
+
+def compare(baseline, current, key, metrics, stats=('p50', 'p95')):
+    """Returns lines comparing two runs, matched by their `key` values
+
+    Parameters
+    ----------
+    baseline, current : list of dict
+        'results' of two result files
+    key : tuple of str
+        fields identifying a case, e.g. ('objects', 'verts')
+    metrics : list of str
+        fields holding a `summarize` dict, e.g. ['round_trip']
+    stats : tuple of str
+        statistics to compare
+
+    Returns
+    -------
+    list of str
+    """
+    base_cases = dict((tuple(case[k] for k in key), case)
+                      for case in baseline)
+    lines = []
+    for case in current:
+        case_key = tuple(case[k] for k in key)
+        base = base_cases.get(case_key)
+        if base is None:
+            continue
+        label = ' '.join('%s=%s' % pair for pair in zip(key, case_key))
+        for metric in metrics:
+            for stat in stats:
+                old = base[metric].get(stat)
+                new = case[metric].get(stat)
+                if not old or new is None:
+                    continue
+                lines.append('%-40s %-16s %s %10.4fms -> %10.4fms  %+6.1f%%' % (
+                    label, metric, stat, old * 1000, new * 1000,
+                    (new - old) / old * 100))
+    return lines
+
+
+@contextmanager
+def quiet():
+    """Silences gozbruh's prints while a benchmark runs, from every thread
+    """
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
@@ -0,0 +1,193 @@
+"""
+End-to-end round trip benchmark
+
+Runs the real `MayaToZBrushClient`, `ZBrushServer`/`ZBrushHandler`,
+`ZBrushToMayaClient` and maya command server on localhost, with the fakes
+from `benchmarks.fakes` standing in for Maya and ZBrush.
+
+Each iteration sends every object of a case to ZBrush and waits for
+'loaded' (maya_to_zbrush), then sends them back and waits for Maya to have
+imported them (zbrush_to_maya). The sum is the round trip.
+
+    python -m benchmarks.roundtrip --objects 1,10,100 --verts 1000,100000
+
+Results are printed and saved as JSON, see `benchmarks.results`.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import argparse
+from timeit import default_timer as clock
+
+from . import fakes
+from . import results
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.roundtrip',
+        description='Time Maya -> ZBrush -> Maya round trips against '
+                    'stand-in applications')
+    parser.add_argument('--objects', type=_int_list, default=[1, 10, 50],
+                        help='comma separated object counts per send')
+    parser.add_argument('--verts', type=_int_list, default=[1000, 50000],
+                        help='comma separated vertex counts per mesh')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='timed round trips per case')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='untimed round trips before each case')
+    parser.add_argument('--zbrush-cost', type=float, default=0.005,
+                        help='seconds ZBrush takes per imported object')
+    parser.add_argument('--zbrush-cost-per-mb', type=float, default=0.02,
+                        help='seconds ZBrush takes per imported MB')
+    parser.add_argument('--pymel-import-cost', type=float, default=0.5,
+                        help='seconds an import of pymel.core takes')
+    parser.add_argument('--trace', action='store_true',
+                        help='turn gozbruh.trace on while measuring')
+    parser.add_argument('--output', default=None,
+                        help='result file, roundtrip-<commit>.json by '
+                             'default')
+    parser.add_argument('--compare', default=None,
+                        help='result file of a baseline run to compare with')
+    return parser
+
+
+def run_case(scene, client, zbrush, objects, verts, iterations, warmup):
+    """Times round trips of `objects` meshes of `verts` vertices
+
+    Returns
+    -------
+    dict
+        the case, its throughput and a `results.summarize` of each leg
+    """
+    from gozbruh import utils
+    from gozbruh.zbrush_tools import ZBrushToMayaClient
+
+    names = ['bench_%dv_%d' % (verts, index) for index in xrange(objects)]
+    for name in names:
+        scene.create_mesh(name, verts)
+
+    to_zbrush = []
+    to_maya = []
+    round_trip = []
+    for iteration in xrange(warmup + iterations):
+        started = clock()
+        client.send(names)
+        sent = clock()
+        zbrush.export_tools(names)
+        replies = ZBrushToMayaClient.send_many([(name, name)
+                                                for name in names])
+        finished = clock()
+
+        if not replies or not all(reply['ok'] for reply in replies):
+            raise RuntimeError('maya command server failed: %r' % replies)
+        if iteration < warmup:
+            continue
+        to_zbrush.append(sent - started)
+        to_maya.append(finished - sent)
+        round_trip.append(finished - started)
+
+    file_bytes = sum(os.path.getsize(utils.make_maya_filepath(name))
+                     for name in names)
+    total = sum(round_trip)
+    return {'objects': objects,
+            'verts': verts,
+            'iterations': iterations,
+            'file_bytes': file_bytes,
+            'objects_per_s': objects * iterations / total,
+            'mb_per_s': 2 * file_bytes * iterations / total / 1048576.0,
+            'maya_to_zbrush': results.summarize(to_zbrush),
+            'zbrush_to_maya': results.summarize(to_maya),
+            'round_trip': results.summarize(round_trip)}
+
+
+def format_case(case):
+    """Returns a report line for a case from `run_case`
+    """
+    trip = case['round_trip']
+    return ('%7d %8d %9.2f %9.2f %9.2f %9.2f %10.1f %8.2f' % (
+        case['objects'], case['verts'], case['file_bytes'] / 1048576.0,
+        trip['p50'] * 1000, trip['p95'] * 1000, trip['p99'] * 1000,
+        case['objects_per_s'], case['mb_per_s']))
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    scene = fakes.install(pymel_import_cost=args.pymel_import_cost)
+
+    # pymel must not be loaded just to send or receive (see utils.LazyModule)
+    started = clock()
+    import gozbruh.maya_tools as maya_tools
+    import_time = clock() - started
+    pymel_imported = 'pymel.core' in sys.modules
+
+    from gozbruh import utils
+    from gozbruh import zbrush_tools
+
+    root = tempfile.mkdtemp(prefix='gozbruh_bench_')
+    env = fakes.sandbox(root)
+    os.environ['GOZBRUH_TRACE'] = '1' if args.trace else '0'
+
+    zbrush = fakes.FakeZBrush(args.zbrush_cost, args.zbrush_cost_per_mb)
+    utils.send_osa = zbrush.send_osa
+
+    cases = []
+    client = None
+    server = zbrush_tools.ZBrushServer('localhost', env['zbrush_port'])
+    try:
+        with results.quiet():
+            server.start()
+            maya_tools.start_command_server('localhost',
+                                            env['maya_command_port'])
+            client = maya_tools.MayaToZBrushClient()
+            client.connect()
+
+        print 'maya_tools import: %.1fms, pymel imported: %s' % (
+            import_time * 1000, pymel_imported)
+        print '%7s %8s %9s %9s %9s %9s %10s %8s' % (
+            'objects', 'verts', 'MB', 'p50 ms', 'p95 ms', 'p99 ms',
+            'objects/s', 'MB/s')
+        for objects in args.objects:
+            for verts in args.verts:
+                with results.quiet():
+                    case = run_case(scene, client, zbrush, objects, verts,
+                                    args.iterations, args.warmup)
+                cases.append(case)
+                print format_case(case)
+    finally:
+        with results.quiet():
+            if client is not None and client.sock is not None:
+                # lets the server's handler thread finish
+                client.sock.close()
+            server.stop()
+            maya_tools.stop_command_server()
+        shutil.rmtree(root, ignore_errors=True)
+
+    meta = results.get_meta(args)
+    meta['import'] = {'maya_tools': import_time,
+                      'pymel_imported': pymel_imported}
+    meta['zbrush_imports'] = zbrush.imports
+    output = args.output or 'roundtrip-%s.json' % (meta['commit'] or 'local')
+    results.save_results(output, meta, cases)
+    print 'saved %s' % output
+
+    if args.compare:
+        baseline = results.load_results(args.compare)
+        print 'compared with %s (%s)' % (args.compare,
+                                         baseline['meta'].get('commit'))
+        lines = results.compare(baseline['results'], cases,
+                                ('objects', 'verts'),
+                                ['maya_to_zbrush', 'zbrush_to_maya',
+                                 'round_trip'])
+        print '\n'.join(lines) or 'no cases in common'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+"""
+Load generator and soak test for ZBrushServer
+
+Starts a real `ZBrushServer` on localhost with `fakes.FakeZBrush` as the
+import executor, and runs concurrent clients speaking the same check/open
+protocol as `MayaToZBrushClient`.
+
+Clients are added in steps (`--clients 1,2,4,8`), each step runs for
+`--duration` seconds. Every `--interval` seconds a sample of throughput,
+latency, errors, threads, open file descriptors and memory is printed. The
+saturation point is the last step whose throughput still grew by more than
+`--gain` with its p95 latency under `--slo` and no more than 1% errors.
+
+Soak a single load for hours:
+    python -m benchmarks.soak --clients 8 --duration 14400 --rate 0.5
+
+Find the saturation point:
+    python -m benchmarks.soak --clients 1,2,4,8,16,32 --duration 60
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import random
+import shutil
+import socket
+import tempfile
+import argparse
+import threading
+from timeit import default_timer as clock
+
+from . import fakes
+from . import results
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.soak',
+        description='Load and soak test a ZBrushServer with stand-in '
+                    'ZBrush imports')
+    parser.add_argument('--clients', type=_int_list, default=[1, 2, 4, 8],
+                        help='comma separated concurrent clients per step')
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='seconds per step')
+    parser.add_argument('--interval', type=float, default=5.0,
+                        help='seconds between samples')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='sends per second per client, 0 for as fast '
+                             'as possible')
+    parser.add_argument('--min-objects', type=int, default=1,
+                        help='fewest objects per send')
+    parser.add_argument('--max-objects', type=int, default=20,
+                        help='most objects per send')
+    parser.add_argument('--max-name-length', type=int, default=64,
+                        help='longest object name, sets the message size')
+    parser.add_argument('--mesh-bytes', type=int, default=1048576,
+                        help='size of the mesh files ZBrush imports')
+    parser.add_argument('--pool', type=int, default=200,
+                        help='number of distinct objects to pick from')
+    parser.add_argument('--check-ratio', type=float, default=1.0,
+                        help='fraction of sends preceded by a check')
+    parser.add_argument('--reconnect-ratio', type=float, default=0.1,
+                        help='fraction of sends after which the client '
+                             'reconnects')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='seconds before a reply counts as hung')
+    parser.add_argument('--zbrush-cost', type=float, default=0.005,
+                        help='seconds ZBrush takes per imported object')
+    parser.add_argument('--zbrush-cost-per-mb', type=float, default=0.02,
+                        help='seconds ZBrush takes per imported MB')
+    parser.add_argument('--slo', type=float, default=5.0,
+                        help='p95 seconds above which a step is saturated')
+    parser.add_argument('--gain', type=float, default=0.05,
+                        help='throughput growth below which a step is '
+                             'saturated')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed, for repeatable runs')
+    parser.add_argument('--output', default=None,
+                        help='result file, soak-<commit>.json by default')
+    return parser
+
+
+#------------------------------------------------------------------------------
+# Process Resources
+#------------------------------------------------------------------------------
+
+def get_fd_count():
+    """Returns the number of open file descriptors, None if unknown
+    """
+    for fd_dir in ('/proc/self/fd', '/dev/fd'):
+        if os.path.isdir(fd_dir):
+            return len(os.listdir(fd_dir))
+    return None
+
+
+def get_rss():
+    """Returns the resident memory in bytes, the peak where the current
+    size is not available
+    """
+    try:
+        statm = open('/proc/self/statm', 'r')
+        try:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        finally:
+            statm.close()
+    except (IOError, OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on osx
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_resources():
+    return {'threads': threading.active_count(),
+            'fds': get_fd_count(),
+            'rss': get_rss()}
+
+
+#------------------------------------------------------------------------------
+# Load
+#------------------------------------------------------------------------------
+
+class LoadStats(object):
+    """Counters shared by the clients, read and reset per sample
+
+    Attributes
+    ----------
+    latencies : list of float
+        seconds from sending 'open' to receiving 'loaded', this window
+    errors : dict
+        error kind -> count, this window
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.sends = 0
+        self.objects = 0
+        self.bytes = 0
+        self.errors = {}
+
+    def record(self, latency, objects, size):
+        with self.lock:
+            self.latencies.append(latency)
+            self.sends += 1
+            self.objects += objects
+            self.bytes += size
+
+    def error(self, kind):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def take(self):
+        """Returns the counters of this window and starts a new one
+        """
+        with self.lock:
+            window = {'latencies': self.latencies,
+                      'sends': self.sends,
+                      'objects': self.objects,
+                      'bytes': self.bytes,
+                      'errors': self.errors}
+            self.reset()
+        return window
+
+
+class LoadClient(threading.Thread):
+    """Sends randomized batches to the server until `stop` is set
+    """
+
+    def __init__(self, address, args, names, stats, stop, seed, session):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.session = session
+        self.address = address
+        self.args = args
+        self.names = names
+        self.stats = stats
+        self.stop = stop
+        self.rand = random.Random(seed)
+        self.sock = None
+
+    def make_message(self):
+        """Returns an 'open' message and its object count, formatted as
+        `MayaToZBrushClient.format_message` does
+        """
+        count = self.rand.randint(self.args.min_objects,
+                                  self.args.max_objects)
+        objs = self.rand.sample(self.names, min(count, len(self.names)))
+        obj_data = {}
+        for obj in objs:
+            obj_data.setdefault(self.rand.choice(objs), []).append(obj)
+        uuids = dict((obj, '%032X' % self.rand.getrandbits(128))
+                     for obj in objs)
+        return json.dumps({'command': 'open',
+                           'session': self.session,
+                           'objData': obj_data,
+                           'uuids': uuids}), len(objs)
+
+    def send_batch(self):
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address,
+                                                 self.args.timeout)
+
+        if self.rand.random() < self.args.check_ratio:
+            self.sock.sendall('check')
+            reply = self.sock.recv(1024)
+            if reply != 'ok':
+                raise ValueError('check: %r' % reply[:32])
+
+        msg, objects = self.make_message()
+        started = clock()
+        self.sock.sendall(msg)
+        reply = self.sock.recv(1024)
+        if reply != 'loaded':
+            raise ValueError('open: %r' % reply[:32])
+        self.stats.record(clock() - started, objects, len(msg))
+
+        if self.rand.random() < self.args.reconnect_ratio:
+            self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def run(self):
+        while not self.stop.is_set():
+            started = clock()
+            try:
+                self.send_batch()
+            except socket.timeout:
+                self.stats.error('timeout')
+                self.close()
+            except socket.error as err:
+                self.stats.error(errno.errorcode.get(err.errno, 'socket'))
+                self.close()
+            except ValueError:
+                self.stats.error('bad reply')
+                self.close()
+            if self.args.rate:
+                self.stop.wait(max(0.0, 1.0 / self.args.rate -
+                                   (clock() - started)))
+        self.close()
+
+
+def make_pool(shared_dir, count, max_name_length, mesh_bytes, rand):
+    """Writes `count` mesh files of `mesh_bytes` to the shared dir and
+    returns their object names
+    """
+    names = []
+    block = 'v 0.000000 0.000000 0.000000\n' * 1024
+    for index in xrange(count):
+        name = 'soak_%04d' % index
+        name += 'x' * rand.randint(0, max(0, max_name_length - len(name)))
+        mesh_write = open(os.path.join(shared_dir, name + '.ma'), 'w')
+        try:
+            written = 0
+            while written < mesh_bytes:
+                chunk = block[:mesh_bytes - written]
+                mesh_write.write(chunk)
+                written += len(chunk)
+        finally:
+            mesh_write.close()
+        names.append(name)
+    return names
+
+
+def stage_pool(shared_dir, names, session):
+    """Links the pool's mesh files into the staging directory of `session`
+    """
+    from gozbruh import utils
+
+    session_dir = utils.get_session_dir(session)
+    for name in names:
+        path = os.path.join(session_dir, name + '.ma')
+        if not os.path.exists(path):
+            os.link(os.path.join(shared_dir, name + '.ma'), path)
+
+
+def summarize_window(window, seconds, resources):
+    sample = {'sends_per_s': window['sends'] / seconds,
+              'objects_per_s': window['objects'] / seconds,
+              'bytes_per_s': window['bytes'] / seconds,
+              'sends': window['sends'],
+              'errors': window['errors'],
+              'latency': results.summarize(window['latencies'])}
+    sample.update(resources)
+    return sample
+
+
+def run_step(address, args, names, clients, rand, on_sample):
+    """Runs `clients` concurrent clients for `args.duration` seconds
+
+    Returns
+    -------
+    dict
+        the step's totals, `on_sample` is called with each sample
+    """
+    from gozbruh import utils
+
+    stats = LoadStats()
+    stop = threading.Event()
+    threads = []
+    for index in xrange(clients):
+        # each client sends as its own session, like one artist
+        session = 'soak_%d' % index
+        stage_pool(utils.get_shared_dir(), names, session)
+        threads.append(LoadClient(address, args, names, stats, stop,
+                                  rand.getrandbits(32), session))
+    for thread in threads:
+        thread.start()
+
+    latencies = []
+    sends = objects = 0
+    errors = {}
+    started = last = clock()
+    try:
+        while clock() - started < args.duration:
+            time.sleep(min(args.interval,
+                           max(0.0, args.duration - (clock() - started))))
+            now = clock()
+            window = stats.take()
+            latencies.extend(window['latencies'])
+            sends += window['sends']
+            objects += window['objects']
+            for kind, count in window['errors'].iteritems():
+                errors[kind] = errors.get(kind, 0) + count
+            sample = summarize_window(window, now - last, get_resources())
+            sample['clients'] = clients
+            sample['elapsed'] = now - started
+            on_sample(sample)
+            last = now
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(args.timeout)
+
+    elapsed = clock() - started
+    return {'clients': clients,
+            'duration': elapsed,
+            'sends': sends,
+            'sends_per_s': sends / elapsed,
+            'objects_per_s': objects / elapsed,
+            'errors': errors,
+            'error_rate': sum(errors.values()) / float(max(sends, 1)),
+            'latency': results.summarize(latencies)}
+
+
+def find_saturation(steps, slo, gain):
+    """Returns the clients of the last step that was not saturated, None if
+    the first one already was
+    """
+    best = None
+    saturated_at = None
+    for step in steps:
+        healthy = (step['error_rate'] <= 0.01 and
+                   step['latency'].get('p95', 0) <= slo)
+        grew = best is None or \
+            step['sends_per_s'] > best['sends_per_s'] * (1 + gain)
+        if not healthy or not grew:
+            break
+        best = step
+        saturated_at = step['clients']
+    return saturated_at
+
+
+def format_sample(sample):
+    latency = sample['latency']
+    return '%7.0fs %4d %8.1f %9.1f %9.1f %7d %5d %5s %8.1f  %s' % (
+        sample['elapsed'], sample['clients'], sample['sends_per_s'],
+        (latency.get('p50') or 0) * 1000, (latency.get('p95') or 0) * 1000,
+        sum(sample['errors'].values()), sample['threads'], sample['fds'],
+        sample['rss'] / 1048576.0,
+        ' '.join('%s=%d' % item for item in sorted(sample['errors'].items())))
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    rand = random.Random(args.seed)
+
+    from gozbruh import utils
+    from gozbruh import zbrush_tools
+
+    root = tempfile.mkdtemp(prefix='gozbruh_soak_')
+    env = fakes.sandbox(root)
+    zbrush = fakes.FakeZBrush(args.zbrush_cost, args.zbrush_cost_per_mb)
+    utils.send_osa = zbrush.send_osa
+    names = make_pool(env['shared_dir'], args.pool, args.max_name_length,
+                      args.mesh_bytes, rand)
+
+    server = zbrush_tools.ZBrushServer('localhost', env['zbrush_port'])
+    address = ('localhost', env['zbrush_port'])
+    samples = []
+    steps = []
+    # gozbruh's prints are silenced while the load runs
+    stdout = sys.stdout
+
+    def on_sample(sample):
+        samples.append(sample)
+        stdout.write(format_sample(sample) + '\n')
+        stdout.flush()
+
+    try:
+        with results.quiet():
+            server.start()
+        baseline = get_resources()
+        print 'server on %s:%s, %d threads, %s fds, %.1fMB' % (
+            address[0], address[1], baseline['threads'], baseline['fds'],
+            baseline['rss'] / 1048576.0)
+        print '%8s %4s %8s %9s %9s %7s %5s %5s %8s' % (
+            'elapsed', 'cli', 'sends/s', 'p50 ms', 'p95 ms', 'errors',
+            'thrd', 'fds', 'rss MB')
+        for clients in args.clients:
+            with results.quiet():
+                step = run_step(address, args, names, clients, rand,
+                                on_sample)
+            steps.append(step)
+        # idle handler threads and sockets should be gone by now
+        time.sleep(1)
+        final = get_resources()
+    finally:
+        with results.quiet():
+            server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+    print
+    print '%4s %9s %9s %9s %9s %8s' % ('cli', 'sends/s', 'objs/s',
+                                       'p50 ms', 'p95 ms', 'errors')
+    for step in steps:
+        print '%4d %9.1f %9.1f %9.1f %9.1f %7.2f%%' % (
+            step['clients'], step['sends_per_s'], step['objects_per_s'],
+            (step['latency'].get('p50') or 0) * 1000,
+            (step['latency'].get('p95') or 0) * 1000,
+            step['error_rate'] * 100)
+
+    saturation = find_saturation(steps, args.slo, args.gain)
+    if steps and saturation == steps[-1]['clients']:
+        print 'not saturated up to %s clients' % saturation
+    else:
+        print 'saturation point: %s clients' % saturation
+    print 'after the load: %+d threads, %+d fds, %+.1fMB' % (
+        final['threads'] - baseline['threads'],
+        (final['fds'] or 0) - (baseline['fds'] or 0),
+        (final['rss'] - baseline['rss']) / 1048576.0)
+
+    meta = results.get_meta(args)
+    meta['zbrush_imports'] = zbrush.imports
+    output = args.output or 'soak-%s.json' % (meta['commit'] or 'local')
+    results.save_results(output, meta, {'steps': steps,
+                                        'samples': samples,
+                                        'saturation': saturation,
+                                        'resources': {'before': baseline,
+                                                      'after': final}})
+    print 'saved %s' % output
+
+
+if __name__ == '__main__':
+    main()
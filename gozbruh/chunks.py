@@ -0,0 +1,369 @@
+"""
+Chunked transfer of large meshes through the relay
+
+Files larger than LARGE_FILE_SIZE are not sent through the relay in one
+piece. The sender cuts them into chunk files of CHUNK_FILE_SIZE, and sends
+each one as soon as it is cut:
+    {"command": "chunk", "name": "pSphere1.ma",
+     "chunk": {"index": 0, "size": 33554432, "sha1": "..."}}
+
+The receiver checks each chunk and keeps it in
+<file dir>/.chunks/<name>/. The message the file belongs to carries the
+manifest of every chunked file, and the receiver joins the chunks back into
+the file before the message is handled:
+    {"command": "open", ..., "chunked": {"pSphere1.ma": {"name": ...,
+     "size": ..., "sha1": ..., "chunks": [...]}}}
+
+An interrupted transfer resumes by chunk: before sending, the sender asks
+with 'chunk_status' which chunks the receivers already hold, and hashes
+each chunk before cutting it, the chunks they hold are neither written nor
+sent.
+
+Only CHUNK_SIZE (see gozbruh.protocol) is held in memory at a time, on
+both ends, whatever the size of the mesh.
+
+Constants
+---------
+LARGE_FILE_SIZE : int
+    Files above this size are sent in chunks
+CHUNK_FILE_SIZE : int
+    Size of the chunk files
+CHUNKS_DIR : str
+    Name of the directory received chunks are kept in, in the file dir
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+
+from . import errs
+from . import protocol
+
+LARGE_FILE_SIZE = 256 * 1024 * 1024
+CHUNK_FILE_SIZE = 32 * 1024 * 1024
+CHUNKS_DIR = '.chunks'
+
+_CHUNK_RE = re.compile(r'^(\d+)\.([0-9a-f]{40})\.chunk$')
+
+#------------------------------------------------------------------------------
+# Sending
+#------------------------------------------------------------------------------
+
+def is_large(path, large_size=None):
+    """Returns True if the file at `path` is sent in chunks
+    """
+    if large_size is None:
+        large_size = LARGE_FILE_SIZE
+    return os.path.getsize(path) > large_size
+
+def split(path, chunk_dir, chunk_size=None, file_sha1=None, held=None):
+    """Cuts the file at `path` into chunk files in `chunk_dir`
+
+    Yields each chunk as soon as its file is written, the caller removes
+    it once it is sent. `file_sha1` is updated with the whole file.
+
+    With `held`, the (index, sha1) of the chunks the receivers already
+    hold, each chunk is hashed before its file is written, and the held
+    chunks are yielded without a file. Chunks that are written are read
+    twice then.
+
+    Yields
+    ------
+    (dict, str)
+        the chunk's manifest entry (index, size, sha1) and its path, None
+        for held chunks
+    """
+    if chunk_size is None:
+        chunk_size = CHUNK_FILE_SIZE
+
+    file_read = open(path, 'rb')
+    try:
+        index = 0
+        while True:
+            hashed = None
+            if held:
+                start = file_read.tell()
+                hashed = _read_chunk(file_read, index, chunk_size,
+                                     file_sha1=file_sha1)
+                if hashed['size'] and (index, hashed['sha1']) in held:
+                    yield hashed, None
+                    if hashed['size'] < chunk_size:
+                        return
+                    index += 1
+                    continue
+                file_read.seek(start)
+
+            chunk_path = os.path.join(chunk_dir, '%s.%05d.chunk' % (
+                os.path.basename(path), index))
+            chunk_write = open(chunk_path, 'wb')
+            try:
+                chunk = _read_chunk(
+                    file_read, index, chunk_size, chunk_write,
+                    file_sha1 if hashed is None else None)
+            finally:
+                chunk_write.close()
+            if hashed is not None and chunk != hashed:
+                os.remove(chunk_path)
+                raise errs.ProtocolError('%s changed while it was sent' %
+                                         os.path.basename(path))
+
+            if not chunk['size'] and index:
+                os.remove(chunk_path)
+                return
+            yield chunk, chunk_path
+            if chunk['size'] < chunk_size:
+                return
+            index += 1
+    finally:
+        file_read.close()
+
+def send_chunked(client, to, path, chunk_size=None, progress=None,
+                 proxy=False):
+    """Sends the file at `path` in chunks, skipping those every receiver
+    already holds
+
+    Parameters
+    ----------
+    client : `relay.RelayClient`
+        connected client
+    to : str
+        role to send to
+    chunk_size : int
+        (optional) size of the chunk files
+    progress : callable
+        (optional) called with the file name, the bytes done and the size of
+        the file after each chunk, `print_progress` by default
+    proxy : bool
+        True if the file is the proxy of a progressive send, the receiver
+        keeps proxies apart
+
+    Returns
+    -------
+    dict
+        manifest of the file, sent along with the message it belongs to
+    """
+    if progress is None:
+        progress = print_progress
+
+    name = os.path.basename(path)
+    total = os.path.getsize(path)
+    held = None
+    status = {'command': 'chunk_status', 'name': name}
+    if proxy:
+        status['proxy'] = True
+    for ack in client.send(to, status):
+        chunks = set(tuple(chunk) for chunk in ack['result'] or [])
+        held = chunks if held is None else held & chunks
+
+    manifest = {'name': name,
+                'size': total,
+                'chunks': []}
+    sha1 = hashlib.sha1()
+    done = 0
+    chunk_dir = tempfile.mkdtemp(prefix='gozbruh_chunks_',
+                                 dir=os.path.dirname(path))
+    try:
+        for chunk, chunk_path in split(path, chunk_dir, chunk_size, sha1,
+                                       held):
+            if chunk_path is not None:
+                client.send(to, dict(status, command='chunk', chunk=chunk),
+                            [chunk_path])
+                os.remove(chunk_path)
+            manifest['chunks'].append(chunk)
+            done += chunk['size']
+            progress(name, done, total)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    manifest['sha1'] = sha1.hexdigest()
+    return manifest
+
+def send_files(client, to, message, files, large_size=None, progress=None):
+    """Sends `message` and `files` through the relay, the large files in
+    chunks first
+
+    Returns
+    -------
+    list of dict
+        acks of the receivers of `message`, see `relay.RelayClient.send`
+    """
+    small = []
+    for path in files:
+        if is_large(path, large_size):
+            message.setdefault('chunked', {})[os.path.basename(path)] = \
+                send_chunked(client, to, path, progress=progress,
+                             proxy=message.get('proxy'))
+        else:
+            small.append(path)
+    return client.send(to, message, small)
+
+def print_progress(name, done, total):
+    print 'sending %s: %d%% (%.1f/%.1fMB)' % (
+        name, 100 * done / max(total, 1), done / 1048576.0, total / 1048576.0)
+
+#------------------------------------------------------------------------------
+# Receiving
+#------------------------------------------------------------------------------
+
+def get_chunk_dir(file_dir, name):
+    """Returns the directory the chunks of file `name` are kept in
+    """
+    return os.path.join(file_dir, CHUNKS_DIR, os.path.basename(name))
+
+def get_held(file_dir, name):
+    """Returns [index, sha1] of the chunks of file `name` received so far
+    """
+    chunk_dir = get_chunk_dir(file_dir, name)
+    if not os.path.isdir(chunk_dir):
+        return []
+    held = []
+    for file_name in sorted(os.listdir(chunk_dir)):
+        match = _CHUNK_RE.match(file_name)
+        if match:
+            held.append([int(match.group(1)), match.group(2)])
+    return held
+
+def store(file_dir, name, chunk, path):
+    """Checks a received chunk file against its manifest entry and moves it
+    into the chunk directory of file `name`
+    """
+    sha1 = _hash_file(path, hashlib.sha1())
+    if os.path.getsize(path) != chunk['size'] or \
+            sha1.hexdigest() != chunk['sha1']:
+        os.remove(path)
+        raise errs.ProtocolError('Chunk %d of %s is corrupt' % (
+            chunk['index'], name))
+
+    chunk_dir = get_chunk_dir(file_dir, name)
+    if not os.path.isdir(chunk_dir):
+        try:
+            os.makedirs(chunk_dir)
+        except OSError:
+            if not os.path.isdir(chunk_dir):
+                raise
+    # chunks of an older version of the file are replaced
+    for index, old_sha1 in get_held(file_dir, name):
+        if index == chunk['index']:
+            os.remove(os.path.join(chunk_dir, _chunk_name(index, old_sha1)))
+    os.rename(path, os.path.join(chunk_dir,
+                                 _chunk_name(chunk['index'], chunk['sha1'])))
+
+def join(file_dir, manifest):
+    """Joins the chunks of a file back into <file_dir>/<name>, and removes
+    them
+
+    Returns
+    -------
+    str
+        path of the file
+    """
+    name = os.path.basename(manifest['name'])
+    chunk_dir = get_chunk_dir(file_dir, name)
+    path = os.path.join(file_dir, name)
+    temp_path = '%s.%d.part' % (path, os.getpid())
+    sha1 = hashlib.sha1()
+
+    file_write = open(temp_path, 'wb')
+    try:
+        for chunk in manifest['chunks']:
+            chunk_path = os.path.join(chunk_dir, _chunk_name(chunk['index'],
+                                                             chunk['sha1']))
+            if not os.path.exists(chunk_path):
+                raise errs.ProtocolError('Missing chunk %d of %s' % (
+                    chunk['index'], name))
+            file_read = open(chunk_path, 'rb')
+            try:
+                while True:
+                    data = file_read.read(protocol.CHUNK_SIZE)
+                    if not data:
+                        break
+                    sha1.update(data)
+                    file_write.write(data)
+            finally:
+                file_read.close()
+    except:
+        file_write.close()
+        os.remove(temp_path)
+        raise
+    file_write.close()
+
+    if sha1.hexdigest() != manifest['sha1']:
+        os.remove(temp_path)
+        raise errs.ProtocolError('%s does not match its manifest' % name)
+    if os.name == 'nt' and os.path.exists(path):
+        # os.rename does not replace files on windows
+        os.remove(path)
+    os.rename(temp_path, path)
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    return path
+
+def join_all(message, file_dir):
+    """Joins every file chunked for `message`
+
+    Returns
+    -------
+    list of str
+        paths of the joined files
+    """
+    return [join(file_dir, manifest)
+            for manifest in (message.get('chunked') or {}).itervalues()]
+
+def receive(message, paths, file_dir):
+    """Handles 'chunk_status' and 'chunk' deliveries
+
+    Returns
+    -------
+    (bool, object) or None
+        success and result for the ack, None if `message` is not about
+        chunks
+    """
+    command = message.get('command')
+    if command == 'chunk_status':
+        return True, get_held(file_dir, message['name'])
+    if command == 'chunk':
+        store(file_dir, message['name'], message['chunk'], paths[0])
+        return True, message['chunk']['index']
+    return None
+
+#------------------------------------------------------------------------------
+# Helpers
+#------------------------------------------------------------------------------
+
+def _chunk_name(index, sha1):
+    return '%05d.%s.chunk' % (index, sha1)
+
+def _read_chunk(file_read, index, chunk_size, chunk_write=None,
+                file_sha1=None):
+    """Reads the next chunk of `file_read`, copying it to `chunk_write` if
+    given, and returns its manifest entry
+    """
+    sha1 = hashlib.sha1()
+    size = 0
+    while size < chunk_size:
+        data = file_read.read(min(chunk_size - size, protocol.CHUNK_SIZE))
+        if not data:
+            break
+        sha1.update(data)
+        if file_sha1 is not None:
+            file_sha1.update(data)
+        if chunk_write is not None:
+            chunk_write.write(data)
+        size += len(data)
+    return {'index': index,
+            'size': size,
+            'sha1': sha1.hexdigest()}
+
+def _hash_file(path, sha1):
+    """Updates `sha1` with the contents of the file at `path`
+    """
+    file_read = open(path, 'rb')
+    try:
+        while True:
+            data = file_read.read(protocol.CHUNK_SIZE)
+            if not data:
+                break
+            sha1.update(data)
+    finally:
+        file_read.close()
+    return sha1
@@ -15,11 +15,109 @@ if __name__ == "__main__":
     command = sys.argv[1]
 
     if command == 'send':
+        # send TOOL PARENT [proxy]
         import gozbruh.zbrush_tools
-        gozbruh.zbrush_tools.ZBrushToMayaClient.send(sys.argv[2], sys.argv[3])
+        gozbruh.zbrush_tools.ZBrushToMayaClient.send(
+            sys.argv[2], sys.argv[3], proxy=sys.argv[4:5] == ['proxy'])
+    elif command == 'send_many':
+        # send_many LIST_FILE [proxy]
+        # sys.argv[2] is a file of whitespace separated "tool parent" pairs,
+        # written by the send-all/send-visible buttons
+        import gozbruh.zbrush_tools
+        list_file = open(sys.argv[2], 'r')
+        try:
+            words = list_file.read().split()
+        finally:
+            list_file.close()
+        gozbruh.zbrush_tools.ZBrushToMayaClient.send_many(
+            zip(words[0::2], words[1::2]), proxy=sys.argv[3:4] == ['proxy'])
+    elif command == 'trace_mark':
+        # called from the loader zscript: trace_mark TRACE_ID SPAN [OBJ]
+        import gozbruh.trace
+        attrs = {}
+        if len(sys.argv) > 4:
+            attrs['obj'] = sys.argv[4]
+        gozbruh.trace.mark(sys.argv[3], trace_id=sys.argv[2], **attrs)
+    elif command == 'trace_merge':
+        # trace_merge [--id TRACE_ID] TRACE_FILE [TRACE_FILE...]
+        import gozbruh.trace
+        args = sys.argv[2:]
+        trace_id = None
+        if args[:1] == ['--id']:
+            trace_id = args[1]
+            args = args[2:]
+        if not args:
+            args = gozbruh.trace.get_trace_files()
+        print gozbruh.trace.format_timeline(
+            gozbruh.trace.merge(args, trace_id))
+    elif command == 'profile':
+        # profile on|off, switches gozbruh.profiling for every process
+        import gozbruh.utils
+        state = sys.argv[2] if len(sys.argv) > 2 else 'on'
+        gozbruh.utils.config_write(gozbruh.utils.PROFILE_ENV,
+                                   '1' if state == 'on' else '0')
+        print 'profiling %s, profiles are written to %s' % (
+            state, os.path.join(gozbruh.utils.CONFIG_PATH, 'profiles'))
+    elif command == 'relay':
+        # relay [HOST][:PORT], routes messages and meshes between machines,
+        # see gozbruh.relay
+        import gozbruh.relay
+        host, _, port = (sys.argv[2] if len(sys.argv) > 2 else '').partition(':')
+        gozbruh.relay.start_relay(host, port or None)
+    elif command == 'gc':
+        # gc [--dry-run], removes stale files from the shared directory, see
+        # gozbruh.lifecycle
+        import gozbruh.lifecycle
+        stats = gozbruh.lifecycle.collect(dry_run='--dry-run' in sys.argv[2:])
+        print gozbruh.lifecycle.format_stats(stats)
+    elif command in ('history', 'restore', 'diff'):
+        # history OBJECT
+        # restore OBJECT VERSION [PATH], to OBJECT_vVERSION.ma by default
+        # diff OBJECT OLD NEW
+        # see gozbruh.history
+        import gozbruh.errs
+        import gozbruh.history
+        name = sys.argv[2]
+        try:
+            if command == 'history':
+                print gozbruh.history.format_versions(name)
+            elif command == 'restore':
+                version = int(sys.argv[3])
+                if len(sys.argv) > 4:
+                    path = sys.argv[4]
+                else:
+                    path = '%s_v%d.ma' % (name, version)
+                gozbruh.history.restore(name, version, path)
+                print 'restored %s version %d to %s' % (name, version, path)
+            else:
+                sys.stdout.writelines(gozbruh.history.diff(
+                    name, int(sys.argv[3]), int(sys.argv[4])))
+        except gozbruh.errs.HistoryError as err:
+            print err.msg
+            sys.exit(1)
+    elif command == 'history_record':
+        # history_record SOURCE NAME PATH [NAME PATH...], records copies made
+        # by gozbruh.history.record_in_background and removes them
+        import gozbruh.history
+        args = sys.argv[3:]
+        for name, path in zip(args[0::2], args[1::2]):
+            try:
+                gozbruh.history.record(name, path, sys.argv[2])
+            finally:
+                os.remove(path)
     elif command == 'serve':
+        # Take the lock and bind the port with only the light modules
+        # imported, the server modules load while maya can already connect
+        import gozbruh.utils
+        timer = gozbruh.utils.PhaseTimer('boot')
+        lock = gozbruh.utils.acquire_zbrush_server_lock()
+        timer.mark('lock')
+        host, port = gozbruh.utils.get_net_info(gozbruh.utils.ZBRUSH_ENV)
+        sock = gozbruh.utils.bind_zbrush_server_socket(host, port)
+        timer.mark('bind')
         import gozbruh.zbrush_tools
-        gozbruh.zbrush_tools.start_zbrush_server()
+        timer.mark('import')
+        gozbruh.zbrush_tools.start_zbrush_server(sock=sock, timer=timer)
     elif command == 'install':
         gozbruh.utils
         # FIXME: I don't think this is used anymore...
@@ -41,6 +139,10 @@ if __name__ == "__main__":
         #    cannot import its corresponding python module given the env
         #    provided when calling ShellExecute from ZBrush, and we
         #    therefore need to make our modules double as executables
+        #
+        # The server is started directly, without an intermediate shell, with
+        # the same interpreter ZBrush used to run this script.
         import subprocess
         this_module = os.path.abspath(sys.modules[__name__].__file__)
-        subprocess.Popen('python %s %s' % (this_module, 'serve'), shell=True)
+        subprocess.Popen([sys.executable, this_module, 'serve'],
+                         close_fds=True)
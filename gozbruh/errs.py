@@ -32,6 +32,10 @@ class ZBrushServerError(GozbruhError):
 
     """
 
+    def __init__(self, msg):
+        GozbruhError.__init__(self, msg)
+        self.msg = msg
+
 
 class PortError(GozbruhError):
     """Exception raised for invalid socket ports
@@ -61,3 +65,78 @@ class SelectionError(GozbruhError):
         gui msg
 
     """
+
+
+class ProtocolError(GozbruhError):
+    """Exception raised for malformed or truncated framed messages
+
+    Attributes
+    ----------
+    msg : str
+        gui msg
+
+    """
+
+    def __init__(self, msg):
+        GozbruhError.__init__(self, msg)
+        self.msg = msg
+
+
+class ReplyTimeoutError(ProtocolError):
+    """Exception raised when a request got no reply in time, the other
+    side may still be working on it
+
+    Attributes
+    ----------
+    msg : str
+        gui msg
+
+    """
+
+
+class RelayError(GozbruhError):
+    """Exception raised when the relay can not be reached or refuses a
+    message
+
+    Attributes
+    ----------
+    msg : str
+        gui msg
+
+    """
+
+    def __init__(self, msg):
+        GozbruhError.__init__(self, msg)
+        self.msg = msg
+
+
+class PublishError(GozbruhError):
+    """Exception raised when a staged file can not be published to the
+    shared directory
+
+    Attributes
+    ----------
+    msg : str
+        gui msg
+
+    """
+
+    def __init__(self, msg):
+        GozbruhError.__init__(self, msg)
+        self.msg = msg
+
+
+class HistoryError(GozbruhError):
+    """Exception raised when a version of an object is not in its history,
+    or its history stays locked
+
+    Attributes
+    ----------
+    msg : str
+        gui msg
+
+    """
+
+    def __init__(self, msg):
+        GozbruhError.__init__(self, msg)
+        self.msg = msg
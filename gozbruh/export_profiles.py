@@ -0,0 +1,165 @@
+"""
+Export profiles, the channels of a mesh that travel between maya and ZBrush
+
+A mayaAscii file carries every channel of a mesh, and a shading network
+with it. A profile names the channels that are kept, the others are cut
+out of the file as it is copied, one line at a time:
+    uvs        UV sets, and the UVs of each face
+    normals    locked normals
+    colors     color sets, and the colors of each face
+    materials  shading networks and the shading group assignments
+
+Positions and faces always travel. Besides the names in EXPORT_PROFILES a
+profile can list channels joined by '+', e.g. 'uvs+materials'.
+
+Constants
+---------
+CHANNELS : tuple of str
+    Channels a profile can keep
+EXPORT_PROFILES : dict
+    Profile name -> frozenset of the channels it keeps
+DEFAULT_PROFILE : str
+    Profile that keeps every channel, files are not filtered
+"""
+
+import re
+
+CHANNELS = ('uvs', 'normals', 'colors', 'materials')
+
+EXPORT_PROFILES = {
+    'positions': frozenset(),
+    'sculpt': frozenset(['uvs']),
+    'normals': frozenset(['uvs', 'normals']),
+    'colors': frozenset(['uvs', 'normals', 'colors']),
+    'full': frozenset(CHANNELS),
+}
+DEFAULT_PROFILE = 'full'
+
+# mesh attributes holding each channel
+_CHANNEL_ATTRS = {
+    'uvs': re.compile(r'^\.(uvst|cuvs|pd)(\[|\.|$)'),
+    'normals': re.compile(r'^\.n(\[|$)'),
+    'colors': re.compile(r'^\.(clst|ccls|dcol|vclr)(\[|\.|$)'),
+}
+# records of a polyFaces value holding each channel. A polyFaces value is
+# a list of records, 'f' (face) and 'h' (hole) followed by edges, 'mu',
+# 'mc' and 'fc' by the uv and color indices of the face, maya writes one
+# record per line, after two tabs
+_FACE_RECORDS = {
+    'uvs': ('mu',),
+    'colors': ('mc', 'fc'),
+}
+# node types of the shading network
+_MATERIAL_NODE_TYPES = frozenset([
+    'shadingEngine', 'materialInfo', 'lambert', 'blinn', 'phong', 'phongE',
+    'anisotropic', 'surfaceShader', 'useBackground', 'layeredShader',
+    'rampShader', 'file', 'place2dTexture', 'bump2d', 'bump3d'])
+
+_CREATE_NODE_RE = re.compile(r'^createNode (\S+) .*?-n "([^"]+)"')
+_SET_ATTR_RE = re.compile(r'^\tsetAttr\b[^"]*"([^"]+)"')
+_QUOTED_RE = re.compile(r'"([^"]*)"')
+
+
+def get_channels(profile):
+    """Returns the channels `profile` keeps
+
+    Returns
+    -------
+    frozenset of str or None
+        None if `profile` is neither a profile name nor channels joined
+        by '+'
+    """
+    if profile in EXPORT_PROFILES:
+        return EXPORT_PROFILES[profile]
+    channels = frozenset(name.strip() for name in profile.split('+'))
+    if not channels.issubset(CHANNELS):
+        return None
+    return channels
+
+def is_filtered(channels):
+    """Returns True if files are cut down for `channels`, False if they
+    are copied as they are
+    """
+    return not set(CHANNELS).issubset(channels)
+
+def filter_file(src_path, dest_path, channels):
+    """Copies the mayaAscii file at `src_path` to `dest_path`, without the
+    channels missing from `channels`
+
+    Only one line is held in memory at a time.
+    """
+    dropped = [channel for channel in CHANNELS if channel not in channels]
+    attr_res = [_CHANNEL_ATTRS[channel] for channel in dropped
+                if channel in _CHANNEL_ATTRS]
+    records = set()
+    for channel in dropped:
+        records.update(_FACE_RECORDS.get(channel, ()))
+    drop_materials = 'materials' in dropped
+
+    # nodes of the shading network that were left out, statements
+    # connecting them are left out too
+    dropped_nodes = set()
+    skip_node = False
+    skip_statement = False
+    in_faces = False
+
+    src = open(src_path, 'r')
+    dest = open(dest_path, 'w')
+    try:
+        for line in src:
+            if line.startswith('\t\t'):
+                # continues the statement above
+                if skip_node or skip_statement:
+                    continue
+                if in_faces and line[2:4] in records:
+                    if line.rstrip().endswith(';'):
+                        dest.write('\t\t;\n')
+                    continue
+                dest.write(line)
+                continue
+
+            in_faces = False
+            skip_statement = False
+            if line.startswith('\t'):
+                # statement on the node created above
+                if skip_node:
+                    continue
+                match = _SET_ATTR_RE.match(line)
+                if match:
+                    attr = match.group(1)
+                    if any(attr_re.match(attr) for attr_re in attr_res):
+                        skip_statement = True
+                        continue
+                    in_faces = '"polyFaces"' in line
+                dest.write(line)
+                continue
+
+            # top level statement
+            skip_node = False
+            if drop_materials:
+                match = _CREATE_NODE_RE.match(line)
+                if match and match.group(1) in _MATERIAL_NODE_TYPES:
+                    dropped_nodes.add(match.group(2))
+                    skip_node = True
+                    continue
+                if dropped_nodes and _names_node(line, dropped_nodes):
+                    skip_statement = True
+                    continue
+            dest.write(line)
+    finally:
+        src.close()
+        dest.close()
+
+#------------------------------------------------------------------------------
+# Helpers
+#------------------------------------------------------------------------------
+
+def _names_node(line, nodes):
+    """Returns True if a quoted name or plug in `line` belongs to one of
+    `nodes`
+    """
+    for name in _QUOTED_RE.findall(line):
+        node = name.split('.', 1)[0].lstrip(':').rsplit('|', 1)[-1]
+        if node in nodes:
+            return True
+    return False
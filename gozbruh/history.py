@@ -0,0 +1,532 @@
+"""
+Version history of the meshes exchanged between maya and ZBrush
+
+With history enabled (see `utils.get_history_versions`), every file sent
+is kept as a version of its object, in the shared directory:
+    <shared dir>/history/<object>/versions.json  the versions, oldest first
+    <shared dir>/history/<object>/<version>.ma   the latest version
+    <shared dir>/history/<object>/<version>.delta  each older version
+
+Older versions are stored as reverse deltas, the lines that differ from
+the version after them, so the latest version is restored by a copy, and
+older ones by applying the deltas between. Only the configured number of
+versions is kept, the oldest delta is dropped when a version is added.
+Sending an unchanged file adds no version.
+
+Maya records the files it sends, on a background `Recorder`, and ZBrush
+the files it sends once maya has them, in a process of its own (see
+`record_in_background`), the process sending them exits right away. From
+the command line:
+    python cmd.py history OBJECT
+    python cmd.py restore OBJECT VERSION [PATH]
+    python cmd.py diff OBJECT OLD NEW
+
+Constants
+---------
+HISTORY_DIR : str
+    Directory in the shared dir holding the history of each object
+LOCK_TIMEOUT : float
+    Seconds to wait for another process recording the same object. The
+    holder of a lock refreshes it while it works, a lock that was not
+    refreshed for this long, or whose holder died on this host, is taken
+    over
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import errno
+import shutil
+import socket
+import difflib
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from collections import deque
+from threading import Thread, Condition, Event
+
+from . import errs
+from . import registry
+from . import utils
+
+HISTORY_DIR = 'history'
+LOCK_TIMEOUT = 30.0
+
+_VERSIONS_FILE = 'versions.json'
+_LOCK_DIR = '.lock'
+# file in the lock directory naming its holder, refreshed while it is held
+_LOCK_OWNER = 'owner'
+
+
+def get_history_dir(name=None):
+    """Returns the directory the history of object `name` is kept in, or
+    the directory of every object's history without a name
+    """
+    history_dir = os.path.join(utils.get_shared_dir(), HISTORY_DIR)
+    if name is None:
+        return history_dir
+    return os.path.join(history_dir, utils.clean_session_id(name))
+
+def get_versions(name):
+    """Returns the versions of object `name`, oldest first
+
+    Returns
+    -------
+    list of dict
+        'version' number, 'time' sent, 'source' ('maya' or 'zbrush'),
+        'sha1' and 'bytes' of the file
+    """
+    return _read_versions(get_history_dir(name))
+
+def record(name, file_path, source):
+    """Adds the file at `file_path` as the latest version of object `name`
+
+    Errors are printed, a broken history never stops a send.
+
+    Returns
+    -------
+    dict or None
+        the version added, None if the file did not change or it could not
+        be added
+    """
+    keep = utils.get_history_versions()
+    if not keep:
+        return None
+    try:
+        return _add_version(get_history_dir(name), file_path, source, keep)
+    except (IOError, OSError, ValueError, errs.HistoryError) as err:
+        print 'could not record history of %s: %s' % (name, err)
+        return None
+
+def record_in_background(entries, source):
+    """Records several files in a separate process, for processes that
+    exit right after sending, like the one ZBrush runs for each send
+
+    A copy of each file is taken first, see `Recorder`.
+
+    Parameters
+    ----------
+    entries : list of (str, str)
+        object name and file path of each file
+    source : str
+        'maya' or 'zbrush'
+    """
+    if not utils.get_history_versions() or not entries:
+        return
+    args = [sys.executable, utils.get_goz_command_script(), 'history_record',
+            source]
+    for name, file_path in entries:
+        args.extend([name, _copy_to_temp(file_path)])
+    devnull = open(os.devnull, 'w')
+    try:
+        # nothing may hold on to our output, ZBrush waits until it closes
+        subprocess.Popen(args, stdout=devnull, stderr=devnull,
+                         close_fds=True)
+    finally:
+        devnull.close()
+
+def restore(name, version, dest_path):
+    """Writes version `version` of object `name` to `dest_path`
+
+    Raises
+    ------
+    errs.HistoryError
+        there is no such version
+    """
+    lines = get_lines(name, version)
+    dest = open(dest_path, 'wb')
+    try:
+        dest.writelines(lines)
+    finally:
+        dest.close()
+
+def get_lines(name, version):
+    """Returns the lines of version `version` of object `name`
+
+    Raises
+    ------
+    errs.HistoryError
+        there is no such version
+    """
+    obj_dir = get_history_dir(name)
+    with _locked(obj_dir):
+        versions = _read_versions(obj_dir)
+        numbers = [entry['version'] for entry in versions]
+        if version not in numbers:
+            raise errs.HistoryError('%s has no version %s, only %s' % (
+                name, version, _format_numbers(numbers)))
+        lines = _read_lines(os.path.join(obj_dir, '%d.ma' % numbers[-1]))
+        # newest to oldest, each delta rebuilds the version before
+        for number in reversed(numbers[numbers.index(version):-1]):
+            lines = _apply_delta(
+                lines, _read_delta(os.path.join(obj_dir, '%d.delta' % number)))
+    return lines
+
+def diff(name, old, new):
+    """Returns the unified diff of versions `old` and `new` of object
+    `name`, as a list of lines
+    """
+    return list(difflib.unified_diff(
+        get_lines(name, old), get_lines(name, new),
+        '%s@%d' % (name, old), '%s@%d' % (name, new)))
+
+def format_versions(name):
+    """Returns a summary of the versions of object `name`, one per line
+    """
+    lines = []
+    for entry in get_versions(name):
+        lines.append('%4d  %s  %-6s  %9d bytes  %s' % (
+            entry['version'],
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['time'])),
+            entry['source'], entry['bytes'], entry['sha1'][:12]))
+    return '\n'.join(lines) or 'no versions of %s' % name
+
+
+class Recorder(object):
+    """Records versions on a background thread, so sends do not wait for
+    the deltas to be computed
+
+    A copy of each file is taken when it is queued, the original may be
+    overwritten by the next export before it is recorded.
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.thread = None
+        self.cond = Condition()
+
+    def put(self, name, file_path, source):
+        """Queues the file at `file_path` to be recorded as a version of
+        object `name`
+        """
+        if not utils.get_history_versions():
+            return
+        copy_path = _copy_to_temp(file_path)
+        with self.cond:
+            self.pending.append((name, copy_path, source))
+            if self.thread is None:
+                self.thread = Thread(target=self.run,
+                                     name='gozbruh-history')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        """Records queued files until there are none left
+        """
+        while True:
+            with self.cond:
+                if not self.pending:
+                    self.thread = None
+                    self.cond.notify_all()
+                    return
+                name, copy_path, source = self.pending.popleft()
+            try:
+                record(name, copy_path, source)
+            finally:
+                os.remove(copy_path)
+
+    def drain(self):
+        """Waits until every queued file is recorded
+        """
+        with self.cond:
+            while self.thread is not None:
+                self.cond.wait()
+
+#------------------------------------------------------------------------------
+# Helpers
+#------------------------------------------------------------------------------
+
+def _add_version(obj_dir, file_path, source, keep):
+    sha1 = registry.hash_file(file_path)
+    if not os.path.isdir(obj_dir):
+        try:
+            os.makedirs(obj_dir)
+        except OSError:
+            if not os.path.isdir(obj_dir):
+                raise
+    with _locked(obj_dir):
+        versions = _read_versions(obj_dir)
+        if versions and versions[-1]['sha1'] == sha1:
+            return None
+        entry = {'version': versions[-1]['version'] + 1 if versions else 1,
+                 'time': time.time(),
+                 'source': source,
+                 'sha1': sha1,
+                 'bytes': os.path.getsize(file_path)}
+        head_path = os.path.join(obj_dir, '%d.ma' % entry['version'])
+        _copy_into_place(file_path, head_path)
+        versions.append(entry)
+        if len(versions) > 1 and keep > 1:
+            # the previous version becomes a delta against the new one
+            previous_path = os.path.join(obj_dir,
+                                         '%d.ma' % versions[-2]['version'])
+            _write_delta(os.path.join(obj_dir,
+                                      '%d.delta' % versions[-2]['version']),
+                         _make_delta(_read_lines(head_path),
+                                     _read_lines(previous_path)))
+        dropped = versions[:-keep]
+        versions = versions[-keep:]
+        _write_versions(obj_dir, versions)
+
+        # only remove files once the versions no longer list them
+        for old in versions[:-1] + dropped:
+            _remove(os.path.join(obj_dir, '%d.ma' % old['version']))
+        for old in dropped:
+            _remove(os.path.join(obj_dir, '%d.delta' % old['version']))
+    return entry
+
+def _make_delta(base_lines, lines):
+    """Returns the delta rebuilding `lines` from `base_lines`: a list of
+    (start, end) ranges of `base_lines` to copy and lists of lines to
+    insert
+    """
+    delta = []
+    if len(base_lines) == len(lines):
+        # the same topology, sculpting only moves vertices: compare line
+        # by line instead of searching for matching blocks
+        start = 0
+        while start < len(lines):
+            end = start
+            if base_lines[start] == lines[start]:
+                while end < len(lines) and base_lines[end] == lines[end]:
+                    end += 1
+                delta.append((start, end))
+            else:
+                while end < len(lines) and base_lines[end] != lines[end]:
+                    end += 1
+                delta.append(lines[start:end])
+            start = end
+        return delta
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            delta.append((i1, i2))
+        elif j2 > j1:
+            delta.append(lines[j1:j2])
+    return delta
+
+def _apply_delta(base_lines, delta):
+    lines = []
+    for op in delta:
+        if isinstance(op, tuple):
+            lines.extend(base_lines[op[0]:op[1]])
+        else:
+            lines.extend(op)
+    return lines
+
+def _read_lines(file_path):
+    read = open(file_path, 'rb')
+    try:
+        return read.readlines()
+    finally:
+        read.close()
+
+def _read_delta(file_path):
+    """Reads a delta written by `_write_delta`
+    """
+    read = open(file_path, 'rb')
+    try:
+        data = zlib.decompress(read.read())
+    finally:
+        read.close()
+    delta = []
+    index = 0
+    while index < len(data):
+        end = data.index('\n', index)
+        op, first, second = data[index:end].split()
+        index = end + 1
+        if op == 'c':
+            delta.append((int(first), int(second)))
+        else:
+            # the inserted lines follow
+            end = index + int(first)
+            delta.append(data[index:end].splitlines(True))
+            index = end
+    return delta
+
+def _write_delta(file_path, delta):
+    """Writes a delta as 'c START END' lines for the ranges that are copied
+    and 'i BYTES 0' lines followed by the lines that are inserted,
+    compressed
+    """
+    parts = []
+    for op in delta:
+        if isinstance(op, tuple):
+            parts.append('c %d %d\n' % op)
+        else:
+            inserted = ''.join(op)
+            parts.append('i %d 0\n' % len(inserted))
+            parts.append(inserted)
+    temp_path = file_path + '.part'
+    write = open(temp_path, 'wb')
+    try:
+        write.write(zlib.compress(''.join(parts)))
+    finally:
+        write.close()
+    _rename(temp_path, file_path)
+
+def _read_versions(obj_dir):
+    try:
+        read = open(os.path.join(obj_dir, _VERSIONS_FILE), 'r')
+    except IOError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return []
+    try:
+        return json.load(read)
+    finally:
+        read.close()
+
+def _write_versions(obj_dir, versions):
+    file_path = os.path.join(obj_dir, _VERSIONS_FILE)
+    temp_path = file_path + '.part'
+    write = open(temp_path, 'w')
+    try:
+        json.dump(versions, write, indent=1)
+    finally:
+        write.close()
+    _rename(temp_path, file_path)
+
+def _copy_into_place(src_path, dest_path):
+    temp_path = dest_path + '.part'
+    shutil.copyfile(src_path, temp_path)
+    _rename(temp_path, dest_path)
+
+def _rename(src_path, dest_path):
+    if os.name == 'nt' and os.path.exists(dest_path):
+        # os.rename does not replace files on windows
+        os.remove(dest_path)
+    os.rename(src_path, dest_path)
+
+def _copy_to_temp(file_path):
+    """Returns a copy of `file_path` in the temp directory, to be recorded
+    once the original may already be overwritten
+    """
+    handle, copy_path = tempfile.mkstemp(suffix='.ma',
+                                         prefix='gozbruh_history_')
+    os.close(handle)
+    shutil.copyfile(file_path, copy_path)
+    return copy_path
+
+def _remove(file_path):
+    try:
+        os.remove(file_path)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+def _format_numbers(numbers):
+    if not numbers:
+        return 'none'
+    return '%d-%d' % (numbers[0], numbers[-1])
+
+@contextmanager
+def _locked(obj_dir):
+    """Holds the lock of an object's history, shared by every process
+
+    The lock is a directory, creating one is atomic on network shares too.
+    Its owner file names the holder, and is touched every quarter of
+    LOCK_TIMEOUT while the lock is held.
+
+    Raises
+    ------
+    errs.HistoryError
+        a live process held the lock for longer than LOCK_TIMEOUT
+    """
+    if not os.path.isdir(obj_dir):
+        # no history yet, nothing to guard
+        yield
+        return
+    lock_path = os.path.join(obj_dir, _LOCK_DIR)
+    deadline = time.time() + LOCK_TIMEOUT
+    while True:
+        try:
+            os.mkdir(lock_path)
+            break
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        if _is_stale(lock_path):
+            # left behind by a process that died
+            print 'taking over the history lock of %s' % obj_dir
+            shutil.rmtree(lock_path, ignore_errors=True)
+            continue
+        if time.time() > deadline:
+            raise errs.HistoryError('history of %s is locked by %s:%s' % (
+                (os.path.basename(obj_dir),) + _read_owner(lock_path)))
+        time.sleep(0.05)
+
+    owner_path = os.path.join(lock_path, _LOCK_OWNER)
+    _write_owner(owner_path)
+    released = Event()
+    refresh = Thread(target=_refresh_lock, args=(owner_path, released),
+                     name='gozbruh-history-lock')
+    refresh.daemon = True
+    refresh.start()
+    try:
+        yield
+    finally:
+        released.set()
+        refresh.join()
+        shutil.rmtree(lock_path, ignore_errors=True)
+
+def _write_owner(owner_path):
+    write = open(owner_path, 'w')
+    try:
+        write.write('%s %d' % (socket.gethostname(), os.getpid()))
+    finally:
+        write.close()
+
+def _read_owner(lock_path):
+    """Returns the host and process ID holding a lock, (None, None) if
+    it is not known yet
+    """
+    try:
+        read = open(os.path.join(lock_path, _LOCK_OWNER), 'r')
+    except IOError:
+        return None, None
+    try:
+        host, _, pid = read.read().partition(' ')
+    finally:
+        read.close()
+    try:
+        return host, int(pid)
+    except ValueError:
+        return None, None
+
+def _refresh_lock(owner_path, released):
+    while not released.wait(LOCK_TIMEOUT / 4.0):
+        try:
+            os.utime(owner_path, None)
+        except OSError:
+            # taken over after all, nothing left to refresh
+            return
+
+def _is_stale(lock_path):
+    """Returns True if the holder of a lock died, or did not refresh it
+    for LOCK_TIMEOUT
+    """
+    host, pid = _read_owner(lock_path)
+    if host == socket.gethostname() and not _is_running(pid):
+        return True
+    owner_path = os.path.join(lock_path, _LOCK_OWNER)
+    if not os.path.exists(owner_path):
+        # the holder is about to write it
+        owner_path = lock_path
+    try:
+        return time.time() - os.path.getmtime(owner_path) > LOCK_TIMEOUT
+    except OSError:
+        # released in the meantime
+        return False
+
+def _is_running(pid):
+    if os.name == 'nt':
+        # no cheap check, only the refresh tells
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
@@ -0,0 +1,249 @@
+"""
+Lifecycle of the files gozbruh leaves behind
+
+Every send leaves mayaAscii files in the shared directory, in the session
+and proxy directories below it and in the local staging directory (see
+gozbruh.staging), and interrupted transfers leave .part files and chunks.
+`collect` removes them:
+    - every file older than the maximum age, see `utils.get_max_age`
+    - then the least recently used, until the rest fits in the quota, see
+      `utils.get_quota`
+
+Files used within MIN_AGE and the files of pending imports and sends are
+never removed. Only files gozbruh writes are looked at: in the shared
+directory, the files in its sessions, proxy, store and chunk directories,
+and the files at its top level that the registry records as exported or
+imported (see gozbruh.registry). Anything else in the shared directory, like
+the registry itself or scenes saved there by hand, is left alone. The
+version history keeps its own number of versions, see gozbruh.history, and
+is left alone too.
+
+The servers run a `Collector` in the background, `cmd.py gc` collects once:
+    python cmd.py gc [--dry-run]
+
+Constants
+---------
+MIN_AGE : float
+    Seconds since a file was last used before it can be removed
+COLLECT_INTERVAL : float
+    Seconds between the collections of a `Collector`
+"""
+
+import os
+import re
+import time
+import errno
+from threading import Thread, Event
+
+from . import chunks
+from . import registry
+from . import staging
+from . import store
+from . import utils
+
+MIN_AGE = 600.0
+COLLECT_INTERVAL = 900.0
+
+# extensions of the files gozbruh writes, .txt only in the script directory
+_MANAGED_EXTENSIONS = ('.ma', '.part', '.chunk')
+_SCRIPT_EXTENSIONS = ('.txt',)
+# directories of the shared directory only gozbruh writes to
+_MANAGED_DIRS = (utils.SESSIONS_DIR, utils.PROXY_DIR, store.STORE_DIR,
+                 chunks.CHUNKS_DIR)
+# files copied or received under a temporary name, next to their destination
+_PART_RE = re.compile(r'^(.+)\.\d+\.\d+\.part$')
+
+
+def get_roots():
+    """Returns the directories only gozbruh leaves files in: the
+    sessions, proxy, store and chunk directories of the shared directory,
+    the zscript directory and the staging directory
+    """
+    shared_dir = utils.get_shared_dir()
+    roots = []
+    for root in ([os.path.join(shared_dir, name) for name in _MANAGED_DIRS] +
+                 [get_script_dir(), staging.STAGING_PATH]):
+        root = os.path.realpath(root)
+        if root not in roots and os.path.isdir(root):
+            roots.append(root)
+    return roots
+
+def get_recorded_files():
+    """Returns the files at the top level of the shared directory that
+    gozbruh wrote, those the registry records as exported or imported, and
+    the temporary files of their copies
+    """
+    shared_dir = os.path.realpath(utils.get_shared_dir())
+    recorded = set()
+    for record in registry.get_registry().get_all():
+        path = record['file_path']
+        if path and os.path.dirname(os.path.realpath(path)) == shared_dir:
+            recorded.add(os.path.basename(path))
+    try:
+        file_names = os.listdir(shared_dir)
+    except OSError:
+        return []
+    files = []
+    for file_name in file_names:
+        match = _PART_RE.match(file_name)
+        if (match.group(1) if match else file_name) in recorded:
+            files.append(os.path.join(shared_dir, file_name))
+    return files
+
+def get_script_dir():
+    """Returns the directory the zscripts are written to
+    """
+    return os.path.join(utils.CONFIG_PATH, 'temp')
+
+def scan(roots=None):
+    """Lists the files gozbruh left in `roots`, and with the default
+    roots the `get_recorded_files` too
+
+    Returns
+    -------
+    list of (float, int, str)
+        last use, size and path of each file, least recently used first.
+        The last use is the later of the access and modification times.
+    """
+    paths = []
+    if roots is None:
+        roots = get_roots()
+        paths.extend(get_recorded_files())
+    script_dir = os.path.realpath(get_script_dir())
+    for root in roots:
+        for dir_path, dir_names, file_names in os.walk(root):
+            for file_name in file_names:
+                ext = os.path.splitext(file_name)[1]
+                if ext in _MANAGED_EXTENSIONS or (
+                        ext in _SCRIPT_EXTENSIONS and dir_path == script_dir):
+                    paths.append(os.path.join(dir_path, file_name))
+
+    found = []
+    seen = set()
+    for path in paths:
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            stat = os.lstat(path)
+        except OSError:
+            # removed in the meantime
+            continue
+        found.append((max(stat.st_atime, stat.st_mtime), stat.st_size,
+                      path))
+    found.sort()
+    return found
+
+def collect(quota=None, max_age=None, protected=(), dry_run=False,
+            roots=None):
+    """Removes the files gozbruh left behind that are too old, then the
+    least recently used ones until the rest fits in `quota`
+
+    Parameters
+    ----------
+    quota : int
+        (optional) bytes, `utils.get_quota` by default
+    max_age : float
+        (optional) seconds, `utils.get_max_age` by default
+    protected : iterable of str
+        paths that are never removed, the files of pending imports
+    dry_run : bool
+        True only counts what would be removed
+
+    Returns
+    -------
+    dict
+        'files' and 'bytes' found, 'removed' and 'freed' bytes, 'errors'
+    """
+    if quota is None:
+        quota = utils.get_quota()
+    if max_age is None:
+        max_age = utils.get_max_age()
+    protected = set(os.path.realpath(path) for path in protected)
+    now = time.time()
+
+    found = scan(roots)
+    total = sum(size for _, size, _ in found)
+    stats = {'files': len(found),
+             'bytes': total,
+             'removed': 0,
+             'freed': 0,
+             'errors': 0}
+    for last_used, size, path in found:
+        age = now - last_used
+        if age <= max_age and total <= quota:
+            # least recently used first, the rest is newer
+            break
+        if age < MIN_AGE or os.path.realpath(path) in protected:
+            continue
+        if not dry_run:
+            try:
+                os.remove(path)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    stats['errors'] += 1
+                    continue
+            _remove_empty_chunk_dir(os.path.dirname(path))
+        total -= size
+        stats['removed'] += 1
+        stats['freed'] += size
+    return stats
+
+def format_stats(stats):
+    """Returns a one line summary of the stats of `collect`
+    """
+    return 'removed %d of %d files, %.1fMB of %.1fMB (%d errors)' % (
+        stats['removed'], stats['files'], stats['freed'] / 1048576.0,
+        stats['bytes'] / 1048576.0, stats['errors'])
+
+
+class Collector(object):
+    """Runs `collect` every COLLECT_INTERVAL seconds on a background thread
+
+    Attributes
+    ----------
+    get_protected : callable
+        returns the paths of the files the process has pending imports of
+    """
+
+    def __init__(self, get_protected=None, interval=None):
+        self.get_protected = get_protected
+        self.interval = interval or COLLECT_INTERVAL
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name='gozbruh-collector')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                protected = self.get_protected() if self.get_protected else ()
+                stats = collect(protected=protected)
+            except Exception as err:
+                # a share that is gone for a moment must not end collecting
+                print 'could not collect files: %s' % err
+                continue
+            if stats['removed'] or stats['errors']:
+                print 'gozbruh gc: %s' % format_stats(stats)
+
+#------------------------------------------------------------------------------
+# Helpers
+#------------------------------------------------------------------------------
+
+def _remove_empty_chunk_dir(dir_path):
+    """Removes the chunk directory of a file once its last chunk is gone
+    """
+    if os.path.basename(os.path.dirname(dir_path)) != chunks.CHUNKS_DIR:
+        return
+    try:
+        os.rmdir(dir_path)
+    except OSError:
+        # not empty, or already gone
+        pass
@@ -4,6 +4,19 @@ Maya Server and ZBrush client classes
 MayaServer is used to start a commandPort,
 and listen for objects from ZBrush
 
+MayaServer also starts a MayaCommandServer, which accepts framed JSON
+requests (see gozbruh.protocol), runs them on Maya's main thread and
+replies with the results and timings
+
+With a relay configured (see gozbruh.relay), MayaServer also receives the
+same requests, and their files, from the relay, and MayaToZBrushClient sends
+through the relay instead of connecting to ZBrushServer
+
+In channel mode (see utils.is_channel_enabled) maya does not listen for
+ZBrush: MayaChannel keeps one connection to ZBrushServer that carries
+MayaToZBrushClient's sends and brings ZBrush's requests back. The
+commandPort is still opened as a fallback
+
 Objects are loaded when ZBrushServer calls
 client.load funcitons with name/path and tool parent
 
@@ -16,22 +29,56 @@ These attributes are used to keep track of name changes in maya
 
 Conflicts in the attributes result in renaming on export
 or creating new attributes to fit name changes
+
+With a proxy ratio configured (see utils.get_proxy_ratio) sends are
+progressive: decimated proxies are sent first, and the full meshes follow
+in the background and replace them
+
+The export profile (see get_export_profile and gozbruh.export_profiles)
+picks the channels of the meshes that are exported, and imported
 """
 
 import os
+import time
+import tempfile
 
 import socket
+import SocketServer
 import errno
+import Queue
+from threading import Thread, Lock, Event
 
 import json
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 import maya.cmds as cmds
-import pymel.core as pm
+import maya.utils
 
+from . import chunks
 from . import errs
+from . import export_profiles
+from . import history
+from . import lifecycle
+from . import profiling
+from . import protocol
+from . import registry
+from . import relay
+from . import staging
+from . import store
+from . import trace
 from . import utils
 
+# pymel is slow to import and only needed for dialogs, load it on first use
+pm = utils.LazyModule('pymel.core')
+
+# seconds between attempts to open the channel to ZBrushServer
+CHANNEL_RECONNECT_DELAY = 2.0
+# seconds to wait for the channel to open before a send
+CHANNEL_CONNECT_TIMEOUT = 10.0
+# seconds to wait for ZBrush to load what was sent on the channel, maya then
+# sends on a connection of its own
+CHANNEL_REPLY_TIMEOUT = 300.0
+
 # TODO: make this configurable:
 # nodes marked for removal from maya on import from ZBrush
 GARBAGE_NODES = ['blinn',
@@ -75,7 +122,8 @@ class MayaServer(object):
         self.status = False
 
     def start(self):
-        """Starts a Maya command port for the host, port specified
+        """Starts a Maya command port for the host, port specified, and the
+        JSON command server next to it
         """
 
         # check network info
@@ -91,6 +139,15 @@ class MayaServer(object):
             self.status = cmds.commandPort(self.cmdport_name, query=True)
         print 'listening %s' % self.cmdport_name
 
+        if utils.is_channel_enabled():
+            # ZBrush's requests come back on the channel, no need to listen
+            start_channel()
+        else:
+            start_command_server(self.host,
+                                 utils.get_maya_command_port(self.port))
+        start_relay_receiver()
+        start_collector()
+
     def stop(self):
         """Stops the maya command port for the host/port specified
         """
@@ -100,6 +157,245 @@ class MayaServer(object):
                                        query=True)
         print 'closing %s' % self.cmdport_name
 
+        stop_command_server()
+        stop_channel()
+        stop_relay_receiver()
+        stop_collector()
+
+
+class MayaCommandServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Socket server for gozbruh's JSON commands, one thread per connection.
+
+    Requests are read on the connection's thread and queued for Maya's main
+    thread with `maya.utils.executeInMainThreadWithResult`. Replies are sent
+    back in request order, so clients can pipeline several requests before
+    reading any replies.
+
+    Attributes
+    ----------
+    stats : dict
+        request/error counts per command and accumulated wait/run times
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address):
+        SocketServer.TCPServer.__init__(
+            self,
+            server_address,
+            MayaCommandHandler)
+        self.stats = {'requests': 0,
+                      'errors': 0,
+                      'commands': defaultdict(int),
+                      'wait_time': 0.0,
+                      'run_time': 0.0}
+        self.stats_lock = Lock()
+
+    def record(self, command, ok, timings):
+        """Adds one finished request to `stats`
+        """
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            self.stats['commands'][command] += 1
+            if not ok:
+                self.stats['errors'] += 1
+            self.stats['wait_time'] += timings['wait']
+            self.stats['run_time'] += timings['run']
+
+    def get_stats(self):
+        """Returns a copy of `stats` that can be serialized
+        """
+        with self.stats_lock:
+            stats = dict(self.stats)
+            stats['commands'] = dict(self.stats['commands'])
+        return stats
+
+
+class MayaCommandHandler(SocketServer.BaseRequestHandler):
+    """Handles framed JSON requests for `MayaCommandServer`
+
+    Commands:
+        ping             -> 'pong'
+        stats            -> `MayaCommandServer.stats` and the import queue's
+        load             -> args: file_path, obj_name, parent_name
+        load_many        -> args: entries, list of
+                            [file_path, obj_name, parent_name]
+        queue_load       -> same as load, imported when maya is idle
+        queue_load_many  -> same as load_many, imported when maya is idle
+
+    Every reply contains 'id', 'ok', 'result', 'error' and 'timings', where
+    timings holds seconds spent waiting for the main thread ('wait') and
+    running the command ('run').
+    """
+
+    def handle(self):
+        while True:
+            try:
+                request = protocol.recv_message(self.request)
+            except (errs.ProtocolError, ValueError) as err:
+                print 'bad request: %s' % err
+                break
+            except socket.error:
+                break
+            if request is None:
+                break
+
+            reply = _run_request(request, self.server)
+            try:
+                protocol.send_message(self.request, reply)
+            except socket.error:
+                break
+
+
+class MayaChannel(object):
+    """Maya's single connection to ZBrushServer in channel mode
+
+    Carries 'open' messages to ZBrushServer and brings ZBrush's requests
+    back, which are run like the command server's. Reconnects when
+    ZBrushServer restarts.
+
+    Attributes
+    ----------
+    host : str
+        host of ZBrushServer
+    port : str
+        port of ZBrushServer
+    session : str
+        session maya sends as
+    channel : `protocol.Channel`
+        current connection
+    connected : threading.Event
+        set while the channel is open
+    """
+
+    def __init__(self, host, port, session):
+        self.host = host
+        self.port = port
+        self.session = session
+        self.channel = None
+        self.connected = Event()
+        self.stopped = Event()
+        self.requests = Queue.Queue()
+        self.error = None
+
+    def start(self):
+        for target in (self.run, self.work):
+            thread = Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.requests.put(None)
+        if self.channel is not None:
+            self.channel.close()
+
+    def connect(self):
+        """Opens the channel, ZBrushServer confirms it before anything is
+        sent on it
+        """
+        address = utils.validate_host(self.host)
+        utils.validate_port(self.port)
+
+        sock = socket.create_connection((address, int(self.port)), 10)
+        try:
+            protocol.send_message(sock, {'command': 'channel',
+                                         'session': self.session})
+            reply = protocol.recv_message(sock)
+        except:
+            sock.close()
+            raise
+        if not reply or not reply.get('ok'):
+            sock.close()
+            raise errs.ZBrushServerError('ZBrushServer refused the channel')
+        sock.settimeout(None)
+        self.channel = protocol.Channel(sock)
+        self.connected.set()
+
+    def run(self):
+        """Keeps the channel open and reads from it until stopped
+        """
+        while not self.stopped.is_set():
+            try:
+                self.connect()
+                print 'channel open to ZBrushServer %s:%s' % (self.host,
+                                                              self.port)
+                self.error = None
+                self.serve()
+            except (errs.GozbruhError, socket.error, ValueError) as err:
+                error = getattr(err, 'msg', str(err))
+                if error != self.error and not self.stopped.is_set():
+                    # report once, not on every attempt
+                    print 'no channel to ZBrushServer: %s' % error
+                self.error = error
+            finally:
+                self.connected.clear()
+                if self.channel is not None:
+                    self.channel.close()
+            self.stopped.wait(CHANNEL_RECONNECT_DELAY)
+
+    def serve(self):
+        """Reads replies and ZBrush's requests until the channel closes
+        """
+        channel = self.channel
+        while True:
+            message = protocol.recv_message(channel.sock)
+            if message is None:
+                return
+            if 'command' in message:
+                self.requests.put((channel, message))
+            else:
+                channel.dispatch_reply(message)
+
+    def work(self):
+        """Runs ZBrush's requests in order
+
+        They are run off the reading thread, the main thread may be
+        waiting for a reply only the reading thread can receive.
+        """
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            channel, request = item
+            reply = _run_request(request, _command_server)
+            try:
+                channel.send(reply)
+            except socket.error:
+                pass
+
+    def send(self, data, timeout=None, reply_timeout=None):
+        """Sends a message to ZBrushServer and waits for its reply
+
+        Parameters
+        ----------
+        timeout : float
+            (optional) seconds to wait for the channel to open
+        reply_timeout : float
+            (optional) seconds to wait for the reply, CHANNEL_REPLY_TIMEOUT
+            by default
+
+        Raises
+        ------
+        errs.ReplyTimeoutError
+            ZBrush did not reply within `reply_timeout`, it may still be
+            loading
+        errs.ZBrushServerError
+            the channel is not open, or closed before the reply
+        """
+        if reply_timeout is None:
+            reply_timeout = CHANNEL_REPLY_TIMEOUT
+        if not self.connected.wait(timeout):
+            raise errs.ZBrushServerError(
+                'Connection Refused: %s:%s' % (self.host, self.port))
+        try:
+            return self.channel.request(data, reply_timeout)
+        except errs.ReplyTimeoutError:
+            raise
+        except (errs.ProtocolError, socket.error) as err:
+            raise errs.ZBrushServerError('ZBrushServer is down! (%s)' %
+                                         getattr(err, 'msg', err))
+
 
 class MayaToZBrushClient(object):
     """Client used for sending meshes to Zbrush.
@@ -121,6 +417,15 @@ class MayaToZBrushClient(object):
         current port obtained from utils.get_net_info
     sock : socket.socket
         current open socket connection
+    session : str
+        name this client sends as, ZBrushServer keeps the files and
+        imports of each session apart
+    relay : `relay.RelayClient`
+        connection to the relay, when one is configured the meshes are sent
+        through it instead of `sock`
+    channel : `MayaChannel`
+        in channel mode, the connection the meshes are sent on instead of
+        `sock`
 
     """
 
@@ -129,16 +434,35 @@ class MayaToZBrushClient(object):
         """
 
         self.host, self.port = utils.get_net_info(utils.ZBRUSH_ENV)
+        self.session = utils.get_session_id()
+        self.relay_info = utils.get_relay_info()
+        self.relay = None
+        self.channel = None
         self.status = False
         self.sock = None
+        # held while a send is waiting for ZBrush, full meshes of
+        # progressive sends are sent from another thread
+        self.lock = Lock()
         self.objs = None
         self.goz_id = None
         self.goz_obj = None
 
     def connect(self):
-        """Connect the client to the to ZBrushServer
+        """Connect the client to the to ZBrushServer, or to the relay if one
+        is configured
         """
 
+        if self.relay_info is not None:
+            self.connect_relay()
+            return
+        if utils.is_channel_enabled():
+            self.connect_channel()
+            return
+        self.connect_socket()
+
+    def connect_socket(self):
+        """Connect the client directly to ZBrushServer
+        """
         try:
             # close old socket, might not exist so skip
             self.sock.close()
@@ -147,7 +471,7 @@ class MayaToZBrushClient(object):
 
         self.status = False
 
-        utils.validate_host(self.host)
+        address = utils.validate_host(self.host)
         utils.validate_port(self.port)
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -155,7 +479,7 @@ class MayaToZBrushClient(object):
         self.sock.settimeout(45)
 
         try:
-            self.sock.connect((self.host, int(self.port)))
+            self.sock.connect((address, int(self.port)))
         except socket.error as err:
             self.status = False
             if errno.ECONNREFUSED in err:
@@ -164,79 +488,788 @@ class MayaToZBrushClient(object):
 
         self.status = True
 
+    def connect_relay(self):
+        """Connect the client to the relay, see `gozbruh.relay`
+        """
+        self.status = False
+        if self.relay is not None:
+            self.relay.close()
+
+        host, port = self.relay_info
+        self.relay = relay.RelayClient(host, port, 'maya',
+                                       session=self.session)
+        try:
+            self.relay.connect()
+        except errs.RelayError as err:
+            self.relay = None
+            raise errs.ZBrushServerError(err.msg)
+
+        self.status = True
+
+    def connect_channel(self):
+        """Sends on maya's channel to ZBrushServer, opening it if necessary
+        """
+        self.status = False
+        self.channel = start_channel()
+        if not self.channel.connected.wait(CHANNEL_CONNECT_TIMEOUT):
+            raise errs.ZBrushServerError(
+                'Connection Refused: %s:%s' % (self.host, self.port))
+        self.status = True
+
     def check_socket(self):
         """Verify connection to ZBrushServer
+
+        Skipped while a send waits for its reply on the socket, the check
+        would read that reply.
         """
 
         if self.sock is None:
             return
+        if not self.lock.acquire(False):
+            return
 
         try:
-            self.sock.send('check')
-            if self.sock.recv(1024) == 'ok':
-                # connected
-                print 'connected!'
-            else:
-                # bad connection, clear socket
+            try:
+                self.sock.send('check')
+                if self.sock.recv(1024) == 'ok':
+                    # connected
+                    print 'connected!'
+                else:
+                    # bad connection, clear socket
+                    self.status = False
+                    self.sock.close()
+                    self.sock = None
+                    print 'conn reset!'
+
+            except socket.error as err:
+                # catches server down errors, resets socket
                 self.status = False
                 self.sock.close()
                 self.sock = None
-                print 'conn reset!'
-
-        except socket.error as err:
-            # catches server down errors, resets socket
-            self.status = False
-            self.sock.close()
-            self.sock = None
-            if errno.ECONNREFUSED in err:
-                print 'conn ref'
-                # server probably down
-            if errno.EADDRINUSE in err:
-                # this is fine
-                print 'already connected...'
-            if errno.EPIPE in err:
-                # server down, or unexpected connection interuption
-                print 'broken pipe, trying to reconnect'
-        except AttributeError:
-            print 'need new sock'
-
-    def format_message(self, command, obj_parents):
-        """Construct a json string to pass to the zbrush server."""
+                if errno.ECONNREFUSED in err:
+                    print 'conn ref'
+                    # server probably down
+                if errno.EADDRINUSE in err:
+                    # this is fine
+                    print 'already connected...'
+                if errno.EPIPE in err:
+                    # server down, or unexpected connection interuption
+                    print 'broken pipe, trying to reconnect'
+            except AttributeError:
+                print 'need new sock'
+        finally:
+            self.lock.release()
+
+    def format_message(self, command, obj_parents, uuids=None, trace_id=None,
+                       proxy=False, digests=None):
+        """Construct a json string to pass to the zbrush server.
+
+        See `build_message`"""
+        return json.dumps(self.build_message(command, obj_parents, uuids,
+                                             trace_id, proxy, digests))
+
+    def build_message(self, command, obj_parents, uuids=None, trace_id=None,
+                      proxy=False, digests=None):
+        """Construct the message passed to the zbrush server.
+
+        `uuids` maps objects to their maya UUIDs, the server uses them to
+        find the subtool an object is registered as in the `registry`.
+        `trace_id` lets the server record its spans in the same trace.
+        The client's session tells the server where the files are staged,
+        and `proxy` that they are the proxies of a progressive send.
+        `digests` maps objects to their files in the `store`."""
         objData = defaultdict(list)
 
         for obj, parent in obj_parents:
             objData[parent].append(obj)
 
-        return json.dumps({'command': command, 'objData': dict(objData)})
-
-    def send(self, objs):
+        data = {'command': command,
+                'objData': dict(objData),
+                'session': self.session}
+        if uuids:
+            data['uuids'] = uuids
+        if trace_id is not None:
+            data['trace'] = trace_id
+        if proxy:
+            data['proxy'] = True
+        if digests:
+            data['store'] = digests
+        return data
+
+    def send(self, objs, wait=True):
         """Send a file load command to ZBrush via ZBrushServer.
+
+        The objects are exported to local disk, published to the shared
+        directory in the background (see gozbruh.staging), and ZBrush is
+        told to load them once they are published. With `wait` False all of
+        this but the export happens on a background thread, and errors are
+        shown with `error_gui`.
         """
-        # export, send
+        # export, publish, send
         if self.status:
-            obj_parents = export(objs)
-            msg = self.format_message('open', obj_parents)
-            self.sock.send(msg)
-            # check receipt of objs
-            self.load_confirm()
+            self.objs = objs
+            trace_id = trace.new_trace_id()
+            ratio = utils.get_proxy_ratio()
+            jobs = []
+            with trace.span('maya.send', objects=len(objs)):
+                try:
+                    if ratio is not None:
+                        with trace.span('maya.export_proxy',
+                                        objects=len(objs)):
+                            obj_parents = export_proxies(objs, ratio,
+                                                         self.session)
+                        jobs.append(self.make_job(obj_parents, proxy=True))
+                        if wait:
+                            self.send_published(*jobs.pop(),
+                                                trace_id=trace_id)
+                    with trace.span('maya.export', objects=len(objs)):
+                        obj_parents = export(
+                            objs, self.session,
+                            use_store=self.relay is None and
+                            utils.is_store_enabled())
+                    jobs.append(self.make_job(obj_parents))
+                except:
+                    # jobs that are not sent do not hold their files
+                    for job in jobs:
+                        _release(*job[-2:])
+                    raise
+                if wait and ratio is None:
+                    self.send_published(*jobs.pop(), trace_id=trace_id)
+                    return
+                # ZBrush has the proxies, or maya does not wait, send the
+                # rest in the background
+                thread = Thread(target=self.send_jobs, args=(jobs, trace_id))
+                thread.daemon = True
+                thread.start()
         else:
             raise errs.ZBrushServerError(
                 'Please connect to ZBrushServer first')
 
+    def make_job(self, obj_parents, proxy=False):
+        """Starts publishing exported files, see `send_published`
+
+        Files sent through the relay are sent from the staging directory,
+        and are not published, they are held instead so the next export
+        waits until they are sent. With the `store` enabled, files are
+        published under their digest, and files already in the store are
+        not published again.
+
+        The files ZBrush will read are kept from the `lifecycle.Collector`
+        from now until it answered, see `SentFiles`.
+
+        Returns
+        -------
+        tuple
+            arguments of `send_published`
+        """
+        uuids = _get_uuids([obj for obj, _ in obj_parents])
+        publications = []
+        digests = {}
+        sent = []
+        held = []
+        if self.relay is not None:
+            for obj, _ in obj_parents:
+                held.append(staging.get_staged_path(
+                    utils.make_maya_filepath(obj, self.session, proxy)))
+                _publisher.hold(held[-1])
+        else:
+            use_store = utils.is_store_enabled()
+            for obj, _ in obj_parents:
+                dest_path = utils.make_maya_filepath(obj, self.session, proxy)
+                staged_path = staging.get_staged_path(dest_path)
+                published = False
+                if use_store:
+                    digest = registry.hash_file(staged_path)
+                    # the same mesh is in the store, or on its way
+                    published = digest in digests.values() or \
+                        store.is_stored(digest)
+                    digests[obj] = digest
+                    dest_path = store.get_store_path(digest)
+                # before publishing, the publisher forgets it once done
+                sent.append(dest_path)
+                _sent_files.add([dest_path])
+                if not published:
+                    publications.append(_publisher.publish(staged_path,
+                                                           dest_path))
+        return obj_parents, uuids, publications, proxy, digests, sent, held
+
+    def send_published(self, obj_parents, uuids, publications, proxy=False,
+                       digests=None, sent=(), held=(), trace_id=None):
+        """Waits until the exported files are published, then sends them,
+        and releases the `sent` and `held` files
+        """
+        try:
+            with trace.span('maya.publish_wait', files=len(publications)):
+                for publication in publications:
+                    publication.wait()
+            self.send_open(obj_parents, uuids, trace_id, proxy, digests)
+        finally:
+            _release(sent, held)
+
+    def send_open(self, obj_parents, uuids=None, trace_id=None, proxy=False,
+                  digests=None):
+        """Sends the exported files on the client's connection, and waits
+        until ZBrush loaded them
+        """
+        with self.lock:
+            if self.relay is not None:
+                self.send_relay(obj_parents, uuids, trace_id, proxy)
+            elif self.channel is not None:
+                self.send_channel(obj_parents, uuids, trace_id, proxy,
+                                  digests)
+            else:
+                self.send_socket(obj_parents, uuids, trace_id, proxy, digests)
+
+    def send_socket(self, obj_parents, uuids=None, trace_id=None, proxy=False,
+                    digests=None):
+        """Sends the open message on the client's own connection to
+        ZBrushServer, and waits until ZBrush loaded the objects
+        """
+        msg = self.format_message('open', obj_parents, uuids, trace_id, proxy,
+                                  digests)
+        with trace.span('maya.socket_send', bytes=len(msg)):
+            self.sock.send(msg)
+        # check receipt of objs
+        with trace.span('maya.load_confirm'):
+            self.load_confirm()
+
+    def send_jobs(self, jobs, trace_id=None):
+        """Sends the jobs made by `make_job` in order, runs on its own
+        thread
+        """
+        trace.set_trace_id(trace_id)
+        try:
+            with trace.span('maya.send_background', jobs=len(jobs)):
+                while jobs:
+                    self.send_published(*jobs.pop(0), trace_id=trace_id)
+        except (errs.ZBrushServerError, errs.PublishError,
+                socket.error) as err:
+            message = getattr(err, 'msg', err)
+            print message
+            maya.utils.executeDeferred(error_gui, message)
+        finally:
+            # jobs after a failed one are not sent
+            for job in jobs:
+                _release(*job[-2:])
+            trace.set_trace_id(None)
+
+    def send_relay(self, obj_parents, uuids=None, trace_id=None,
+                   proxy=False):
+        """Sends the exported files to every ZBrush of this artist through
+        the relay, and waits until they are loaded
+        """
+        data = self.build_message('open', obj_parents, uuids, trace_id, proxy)
+        files = [staging.get_staged_path(
+                    utils.make_maya_filepath(obj, self.session, proxy))
+                 for obj, _ in obj_parents]
+        with trace.span('maya.relay_send', files=len(files)):
+            try:
+                acks = chunks.send_files(self.relay, 'zbrush', data, files)
+            except errs.RelayError as err:
+                self.status = False
+                self.relay = None
+                raise errs.ZBrushServerError(err.msg)
+
+        for ack in acks:
+            if not ack['ok']:
+                raise errs.ZBrushServerError(
+                    'ZBrush on %s: %s' % (ack['from']['session'],
+                                          ack['result']))
+        print 'ZBrush Loaded (%d):' % len(acks)
+        print ('\n'.join(self.objs))
+
+    def send_channel(self, obj_parents, uuids=None, trace_id=None,
+                     proxy=False, digests=None):
+        """Sends the open message on maya's channel, and waits until
+        ZBrush loaded the objects
+
+        When the channel is not open or breaks, the message is sent again
+        on a connection of its own. When ZBrush does not answer within
+        `CHANNEL_REPLY_TIMEOUT` it may still be loading, and the message is
+        not sent again.
+        """
+        data = self.build_message('open', obj_parents, uuids, trace_id, proxy,
+                                  digests)
+        with trace.span('maya.channel_send'):
+            try:
+                reply = self.channel.send(data, CHANNEL_CONNECT_TIMEOUT)
+            except errs.ReplyTimeoutError as err:
+                raise errs.ZBrushServerError(
+                    'ZBrush did not confirm the load, it may still be '
+                    'loading (%s)' % err.msg)
+            except errs.ZBrushServerError as err:
+                print '%s, sending without the channel' % err.msg
+                self.send_fallback(obj_parents, uuids, trace_id, proxy,
+                                   digests)
+                return
+        if not reply['ok']:
+            raise errs.ZBrushServerError('ZBrush: %s' % reply['error'])
+        print 'ZBrush Loaded:'
+        print ('\n'.join(self.objs))
+
+    def send_fallback(self, obj_parents, uuids=None, trace_id=None,
+                      proxy=False, digests=None):
+        """Sends the open message on a connection of its own, for when
+        maya's channel fails
+        """
+        try:
+            self.connect_socket()
+            self.send_socket(obj_parents, uuids, trace_id, proxy, digests)
+        except (errs.ZBrushServerError, socket.error) as err:
+            self.status = False
+            raise errs.ZBrushServerError(
+                'ZBrushServer is down! (%s)' % getattr(err, 'msg', err))
+        finally:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+
     def load_confirm(self):
         """Check to make sure that sent objects have been loaded after a send.
-        'loaded' will be sent back from ZBrushServer
+        'loaded' will be sent back from ZBrushServer, or 'error: ' and the
+        objects that could not be imported
         """
 
-        if self.sock.recv(1024) == 'loaded':
+        reply = self.sock.recv(1024)
+        if reply == 'loaded':
             print 'ZBrush Loaded:'
             print ('\n'.join(self.objs))
+        elif reply.startswith('error: '):
+            raise errs.ZBrushServerError('ZBrush ' + reply[len('error: '):])
         else:
             self.status = False
             self.sock = None
             print 'ZBrushServer is down!'
             raise errs.ZBrushServerError('ZBrushServer is down!')
 
+class ImportQueue(object):
+    """Queue of loads from ZBrush, drained while Maya is idle.
+
+    Loads are accepted right away and imported from an idleEvent scriptJob,
+    a few at a time with `load_many`, so a burst of sends does not freeze
+    the artist's session. Each idle tick imports as many objects as are
+    expected to fit in `budget` seconds (always at least one). Loading an
+    object that is already queued replaces its pending entry but keeps its
+    place in line.
+
+    The budget is read from the 'gozbruh_import_budget' optionVar, in
+    milliseconds, if it exists.
+
+    Loads that fail are reported with `error_gui` and dropped, queued again
+    they would fail on every idle tick.
+
+    Attributes
+    ----------
+    pending : OrderedDict
+        obj_name -> (file_path, obj_name, parent_name, time queued,
+        trace ID, proxy)
+    budget : float
+        seconds of importing allowed per idle tick
+    job : int
+        id of the idleEvent scriptJob, None while the queue is empty
+    """
+
+    DEFAULT_BUDGET = 0.05
+
+    def __init__(self, budget=None):
+        self.pending = OrderedDict()
+        self.loading = []
+        self.budget = budget
+        self.job = None
+        self.lock = Lock()
+        self.avg_cost = None
+        self.loaded = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+
+    def get_budget(self):
+        """Returns the per-tick budget in seconds
+        """
+        if self.budget is not None:
+            return self.budget
+        if cmds.optionVar(ex='gozbruh_import_budget'):
+            return cmds.optionVar(q='gozbruh_import_budget') / 1000.0
+        return self.DEFAULT_BUDGET
+
+    def put(self, file_path, obj_name, parent_name, proxy=False):
+        """Queues a load, call `schedule` afterwards to get it imported
+
+        The current trace ID is kept with the load, and `proxy` tells
+        whether the file is a proxy, see `load_many`.
+        """
+        with self.lock:
+            if obj_name in self.pending:
+                queued = self.pending[obj_name][3]
+                self.coalesced += 1
+            else:
+                queued = time.time()
+            self.pending[obj_name] = (file_path, obj_name, parent_name, queued,
+                                      trace.get_trace_id(), proxy)
+
+    def schedule(self):
+        """Makes sure queued loads get imported, must be called on the main
+        thread
+        """
+        if not self.pending:
+            return
+        if cmds.about(batch=True):
+            # no idle events without a UI, import right away
+            self.drain()
+        elif self.job is None:
+            self.job = cmds.scriptJob(idleEvent=self.tick)
+
+    def tick(self):
+        """Imports a batch of queued objects, called on idle
+
+        The batch size is the budget divided by the average import time per
+        object seen so far, and at least one object.
+        """
+        if self.avg_cost:
+            count = max(1, int(self.get_budget() / self.avg_cost))
+        else:
+            count = 1
+        self._load_batch(count)
+
+        if not self.pending and self.job is not None:
+            job, self.job = self.job, None
+            # killing the running job from its own callback is not allowed
+            maya.utils.executeDeferred(cmds.scriptJob, kill=job, force=True)
+
+    def drain(self):
+        """Imports everything that is queued
+        """
+        self._load_batch(len(self.pending))
+
+    def _load_batch(self, count):
+        with self.lock:
+            batch = [self.pending.popitem(last=False)[1]
+                     for _ in range(min(count, len(self.pending)))]
+            self.loading = batch
+        if not batch:
+            return
+
+        failed = []
+        started = time.time()
+        try:
+            for proxy in (False, True):
+                entries = [entry[:3] for entry in batch if entry[5] == proxy]
+                if not entries:
+                    continue
+                try:
+                    load_many(entries, proxy=proxy)
+                except Exception as err:
+                    failed.extend(entries)
+                    message = 'Could not import %s from ZBrush: %s' % (
+                        ', '.join(entry[1] for entry in entries), err)
+                    print message
+                    error_gui(message)
+        finally:
+            finished = time.time()
+            cost = (finished - started) / len(batch)
+            with self.lock:
+                self.loading = []
+                if self.avg_cost is None:
+                    self.avg_cost = cost
+                else:
+                    self.avg_cost = (self.avg_cost + cost) / 2.0
+                self.loaded += len(batch) - len(failed)
+                self.failed += len(failed)
+                self.last_wait = started - batch[-1][3]
+                self.max_wait = max([self.max_wait] +
+                                    [started - entry[3] for entry in batch])
+
+            for trace_id in set(entry[4] for entry in batch):
+                if trace_id is None:
+                    continue
+                for entry in batch:
+                    if entry[4] == trace_id:
+                        trace.record('maya.queue_wait', entry[3],
+                                     started - entry[3], trace_id,
+                                     obj=entry[1])
+                trace.record('maya.idle_import', started, finished - started,
+                             trace_id, objects=len(batch))
+
+    def get_pending_files(self):
+        """Returns the paths of the files waiting to be imported, and of
+        those being imported
+        """
+        with self.lock:
+            return [entry[0] for entry in self.pending.values() + self.loading]
+
+    def get_stats(self):
+        """Returns queue depth and wait times, in seconds
+
+        Safe to call from any thread.
+        """
+        with self.lock:
+            now = time.time()
+            oldest = min([entry[3] for entry in self.pending.values()] or
+                         [now])
+            return {'depth': len(self.pending),
+                    'oldest_wait': now - oldest,
+                    'last_wait': self.last_wait,
+                    'max_wait': self.max_wait,
+                    'loaded': self.loaded,
+                    'failed': self.failed,
+                    'coalesced': self.coalesced,
+                    'avg_cost': self.avg_cost}
+
+class SentFiles(object):
+    """Files of the 'open' messages ZBrush has not answered yet.
+
+    ZBrush may still be waiting to import them, possibly longer than
+    `lifecycle.MIN_AGE` when it is busy, so the `lifecycle.Collector` keeps
+    them until the reply comes.
+
+    Attributes
+    ----------
+    files : dict
+        path -> number of unanswered messages naming it
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.lock = Lock()
+
+    def add(self, paths):
+        with self.lock:
+            for path in paths:
+                self.files[path] = self.files.get(path, 0) + 1
+
+    def remove(self, paths):
+        with self.lock:
+            for path in paths:
+                count = self.files.pop(path, 0) - 1
+                if count > 0:
+                    self.files[path] = count
+
+    def get_files(self):
+        with self.lock:
+            return list(self.files)
+
+class GozIdIndex(object):
+    """Index of every node carrying a gozbruhBrushID attribute.
+
+    Built with one scene-wide `ls` for the attribute, then one future
+    history walk per indexed node to find the mesh transforms downstream of
+    it. Lookups are then plain dictionary accesses instead of
+    `attributeQuery`/`listHistory` calls per selected object.
+
+    Maya callbacks keep the index current one node at a time: removed and
+    renamed nodes are updated right away, new nodes and the sources of
+    changed connections are queued, and only they, and the indexed nodes
+    upstream of them, are indexed again on the next lookup. The index is
+    only rebuilt for a new or opened scene.
+
+    Attributes
+    ----------
+    ids : dict
+        node -> gozbruhBrushID, for every node with the attribute
+    history : dict
+        mesh transform -> list of (node, gozbruhBrushID) for the indexed
+        nodes in its history, transforms themselves are only in `ids`
+    futures : dict
+        indexed node -> set of the mesh transforms downstream of it
+    pending : dict
+        hash code -> MObjectHandle of the nodes to index again
+    dirty : bool
+        True if the index must be rebuilt before the next lookup
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.history = {}
+        self.futures = {}
+        self.pending = {}
+        self.dirty = True
+        self.callback_ids = []
+
+    def rebuild(self):
+        """Rebuilds the index from the scene
+        """
+        self.ids = {}
+        self.history = {}
+        self.futures = {}
+        self.pending = {}
+
+        nodes = cmds.ls('*.gozbruhBrushID', objectsOnly=True,
+                        recursive=True) or []
+        xforms = set(cmds.ls(nodes, transforms=True) or [])
+        for node in nodes:
+            self._add(node, cmds.getAttr(node + '.gozbruhBrushID'),
+                      node in xforms)
+        self.dirty = False
+
+    def update(self):
+        """Rebuilds the index if it is dirty, or indexes the nodes queued by
+        the callbacks again, installing the callbacks the first time
+        """
+        if not self.callback_ids:
+            self.install_callbacks()
+        if self.dirty:
+            self.rebuild()
+        elif self.pending:
+            self._update_pending()
+
+    def get_ids(self, obj):
+        """Returns the gozbruhBrushIDs relevant to `obj`
+
+        The object's own ID if it has one, otherwise the IDs found in its
+        history.
+
+        Returns
+        -------
+        list of str
+        """
+        self.update()
+        if obj in self.ids:
+            return [self.ids[obj]]
+        return [goz_id for _, goz_id in self.history.get(obj, [])]
+
+    def set_id(self, node, goz_id):
+        """Records a new gozbruhBrushID value for `node`, indexing it if it
+        is not indexed yet
+        """
+        if self.dirty:
+            # read from the scene on the next lookup
+            return
+        node = (cmds.ls(node) or [node])[0]
+        if node not in self.ids:
+            self.index(node)
+            return
+        self.ids[node] = goz_id
+        for xform in self.futures.get(node, ()):
+            self.history[xform] = [(n, goz_id if n == node else i)
+                                   for n, i in self.history[xform]]
+
+    def index(self, node):
+        """Indexes `node` again, dropping it if it no longer has a
+        gozbruhBrushID
+        """
+        self._remove(node)
+        if cmds.objExists(node) and cmds.attributeQuery(
+                'gozbruhBrushID', node=node, exists=True):
+            self._add(node, cmds.getAttr(node + '.gozbruhBrushID'),
+                      bool(cmds.ls(node, transforms=True)))
+
+    def install_callbacks(self):
+        """Registers the maya callbacks that keep the index current
+        """
+        import maya.OpenMaya as om
+
+        self.callback_ids = [
+            om.MDGMessage.addNodeAddedCallback(self._node_added,
+                                               'dependNode'),
+            om.MDGMessage.addNodeRemovedCallback(self._node_removed,
+                                                 'dependNode'),
+            om.MDGMessage.addConnectionCallback(self._connection_changed),
+            om.MNodeMessage.addNameChangedCallback(om.MObject(),
+                                                   self._node_renamed),
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew,
+                                         self._mark_dirty),
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen,
+                                         self._mark_dirty),
+        ]
+
+    def remove_callbacks(self):
+        """Unregisters the maya callbacks, the index is dirty afterwards
+        """
+        import maya.OpenMaya as om
+
+        for callback_id in self.callback_ids:
+            om.MMessage.removeCallback(callback_id)
+        self.callback_ids = []
+        self.dirty = True
+
+    def _add(self, node, goz_id, is_xform):
+        self.ids[node] = goz_id
+        if is_xform:
+            return
+        future = cmds.listHistory(node, future=True) or []
+        meshes = cmds.ls(future, type='mesh')
+        xforms = set()
+        if meshes:
+            xforms = set(cmds.ls(cmds.listRelatives(meshes, parent=True,
+                                                    fullPath=True) or []))
+        self.futures[node] = xforms
+        for xform in xforms:
+            self.history.setdefault(xform, []).append((node, goz_id))
+
+    def _remove(self, node):
+        self.ids.pop(node, None)
+        for xform in self.futures.pop(node, ()):
+            entries = [e for e in self.history.get(xform, []) if e[0] != node]
+            if entries:
+                self.history[xform] = entries
+            else:
+                self.history.pop(xform, None)
+
+    def _update_pending(self):
+        """Indexes the queued nodes again, and the indexed nodes upstream of
+        them, whose futures may have changed
+        """
+        handles, self.pending = self.pending.values(), {}
+        names = [_get_node_name(handle.object()) for handle in handles
+                 if handle.isValid()]
+        names = cmds.ls(names) or []
+        if not names:
+            return
+        affected = set(names)
+        upstream = cmds.ls(cmds.listHistory(names) or []) or []
+        affected.update(node for node in upstream if node in self.ids)
+        for node in affected:
+            self.index(node)
+
+    def _queue(self, node):
+        import maya.OpenMaya as om
+
+        handle = om.MObjectHandle(node)
+        self.pending[handle.hashCode()] = handle
+
+    def _mark_dirty(self, *args):
+        self.dirty = True
+
+    def _node_added(self, node, *args):
+        # attributes are added after the node, it is looked at later
+        if not self.dirty:
+            self._queue(node)
+
+    def _connection_changed(self, src_plug, dest_plug, made, *args):
+        # the futures of the nodes upstream of the source changed
+        if not self.dirty:
+            self._queue(src_plug.node())
+
+    def _node_renamed(self, node, prev_name, *args):
+        if self.dirty or not prev_name:
+            return
+        name = _get_node_name(node)
+        if prev_name in self.ids:
+            self.ids[name] = self.ids.pop(prev_name)
+            if prev_name in self.futures:
+                self.futures[name] = self.futures.pop(prev_name)
+            for xform in self.futures.get(name, ()):
+                self.history[xform] = [(name if n == prev_name else n, i)
+                                       for n, i in self.history[xform]]
+        if prev_name in self.history:
+            self.history[name] = self.history.pop(prev_name)
+            for futures in self.futures.itervalues():
+                if prev_name in futures:
+                    futures.discard(prev_name)
+                    futures.add(name)
+        # a path that is no longer unique is looked up again
+        self._queue(node)
+
+    def _node_removed(self, node, *args):
+        if self.dirty:
+            return
+        name = _get_node_name(node)
+        self._remove(name)
+        self.history.pop(name, None)
+        for futures in self.futures.itervalues():
+            futures.discard(name)
+
 #==============================================================================
 # FUNCTIONS
 #==============================================================================
@@ -258,22 +1291,151 @@ def get_goz_objs():
 # Renaming
 #------------------------------------------------------------------------------
 
-def handle_renames(objs):
-    import gozbruh.mayagui as mayagui
-    # check for any gozbruhBrushIDs, and relink/create
-    for obj, goz_id in _get_gozid_mismatches(objs[:]):
-        # relinked objs are removed from self.client.objs
-        # this prevents relinking 2 previous tool histories
-        # it stops relinking after the 1st match/relink
-        # so pSphere1 contains both meshes, but pSphere2 still exists
-        # this prevents overwriting 2 zbrush tools with the same obj
-
-        # the 'skip' option during in the relink gui keeps the obj to look
-        # for an alternative history, for example relink the 2nd obj history
-        # if skip fails to relink, it will default to 'create'
-        objs = mayagui.rename_prompt(obj, goz_id, objs)
+_gozid_index = GozIdIndex()
+
+# how gozbruhBrushID/name conflicts are resolved, see handle_renames
+CONFLICT_POLICIES = ('prompt', 'auto', 'relink', 'create', 'skip')
+
+def get_conflict_policy():
+    """Returns the conflict policy from the 'gozbruh_conflict_policy'
+    optionVar, 'prompt' if it is not set
+    """
+    if cmds.optionVar(ex='gozbruh_conflict_policy'):
+        return cmds.optionVar(q='gozbruh_conflict_policy')
+    return 'prompt'
+
+def handle_renames(objs, policy=None, interactive=None):
+    """Resolve all gozbruhBrushID/name conflicts in `objs` at once.
+
+    Policies:
+        prompt  -> ask about every conflict in one summary dialog
+        auto    -> relink when the name is unambiguous, ask about the rest
+        relink  -> always relink
+        create  -> always create
+        skip    -> leave every conflict as is
+
+    A conflict is unambiguous when the object has a single old ID, no other
+    object in `objs` claims that ID, and no node with that name exists
+    (relinking would delete it).
+
+    Parameters
+    ----------
+    objs : list of str
+        objects about to be sent
+    policy : str
+        (optional) one of CONFLICT_POLICIES, defaults to
+        `get_conflict_policy`
+    interactive : bool
+        (optional) False never shows a dialog, conflicts left to it are
+        skipped. Defaults to False in batch mode, True otherwise
+
+    Returns
+    -------
+    list of str
+        objects to send, relinked objects carry their new name
+    """
+    if policy is None:
+        policy = get_conflict_policy()
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError('Unknown conflict policy: %s' % policy)
+    if interactive is None:
+        interactive = not cmds.about(batch=True)
+
+    mismatches = _get_gozid_mismatches(objs[:])
+    if not mismatches:
+        return objs
+
+    actions, ambiguous = _plan_conflicts(mismatches, policy)
+    if ambiguous:
+        if interactive:
+            choice = _conflict_summary_prompt(ambiguous)
+        else:
+            choice = 'skip'
+        actions += [(obj, goz_id, choice) for obj, goz_id in ambiguous]
+
+    return _apply_conflicts(objs, actions)
+
+def _plan_conflicts(mismatches, policy):
+    """Splits mismatches into actions decided by `policy` and ambiguous
+    conflicts left to the user
+
+    Returns
+    -------
+    list of (str, str, str), list of (str, str)
+        (obj, goz_id, action) and (obj, goz_id)
+    """
+    if policy in ('relink', 'create', 'skip'):
+        return [(obj, goz_id, policy) for obj, goz_id in mismatches], []
+    if policy == 'prompt':
+        return [], list(mismatches)
+
+    obj_counts = defaultdict(int)
+    id_counts = defaultdict(int)
+    for obj, goz_id in mismatches:
+        obj_counts[obj] += 1
+        id_counts[goz_id] += 1
+    existing = set(cmds.ls(list(id_counts)) or [])
+
+    actions = []
+    ambiguous = []
+    for obj, goz_id in mismatches:
+        if (obj_counts[obj] == 1 and id_counts[goz_id] == 1 and
+                goz_id not in existing):
+            actions.append((obj, goz_id, 'relink'))
+        else:
+            ambiguous.append((obj, goz_id))
+    return actions, ambiguous
+
+def _apply_conflicts(objs, actions):
+    """Relinks/creates objects, returns the revised objlist
+
+    relinked objs are removed from the objlist, this prevents relinking 2
+    previous tool histories: it stops relinking after the 1st match/relink
+    so pSphere1 contains both meshes, but pSphere2 still exists. this
+    prevents overwriting 2 zbrush tools with the same obj
+    """
+    objs = list(objs)
+    for obj, goz_id, action in actions:
+        if action == 'relink':
+            # relink to past gozbruhBrushID
+            if obj not in objs:
+                continue
+            new_obj = relink(obj, goz_id)
+            objs.remove(obj)
+            if new_obj not in objs:
+                objs.append(new_obj)
+        elif action == 'create':
+            # new object for zbrush
+            create(obj)
     return objs
 
+def _conflict_summary_prompt(conflicts, limit=20):
+    """Asks once what to do with all `conflicts`
+
+    Returns
+    -------
+    str
+        'relink', 'create' or 'skip'
+    """
+    lines = ['%s  ->  %s' % (obj, goz_id) for obj, goz_id in conflicts[:limit]]
+    if len(conflicts) > limit:
+        lines.append('... and %d more' % (len(conflicts) - limit))
+
+    gui_message = """%d objects have old ZBrush IDs, try to relink?
+
+%s
+
+                    NOTE! relinking will
+                    remove objects named like the old IDs and use the
+                    selected meshes as the new ones!!
+                    """ % (len(conflicts), '\n'.join(lines))
+
+    choice = pm.confirmDialog(title="ZBrush Name Conflicts",
+                              message=gui_message,
+                              button=['Relink All', 'Create All', 'Skip'])
+    return {'Relink All': 'relink',
+            'Create All': 'create'}.get(choice, 'skip')
+
 def rename_prompt(obj, goz_id, objs):
     """Confirm object rename, trigger create or relink then revise
     objlist
@@ -290,18 +1452,7 @@ def rename_prompt(obj, goz_id, objs):
     choice = pm.confirmDialog(title="ZBrush Name Conflict",
                               message=gui_message,
                               button=['Relink', 'Create', 'Skip'])
-    if choice == 'Relink':
-        # relink to past gozbruhBrushID
-        if obj not in objs:
-            return
-        new_obj = relink(obj, goz_id)
-        objs.remove(obj)
-        if new_obj not in objs:
-            objs.append(new_obj)
-
-    elif choice == 'Create':
-        # new object for zbrush
-        create(obj)
+    return _apply_conflicts(objs, [(obj, goz_id, choice.lower())])
 
 def relink(obj, goz_id):
     """Relink object name with existing gozbruhBrushID.
@@ -334,16 +1485,42 @@ def create(obj):
 
     if goz_check_shape:
         cmds.setAttr(shape + '.gozbruhBrushID', obj, type='string')
+        _gozid_index.set_id(shape, obj)
     if goz_check_xform:
         cmds.setAttr(xform + '.gozbruhBrushID', obj, type='string')
+        _gozid_index.set_id(xform, obj)
+
+    uuid = _get_uuids([xform]).get(xform)
+    if uuid is not None:
+        registry.get_registry().set_subtool(uuid, obj)
     return xform
 
+def _get_uuids(objs):
+    """Returns a dict of object -> Maya node UUID
+
+    Empty on versions of Maya without UUIDs.
+    """
+    uuids = {}
+    for obj in objs:
+        try:
+            uuid = cmds.ls(obj, uuid=True)
+        except TypeError:
+            return {}
+        if uuid:
+            uuids[obj] = uuid[0]
+    return uuids
+
 def _get_gozid_mismatches(objs):
     """Return objects from `objs` whose gozbruhBrushID does not match their name
 
     Checks object history for instances of gozbruhBrushID,
     returns a list ofgozbruhBrushID/name conflicts
 
+    Objects this session recorded in the `registry` are never mismatched,
+    their ZBrush identity is recorded by UUID, as long as the UUID names
+    only that object in the scene. Other IDs are looked up in a
+    `GozIdIndex` of the scene instead of walking the history of each object
+
     gozbruhBrushID is created by ZBrush on export and is used to track
     name changes that can occur in maya
 
@@ -354,25 +1531,20 @@ def _get_gozid_mismatches(objs):
     """
     goz_list = []
 
-    for obj in objs:
-        has_attr = cmds.attributeQuery(
-            'gozbruhBrushID', node=obj, exists=True)
+    uuids = _get_uuids(objs)
+    registered = registry.get_registry().get_many(uuids.values())
+    session = utils.get_session_id()
 
-        if has_attr:
-            # check for 'rename'
-            goz_id = cmds.getAttr(obj + '.gozbruhBrushID')
+    for obj in objs:
+        record = registered.get(uuids.get(obj))
+        if record is not None and record['session'] == session and \
+                len(cmds.ls(record['uuid']) or []) == 1:
+            # identity is known by key, renames don't matter
+            continue
+        # the object's own ID, or the IDs in its history
+        for goz_id in _gozid_index.get_ids(obj):
             if obj != goz_id:
                 goz_list.append((obj, goz_id))
-        else:
-            # check for old ID in history
-            for old_obj in cmds.listHistory(obj):
-                has_attr = cmds.attributeQuery('gozbruhBrushID',
-                                               node=old_obj,
-                                               exists=True)
-                if has_attr:
-                    goz_id = cmds.getAttr(old_obj + '.gozbruhBrushID')
-                    if obj != goz_id:
-                        goz_list.append((obj, goz_id))
 
     # resulting mismatches to be handled
     return goz_list
@@ -381,21 +1553,51 @@ def _get_gozid_mismatches(objs):
 # Sending / Exporting
 #------------------------------------------------------------------------------
 
-def export(objs):
+def get_export_profile():
+    """Returns the export profile from the 'gozbruh_export_profile'
+    optionVar, 'full' if it is not set or not a profile
+    """
+    if cmds.optionVar(ex='gozbruh_export_profile'):
+        profile = cmds.optionVar(q='gozbruh_export_profile')
+        if export_profiles.get_channels(profile) is not None:
+            return profile
+        print 'ignoring gozbruh_export_profile, not a profile: %r' % profile
+    return export_profiles.DEFAULT_PROFILE
+
+def get_export_channels():
+    """Returns the channels exported and imported, see
+    `get_export_profile`
+    """
+    return export_profiles.get_channels(get_export_profile())
+
+@profiling.profiled('maya.export', profiling.label_objects)
+def export(objs, session=None, use_store=False):
     """Save files.
 
     Checks for gozbruhParent attr.
 
+    Files are saved for the staging directory of `session`, or for the
+    shared directory without one, see `utils.make_maya_filepath`. They are
+    written to local disk, see `get_staged_path`, `MayaToZBrushClient`
+    publishes them.
+
     gozbruhParent is used to import objects in correct order in ZBrush
     gozbruhParent determines the top level tool in ZBrush
 
     If no instance exists, it is created
 
+    Only the channels of the export profile are saved, see
+    `get_export_profile`. Each file is recorded in the object's
+    `history`, if it is kept. The `registry` records where each file is
+    published: its path in the `store` with `use_store`, otherwise its
+    path for `session`.
+
     Returns
     -------
     list of (str, str)
         list of object, parent pairs
     """
+    channels = get_export_channels()
     parents = []
 
     for obj in objs:
@@ -403,12 +1605,9 @@ def export(objs):
         cmds.select(cl=True)
         cmds.select(obj)
         cmds.delete(ch=True)
-        ascii_path = utils.make_maya_filepath(obj)
-        cmds.file(ascii_path,
-                  force=True,
-                  options="v=0",
-                  type="mayaAscii",
-                  exportSelected=True)
+        ascii_path = get_staged_path(obj, session)
+        _export_selected(ascii_path, channels)
+        _recorder.put(obj, ascii_path, 'maya')
         if cmds.attributeQuery('gozbruhParent', node=obj, exists=True):
             # object existed in zbrush, has 'parent' tool
             parent = cmds.getAttr(obj + '.gozbruhParent')
@@ -421,16 +1620,137 @@ def export(objs):
             # imported first
             parents = [(obj, obj)] + parents
 
-        # maya is often run as root, this makes sure osx can open/save
-        # files not needed if maya is run un-privileged
-        os.chmod(ascii_path, 0o777)
+    _record_exports(parents, session, use_store)
     return parents
 
-def send(client=None):
+def export_proxies(objs, ratio, session=None):
+    """Save decimated copies of `objs` for a progressive send.
+
+    Each object is duplicated and reduced to `ratio` of its faces, and
+    saved under the object's name for the proxy directory, see
+    `get_staged_path`. The objects themselves are not changed.
+
+    Returns
+    -------
+    list of (str, str)
+        list of object, parent pairs, in the order `export` returns them
+    """
+    channels = get_export_channels()
+    parents = []
+
+    for obj in objs:
+        proxy = cmds.duplicate(obj, name=obj + '_gozbruhProxy')[0]
+        try:
+            cmds.polyReduce(proxy,
+                            version=1,
+                            percentage=100.0 * (1.0 - ratio),
+                            keepQuadsWeight=1.0,
+                            constructionHistory=False)
+            cmds.select(cl=True)
+            cmds.select(proxy)
+            ascii_path = get_staged_path(obj, session, proxy=True)
+            _export_selected(ascii_path, channels)
+        finally:
+            cmds.delete(proxy)
+
+        if cmds.attributeQuery('gozbruhParent', node=obj, exists=True):
+            parents.append((obj, cmds.getAttr(obj + '.gozbruhParent')))
+        else:
+            # new objects are imported first, see `export`
+            parents = [(obj, obj)] + parents
+
+    return parents
+
+def get_staged_path(obj, session=None, proxy=False):
+    """Returns the local path `obj` is exported to, before it is published
+    to `utils.make_maya_filepath`
+
+    Waits until an earlier export of `obj` that is still being published
+    has been copied, so it can be overwritten.
+    """
+    staged_path = staging.get_staged_path(
+        utils.make_maya_filepath(obj, session, proxy))
+    _publisher.wait_for(staged_path)
+    return staged_path
+
+def _release(sent, staged_paths):
+    """Releases the sent files and the staged files held by
+    `MayaToZBrushClient.make_job`
+    """
+    _sent_files.remove(sent)
+    for staged_path in staged_paths:
+        _publisher.release(staged_path)
+
+def get_publish_stats():
+    """Returns the depth of the publish queue and the timings of the
+    latest publications, see `staging.Publisher.get_stats`
+    """
+    return _publisher.get_stats()
+
+def _export_selected(ascii_path, channels):
+    """Exports the selection to `ascii_path` with only `channels`
+
+    A filtered export is written to a temporary file first, and copied to
+    `ascii_path` with only the channels that are kept.
+    """
+    if not export_profiles.is_filtered(channels):
+        cmds.file(ascii_path,
+                  force=True,
+                  options="v=0",
+                  type="mayaAscii",
+                  exportSelected=True)
+        return
+
+    temp_path = _make_temp_file()
+    try:
+        cmds.file(temp_path,
+                  force=True,
+                  options="v=0",
+                  type="mayaAscii",
+                  exportSelected=True)
+        with trace.span('maya.export_filter'):
+            export_profiles.filter_file(temp_path, ascii_path, channels)
+    finally:
+        os.remove(temp_path)
+
+def _record_exports(obj_parents, session=None, use_store=False):
+    """Records exported objects in the `registry`, keeping the ZBrush
+    subtool of objects that are already registered
+
+    Files published to the `store` are recorded under their store path.
+    """
+    uuids = _get_uuids([obj for obj, _ in obj_parents])
+    reg = registry.get_registry()
+    registered = reg.get_many(uuids.values())
+
+    records = []
+    for obj, parent in obj_parents:
+        uuid = uuids.get(obj)
+        if uuid is None:
+            continue
+        subtool = registered.get(uuid, {}).get('subtool') or obj
+        ascii_path = utils.make_maya_filepath(obj, session)
+        # the staged file, the published one may not be there yet
+        export_hash = registry.hash_file(staging.get_staged_path(ascii_path))
+        if use_store:
+            ascii_path = store.get_store_path(export_hash)
+        records.append((uuid, obj, parent, subtool, ascii_path, export_hash))
+    reg.record_many(records, utils.get_session_id())
+
+def send(client=None, policy=None, interactive=None, wait=False):
     """Send the current selection in Maya to ZBrush.
 
+    Returns once the selection is exported, the files are published and sent
+    in the background unless `wait` is True, see `MayaToZBrushClient.send`.
+
     client : `MayaToZBrushClient`
         client running in Maya, which can connect to `ZBrushServer`
+    policy : str
+        (optional) name conflict policy, see `handle_renames`
+    interactive : bool
+        (optional) False resolves name conflicts without any dialog
+    wait : bool
+        (optional) True returns only once ZBrush loaded the selection
     """
     pre_btn_script = utils.get_maya_exec_script()
     # Updates the config files if necessary
@@ -451,9 +1771,9 @@ def send(client=None):
     # construct list of selection, filter meshes
     objs = get_goz_objs()
     if objs:
-        objs = handle_renames(objs)
+        objs = handle_renames(objs, policy=policy, interactive=interactive)
         with utils.err_handler(error_gui):
-            client.send(objs)
+            client.send(objs, wait=wait)
     else:
         error_gui('Please select a mesh to send')
 
@@ -461,7 +1781,10 @@ def send(client=None):
 # Receiving / Importing
 #------------------------------------------------------------------------------
 
-def load(file_path, obj_name, parent_name):
+@profiling.profiled('maya.load',
+                    lambda file_path, obj_name, parent_name, proxy=False:
+                    obj_name)
+def load(file_path, obj_name, parent_name, proxy=False):
     """Import a file exported from ZBrush.
 
     This is the command sent over the Maya command port from ZBrush.
@@ -474,43 +1797,518 @@ def load(file_path, obj_name, parent_name):
         Name of the object being imported
     parent_name : str
         Name of the parent for the object being imported
+    proxy : bool
+        True if the file is the proxy of a progressive send
+    """
+    load_many([(file_path, obj_name, parent_name)], proxy=proxy)
+
+@profiling.profiled('maya.load_many', lambda entries, proxy=False:
+                    profiling.label_objects(entry[1] for entry in entries))
+def load_many(entries, proxy=False):
+    """Import several files exported from ZBrush in a single pass.
+
+    This is the batched form of `load`, sent by ZBrush for send-all. The
+    viewport refresh is suspended and all imports share one undo chunk, so
+    the per-object overhead is paid once for the whole batch.
+
+    Parameters
+    ----------
+    entries : list of (str, str, str)
+        (file_path, obj_name, parent_name) for each object to import. If an
+        object appears more than once, only its last entry is imported.
+    proxy : bool
+        True if the files are the proxies of a progressive send. The
+        imported objects are marked with a gozbruhProxy attribute, and are
+        deleted by the import that replaces them, see `_cleanup_many`.
+    """
+    # keep the last entry per object, but preserve the send order
+    by_name = {}
+    for entry in entries:
+        by_name[entry[1]] = entry
+    entries = [entry for entry in entries if by_name[entry[1]] is entry]
+    if not entries:
+        return
+
+    # objects renamed in maya since they were sent to zbrush replace the
+    # registered node, and keep its name
+    renames = _get_registered_names(entries)
+    channels = get_export_channels()
+    temp_paths = []
+
+    cmds.refresh(suspend=True)
+    cmds.undoInfo(openChunk=True, chunkName='gozbruh_load_many')
+    try:
+        with trace.span('maya.cleanup', objects=len(entries)):
+            # files from the store are named by their digest
+            _cleanup_many([obj_name for _, obj_name, _ in entries] +
+                          renames.values())
+        for file_path, obj_name, _ in entries:
+            if export_profiles.is_filtered(channels):
+                # import a copy with only the channels of the profile
+                temp_paths.append(_make_temp_file())
+                with trace.span('maya.import_filter', obj=obj_name):
+                    export_profiles.filter_file(file_path, temp_paths[-1],
+                                                channels)
+                file_path = temp_paths[-1]
+            with trace.span('maya.import', obj=obj_name):
+                cmds.file(file_path, i=True,
+                          usingNamespaces=False,
+                          removeDuplicateNetworks=True)
+
+        obj_parents = []
+        for _, obj_name, parent_name in entries:
+            if obj_name in renames:
+                obj_parents.append((cmds.rename(obj_name, renames[obj_name]),
+                                    parent_name))
+            else:
+                obj_parents.append((obj_name, parent_name))
+
+        obj_names = [obj_name for obj_name, _ in obj_parents]
+        if cmds.optionVar(ex='gozbruh_smooth') and not cmds.optionVar(q='gozbruh_smooth'):
+            cmds.displaySmoothness(obj_names, du=0, dv=0, pw=4, ps=1, po=1)
+        if 'materials' not in channels:
+            # meshes without a shading group do not draw shaded
+            cmds.sets(obj_names, e=True, forceElement='initialShadingGroup')
+
+        _set_parents(obj_parents)
+        if proxy:
+            _set_proxies(obj_names)
+        _record_imports(entries, obj_parents)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+        cmds.refresh(suspend=False)
+        for temp_path in temp_paths:
+            os.remove(temp_path)
+    cmds.refresh()
+
+def load_version(obj_name, version, parent_name=None):
+    """Replaces `obj_name` with version `version` from its `history`
+
+    Parameters
+    ----------
+    obj_name : str
+        name the object was exchanged as
+    version : int
+        version number, see `history.get_versions`
+    parent_name : str
+        (optional) parent of the object, its current gozbruhParent by
+        default
+
+    Raises
+    ------
+    errs.HistoryError
+        there is no such version
+    """
+    if parent_name is None:
+        parent_name = obj_name
+        if cmds.objExists(obj_name) and cmds.attributeQuery(
+                'gozbruhParent', node=obj_name, exists=True):
+            parent_name = cmds.getAttr(obj_name + '.gozbruhParent')
+    temp_path = _make_temp_file()
+    try:
+        history.restore(obj_name, version, temp_path)
+        load(temp_path, obj_name, parent_name)
+    finally:
+        os.remove(temp_path)
+
+def _get_registered_names(entries):
+    """Returns a dict of obj_name -> current maya name, for entries whose
+    subtool is registered to a maya node with a different name
+
+    Only records of this session are used, the most recent one whose UUID
+    names a single node of the scene.
+    """
+    reg = registry.get_registry()
+    session = utils.get_session_id()
+    renames = {}
+    for _, obj_name, parent_name in entries:
+        for record in reg.find_subtool(obj_name, parent_name, session):
+            nodes = cmds.ls(record['uuid']) or []
+            if len(nodes) == 1:
+                if nodes[0] != obj_name:
+                    renames[obj_name] = nodes[0]
+                break
+    return renames
+
+def _record_imports(entries, obj_parents):
+    """Records imported objects in the `registry` under the subtool they
+    came from
+    """
+    uuids = _get_uuids([obj for obj, _ in obj_parents])
+    records = []
+    for (file_path, subtool, _), (obj, parent) in zip(entries, obj_parents):
+        if obj in uuids:
+            records.append((uuids[obj], obj, parent, subtool, file_path, None))
+    registry.get_registry().record_many(records, utils.get_session_id())
+
+def queue_load(file_path, obj_name, parent_name, proxy=False):
+    """Queue a file exported from ZBrush to be imported while Maya is idle.
+
+    Takes the same arguments as `load` and returns right away, see
+    `ImportQueue`.
+
+    Returns
+    -------
+    int
+        number of objects waiting to be imported
+    """
+    _import_queue.put(file_path, obj_name, parent_name, proxy)
+    _import_queue.schedule()
+    return len(_import_queue.pending)
+
+def queue_load_many(entries, proxy=False):
+    """Queue several files exported from ZBrush, see `queue_load`
+
+    Parameters
+    ----------
+    entries : list of (str, str, str)
+        (file_path, obj_name, parent_name) for each object to import
+    proxy : bool
+        True if the files are the proxies of a progressive send
+
+    Returns
+    -------
+    int
+        number of objects waiting to be imported
     """
-    file_name = utils.split_file_name(file_path)
-    _cleanup(file_name)
-    cmds.file(file_path, i=True,
-              usingNamespaces=False,
-              removeDuplicateNetworks=True)
+    for file_path, obj_name, parent_name in entries:
+        _import_queue.put(file_path, obj_name, parent_name, proxy)
+    _import_queue.schedule()
+    return len(_import_queue.pending)
 
-    # Set smoothing options if necessary
-    if cmds.optionVar(ex='gozbruh_smooth') and not cmds.optionVar(q='gozbruh_smooth'):
-        cmds.displaySmoothness(obj_name, du=0, dv=0, pw=4, ps=1, po=1)
+def get_import_queue_stats():
+    """Returns the depth and wait times of the idle import queue
+    """
+    return _import_queue.get_stats()
+
+def _set_parents(obj_parents):
+    """Sets the gozbruhParent attribute on each object, creating the
+    attribute in one call for all objects that are missing it.
 
-    if not cmds.attributeQuery("gozbruhParent", n=obj_name, ex=True):
-        cmds.addAttr(obj_name, longName='gozbruhParent', dataType='string')
-    cmds.setAttr(obj_name + '.gozbruhParent', parent_name, type='string')
+    Parameters
+    ----------
+    obj_parents : list of (str, str)
+        list of object, parent pairs
+    """
+    plugs = [obj + '.gozbruhParent' for obj, _ in obj_parents]
+    existing = set(cmds.ls(plugs) or [])
+    missing = [obj for obj, _ in obj_parents
+               if obj + '.gozbruhParent' not in existing]
+    if missing:
+        cmds.addAttr(missing, longName='gozbruhParent', dataType='string')
+    # string attributes can't be set on several plugs at once
+    for obj, parent in obj_parents:
+        cmds.setAttr(obj + '.gozbruhParent', parent, type='string')
+
+def _set_proxies(names):
+    """Marks objects imported from proxy files with a gozbruhProxy
+    attribute
+    """
+    existing = set(cmds.ls([name + '.gozbruhProxy' for name in names]) or [])
+    missing = [name for name in names
+               if name + '.gozbruhProxy' not in existing]
+    if missing:
+        cmds.addAttr(missing, longName='gozbruhProxy', attributeType='bool',
+                     defaultValue=True)
 
 def _cleanup(name):
     """Removes un-used nodes on import of obj
     """
+    _cleanup_many([name])
+
+def _cleanup_many(names):
+    """Removes un-used nodes on import of several objs
+
+    Existence checks are done with one `ls` and removal with one `delete`
+    for the meshes, then again for the garbage nodes, instead of an
+    `objExists`/`delete` per node.
+    """
+    existing = cmds.ls(names) or []
 
     # Don't delete the old mesh if gozbruh_delete option var exists and is set to
-    #     false, simply rename it
-    if cmds.optionVar(ex='gozbruh_delete') and not cmds.optionVar(q='gozbruh_delete'):
-        if cmds.objExists(name):
-            cmds.rename(name, name + '_old')
+    #     false, simply rename it. Proxies are always deleted, they only stand
+    #     in for the mesh replacing them.
+    if existing and cmds.optionVar(ex='gozbruh_delete') and not cmds.optionVar(q='gozbruh_delete'):
+        proxies = set(plug.rsplit('.', 1)[0] for plug in cmds.ls(
+            [name + '.gozbruhProxy' for name in existing]) or [])
+        for name in existing:
+            if name not in proxies:
+                cmds.rename(name, name + '_old')
+        existing = [name for name in existing if name in proxies]
+    if existing:
+        cmds.delete(existing)
+
+    # deleting the meshes may have taken some of these with them
+    garbage = cmds.ls([name + '_' + node
+                       for name in names
+                       for node in GARBAGE_NODES]) or []
+    if garbage:
+        cmds.delete(garbage)
+
+#------------------------------------------------------------------------------
+# Command Server
+#------------------------------------------------------------------------------
+
+_import_queue = ImportQueue()
+_publisher = staging.Publisher()
+_sent_files = SentFiles()
+_recorder = history.Recorder()
+
+# commands accepted by MayaCommandServer, run on the main thread
+COMMANDS = {
+    'ping': lambda: 'pong',
+    'load': load,
+    'load_many': load_many,
+    'queue_load': queue_load,
+    'queue_load_many': queue_load_many,
+}
+
+# commands told by the request whether they load proxies
+_PROXY_COMMANDS = ('load', 'load_many', 'queue_load', 'queue_load_many')
+
+_command_server = None
+_command_server_thread = None
+
+def start_command_server(host, port):
+    """Starts the `MayaCommandServer` on a background thread, unless it is
+    already running.
+    """
+    global _command_server, _command_server_thread
+
+    if _command_server is not None:
+        return
+
+    _command_server = MayaCommandServer((host, int(port)))
+    _command_server_thread = Thread(target=_command_server.serve_forever)
+    _command_server_thread.daemon = True
+    _command_server_thread.start()
+    print 'listening for commands %s:%s' % (host, port)
+
+def stop_command_server():
+    """Stops the `MayaCommandServer` if it is running
+    """
+    global _command_server, _command_server_thread
+
+    if _command_server is None:
+        return
+
+    _command_server.shutdown()
+    _command_server.server_close()
+    _command_server = None
+    _command_server_thread = None
+
+def _run_request(request, server=None):
+    """Runs one request and builds its reply, `server` is the
+    `MayaCommandServer` keeping the statistics
+    """
+    command = request.get('command')
+    args = request.get('args') or {}
+    if request.get('proxy') and command in _PROXY_COMMANDS:
+        args = dict(args, proxy=True)
+    trace_id = request.get('trace')
+    received = time.time()
+
+    if command == 'stats':
+        # does not touch the scene, no need for the main thread
+        result = server.get_stats() if server is not None else {}
+        result['import_queue'] = get_import_queue_stats()
+        result['publish'] = get_publish_stats()
+        ok, started = True, received
+    elif command in COMMANDS:
+        ok, result, started = maya.utils.executeInMainThreadWithResult(
+            _run_command, command, args, trace_id)
     else:
-        if cmds.objExists(name):
-            cmds.delete(name)
+        ok, result, started = (False,
+                               'Unknown command: %s' % command,
+                               received)
+    finished = time.time()
+
+    timings = {'wait': started - received,
+               'run': finished - started}
+    if server is not None:
+        server.record(command, ok, timings)
+    if trace_id is not None:
+        trace.record('maya.command_wait', received, timings['wait'],
+                     trace_id, command=command)
+        trace.record('maya.command_run', started, timings['run'],
+                     trace_id, command=command, ok=ok)
+    return {'id': request.get('id'),
+            'ok': ok,
+            'result': result if ok else None,
+            'error': None if ok else result,
+            'timings': timings}
+
+def _run_command(command, args, trace_id=None):
+    """Runs a command from `COMMANDS`, called on the main thread.
+
+    `trace_id` is the current trace while the command runs.
 
-    for node in GARBAGE_NODES:
-        node = name + '_' + node
-        if cmds.objExists(node):
-            cmds.delete(node)
+    Returns
+    -------
+    (bool, object, float)
+        success, result or error message, and when the command started
+    """
+    started = time.time()
+    trace.set_trace_id(trace_id)
+    try:
+        return True, COMMANDS[command](**args), started
+    except Exception as err:
+        return False, '%s: %s' % (type(err).__name__, err), started
+    finally:
+        trace.set_trace_id(None)
+
+#------------------------------------------------------------------------------
+# Channel
+#------------------------------------------------------------------------------
+
+_channel = None
+
+def start_channel():
+    """Starts maya's `MayaChannel` to ZBrushServer, unless it is already
+    running
+
+    Returns
+    -------
+    `MayaChannel`
+    """
+    global _channel
+
+    if _channel is None:
+        host, port = utils.get_net_info(utils.ZBRUSH_ENV)
+        _channel = MayaChannel(host, port, utils.get_session_id())
+        _channel.start()
+    return _channel
+
+def stop_channel():
+    """Stops maya's `MayaChannel` if it is running
+    """
+    global _channel
+
+    if _channel is None:
+        return
+
+    _channel.stop()
+    _channel = None
+
+#------------------------------------------------------------------------------
+# Relay
+#------------------------------------------------------------------------------
+
+_relay_receiver = None
+
+def start_relay_receiver():
+    """Receives ZBrush's requests from the relay on a background thread,
+    if a relay is configured and the receiver is not running yet
+    """
+    global _relay_receiver
+
+    if _relay_receiver is not None:
+        return
+
+    _relay_receiver = relay.start_receiver('maya', _relay_delivery,
+                                           _relay_file_dir)
+
+def stop_relay_receiver():
+    """Stops receiving from the relay
+    """
+    global _relay_receiver
+
+    if _relay_receiver is None:
+        return
+
+    _relay_receiver.stop()
+    _relay_receiver = None
+
+def _relay_file_dir(message, sender):
+    """Files from the relay are kept apart per sending session
+    """
+    file_dir = utils.get_session_dir(sender.get('session') or 'relay')
+    if message.get('proxy'):
+        return utils.get_proxy_dir(file_dir)
+    return file_dir
+
+def _relay_delivery(message, paths, sender):
+    """Runs a request delivered by the relay, its file paths are replaced
+    by where the files were received
+
+    Chunks of large files are stored until the request they belong to
+    arrives, see `gozbruh.chunks`.
+
+    Returns
+    -------
+    (bool, dict)
+        success and the reply, as the command server sends it
+    """
+    file_dir = _relay_file_dir(message, sender)
+    handled = chunks.receive(message, paths, file_dir)
+    if handled is not None:
+        return handled
+    paths = paths + chunks.join_all(message, file_dir)
+
+    received = dict((os.path.basename(path), path) for path in paths)
+    args = message.get('args') or {}
+    if 'file_path' in args:
+        args['file_path'] = received.get(
+            os.path.basename(args['file_path']), args['file_path'])
+    if 'entries' in args:
+        args['entries'] = [
+            [received.get(os.path.basename(file_path), file_path),
+             obj_name, parent_name]
+            for file_path, obj_name, parent_name in args['entries']]
+
+    reply = _run_request(message, _command_server)
+    return reply['ok'], reply
+
+#------------------------------------------------------------------------------
+# Lifecycle
+#------------------------------------------------------------------------------
+
+_collector = None
+
+def start_collector():
+    """Removes stale files from the shared directory in the background,
+    see `lifecycle.Collector`
+    """
+    global _collector
+    if _collector is None:
+        _collector = lifecycle.Collector(_get_pending_files)
+        _collector.start()
+
+def stop_collector():
+    """Stops removing stale files
+    """
+    global _collector
+    if _collector is not None:
+        _collector.stop()
+        _collector = None
+
+def _get_pending_files():
+    """Returns the files that are waiting to be imported or published, and
+    those sent to ZBrush that it has not answered yet
+    """
+    return _import_queue.get_pending_files() + \
+        _publisher.get_pending_files() + _sent_files.get_files()
 
 #------------------------------------------------------------------------------
 # Helpers
 #------------------------------------------------------------------------------
 
+def _get_node_name(node):
+    """Returns the name `cmds.ls` lists the node `node`, an MObject, as
+    """
+    import maya.OpenMaya as om
+
+    if node.hasFn(om.MFn.kDagNode):
+        return om.MDagPath.getAPathTo(node).partialPathName()
+    return om.MFnDependencyNode(node).name()
+
+def _make_temp_file():
+    """Returns the path of a new, empty local mayaAscii file
+    """
+    handle, temp_path = tempfile.mkstemp(prefix='gozbruh_', suffix='.ma')
+    os.close(handle)
+    return temp_path
+
 def error_gui(message):
     """Simple gui for displaying errors
     """
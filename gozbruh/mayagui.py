@@ -5,10 +5,13 @@
 import os
 import sys
 
-import pymel.core as pm
+from . import export_profiles
 from . import maya_tools
 from . import utils
 
+# pymel is slow to import, load it when the window is built
+pm = utils.LazyModule('pymel.core')
+
 
 class Win(object):
     """GUI for maya_tools
@@ -290,6 +293,28 @@ class Win(object):
             self.delete_radio_col, e=True,
             sl=self.delete_radio_on if import_delete else self.delete_radio_off)
 
+        pm.text(label='Name Conflicts', width=200)
+        self.conflict_menu = pm.optionMenu(
+            cc=lambda x: pm.optionVar(sv=('gozbruh_conflict_policy', x)))
+        for policy in maya_tools.CONFLICT_POLICIES:
+            pm.menuItem(label=policy)
+        self.conflict_menu.setValue(maya_tools.get_conflict_policy())
+        pm.text(label='')
+
+        pm.text(label='Export Profile', width=200)
+        self.profile_menu = pm.optionMenu(
+            cc=lambda x: pm.optionVar(sv=('gozbruh_export_profile', x)))
+        profiles = sorted(export_profiles.EXPORT_PROFILES,
+                          key=lambda name: len(export_profiles.EXPORT_PROFILES[name]))
+        export_profile = maya_tools.get_export_profile()
+        if export_profile not in profiles:
+            # channels joined by '+', set with the optionVar
+            profiles.append(export_profile)
+        for profile in profiles:
+            pm.menuItem(label=profile)
+        self.profile_menu.setValue(export_profile)
+        pm.text(label='')
+
         pm.setParent(main_layout)
         self.retain_btn = pm.button(label="Save Settings", height=50)
         pm.text('\t')
@@ -0,0 +1,180 @@
+"""
+Opt-in profiling of the export, handle and load hot paths
+
+Functions decorated with `profiled` run under cProfile while profiling is
+on, and each call dumps its profile to CONFIG_PATH/profiles, named by
+timestamp, function and object:
+    20240131-142501.123_maya.export_pSphere1.prof
+
+Profiling is off by default. Turn it on with GOZBRUH_PROFILE=1, or by
+writing 1 to the Profile config file, which takes effect without a
+restart:
+    python cmd.py profile on
+
+Profiles are read with pstats:
+    python -m pstats 20240131-142501.123_maya.export_pSphere1.prof
+
+The oldest profiles are removed once there are more than
+PROFILE_MAX_FILES or they take more than PROFILE_MAX_BYTES.
+
+Constants
+---------
+PROFILE_DIR : str
+    Name of the profile directory in CONFIG_PATH
+PROFILE_MAX_FILES : int
+    Number of profiles kept
+PROFILE_MAX_BYTES : int
+    Total size of the profiles kept
+PROFILE_RECHECK : float
+    Seconds the Profile config file is trusted before it is read again
+"""
+
+import os
+import re
+import time
+import cProfile
+import threading
+from functools import wraps
+
+from . import utils
+
+PROFILE_DIR = 'profiles'
+PROFILE_MAX_FILES = 200
+PROFILE_MAX_BYTES = 100 * 1024 * 1024
+PROFILE_RECHECK = 1.0
+
+_local = threading.local()
+# (time of the last check, result)
+_config_state = [0.0, False]
+_rotate_lock = threading.Lock()
+
+
+def is_enabled():
+    """Returns True if profiling is turned on by the environment or the
+    Profile config file
+
+    The config file is read at most once per PROFILE_RECHECK seconds, so
+    this is cheap enough to call on every profiled call.
+    """
+    if utils.PROFILE_ENV in os.environ:
+        return utils.is_profiling_enabled()
+
+    now = time.time()
+    if now - _config_state[0] > PROFILE_RECHECK:
+        _config_state[:] = [now, utils.is_profiling_enabled()]
+    return _config_state[1]
+
+
+def get_profile_dir():
+    """Returns the directory profiles are written to
+    """
+    return os.path.join(utils.CONFIG_PATH, PROFILE_DIR)
+
+
+def profiled(name, get_label=None):
+    """Decorator profiling each call of a function while profiling is on
+
+    Calls made while a profile of the same thread is running are part of
+    that profile, and are not profiled on their own.
+
+    Parameters
+    ----------
+    name : str
+        name of the profiled stage: 'maya.export'
+    get_label : callable
+        (optional) called with the function's arguments, returns the
+        object(s) the call works on, for the file name
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'active', False) or not is_enabled():
+                return func(*args, **kwargs)
+
+            label = ''
+            if get_label is not None:
+                try:
+                    label = get_label(*args, **kwargs)
+                except Exception:
+                    pass
+
+            profile = cProfile.Profile()
+            _local.active = True
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                _local.active = False
+                dump(profile, name, label)
+        return wrapper
+    return decorator
+
+
+def label_objects(objs):
+    """Label for a list of objects: the first one, and how many others
+    """
+    objs = list(objs)
+    if not objs:
+        return ''
+    if len(objs) == 1:
+        return objs[0]
+    return '%s+%d' % (objs[0], len(objs) - 1)
+
+
+def dump(profile, name, label=''):
+    """Writes `profile` to the profile directory and rotates old profiles
+
+    Returns
+    -------
+    str or None
+        path of the profile, None if it could not be written
+    """
+    now = time.time()
+    file_name = '%s.%03d_%s' % (time.strftime('%Y%m%d-%H%M%S',
+                                              time.localtime(now)),
+                                int(now % 1 * 1000), name)
+    if label:
+        file_name += '_' + re.sub(r'[^\w.+-]', '_', label)[:64]
+    profile_dir = get_profile_dir()
+    path = os.path.join(profile_dir, '%s_%d.prof' % (file_name, os.getpid()))
+    try:
+        if not os.path.exists(profile_dir):
+            os.makedirs(profile_dir)
+        profile.dump_stats(path)
+    except (IOError, OSError) as err:
+        print 'could not write profile: %s' % err
+        return None
+    rotate()
+    return path
+
+
+def rotate(max_files=None, max_bytes=None):
+    """Removes the oldest profiles beyond `max_files` or `max_bytes`
+    """
+    if max_files is None:
+        max_files = PROFILE_MAX_FILES
+    if max_bytes is None:
+        max_bytes = PROFILE_MAX_BYTES
+
+    profile_dir = get_profile_dir()
+    with _rotate_lock:
+        try:
+            profiles = []
+            for file_name in os.listdir(profile_dir):
+                if not file_name.endswith('.prof'):
+                    continue
+                path = os.path.join(profile_dir, file_name)
+                st = os.stat(path)
+                profiles.append((st.st_mtime, st.st_size, path))
+        except OSError:
+            return
+
+        profiles.sort(reverse=True)
+        kept_bytes = 0
+        for index, (_, size, path) in enumerate(profiles):
+            kept_bytes += size
+            if index < max_files and kept_bytes <= max_bytes:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,261 @@
+"""
+Framed JSON messages exchanged between gozbruh processes
+
+Each message is a 4 byte big-endian length followed by that many bytes of
+JSON. Requests look like:
+    {"id": 0, "command": "load", "args": {...}}
+
+and replies like:
+    {"id": 0, "ok": true, "result": ..., "error": null, "timings": {...}}
+
+Files are streamed after the message that announces their sizes, as raw
+bytes, in CHUNK_SIZE pieces (see `send_file` and `recv_chunks`).
+
+On a `Channel` both ends send requests, and tell replies apart by the
+missing 'command'.
+
+Constants
+---------
+HEADER : struct.Struct
+    Struct used to pack/unpack the length prefix
+MAX_MESSAGE_SIZE : int
+    Largest payload accepted, guards against reading garbage as a length
+CHUNK_SIZE : int
+    Size of the pieces files are streamed in
+"""
+
+import os
+import json
+import socket
+import struct
+import threading
+
+from . import errs
+
+HEADER = struct.Struct('!I')
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def send_message(sock, data):
+    """Serializes `data` to JSON and sends it on `sock` as one frame
+    """
+    payload = json.dumps(data)
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock):
+    """Reads one frame from `sock` and returns the decoded JSON
+
+    Returns
+    -------
+    object or None
+        decoded message, None if the peer closed the connection cleanly
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    size = HEADER.unpack(header)[0]
+    if size > MAX_MESSAGE_SIZE:
+        raise errs.ProtocolError('Message too large: %d bytes' % size)
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        raise errs.ProtocolError('Connection closed mid-message')
+    return json.loads(payload)
+
+
+def is_framed(buf):
+    """Returns True if `buf` starts with a frame rather than an unframed
+    message
+
+    Readers that accept both tell them apart by the first byte: a frame
+    header starts with a byte of at most MAX_MESSAGE_SIZE >> 24, JSON and
+    the bare 'check'/'EXIT' commands with printable characters.
+    """
+    return ord(buf[0]) <= MAX_MESSAGE_SIZE >> 24
+
+
+def split_message(buf):
+    """Splits one frame off the front of `buf`
+
+    Returns
+    -------
+    (object or None, str)
+        decoded message, None if `buf` does not hold a whole frame yet,
+        and the rest of `buf`
+    """
+    if len(buf) < HEADER.size:
+        return None, buf
+    size = HEADER.unpack(buf[:HEADER.size])[0]
+    if size > MAX_MESSAGE_SIZE:
+        raise errs.ProtocolError('Message too large: %d bytes' % size)
+    end = HEADER.size + size
+    if len(buf) < end:
+        return None, buf
+    return json.loads(buf[HEADER.size:end]), buf[end:]
+
+
+def _recv_exactly(sock, size):
+    """Reads exactly `size` bytes from `sock`, None if closed before any
+    data arrives
+    """
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            if remaining == size:
+                return None
+            raise errs.ProtocolError('Connection closed mid-message')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return ''.join(chunks)
+
+
+def send_file(sock, path, size):
+    """Streams the first `size` bytes of the file at `path` on `sock`
+
+    `size` is what was announced to the peer, if the file is shorter the
+    stream can not be completed and the connection must be closed.
+    """
+    remaining = size
+    file_read = open(path, 'rb')
+    try:
+        while remaining:
+            chunk = file_read.read(min(remaining, CHUNK_SIZE))
+            if not chunk:
+                raise errs.ProtocolError('%s is shorter than announced' % path)
+            sock.sendall(chunk)
+            remaining -= len(chunk)
+    finally:
+        file_read.close()
+
+
+def recv_chunks(sock, size):
+    """Yields the next `size` bytes from `sock`, in pieces of at most
+    CHUNK_SIZE
+    """
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, CHUNK_SIZE))
+        if not chunk:
+            raise errs.ProtocolError('Connection closed mid-file')
+        remaining -= len(chunk)
+        yield chunk
+
+
+def recv_file(sock, size, path):
+    """Writes the next `size` bytes from `sock` to `path`
+
+    The data is written to a temporary file next to `path` first, so
+    readers never see a partial file.
+    """
+    temp_path = '%s.%d.%d.part' % (path, os.getpid(),
+                                   threading.current_thread().ident)
+    file_write = open(temp_path, 'wb')
+    try:
+        for chunk in recv_chunks(sock, size):
+            file_write.write(chunk)
+    except:
+        file_write.close()
+        os.remove(temp_path)
+        raise
+    file_write.close()
+    if os.name == 'nt' and os.path.exists(path):
+        # os.rename does not replace files on windows
+        os.remove(path)
+    os.rename(temp_path, path)
+
+
+class Channel(object):
+    """Framed messages in both directions on one socket
+
+    Either side can send requests at any time. Requests carry a 'command',
+    replies do not, and are matched to their request by 'id'. One thread
+    reads the socket and hands replies to `dispatch_reply`, any thread can
+    send.
+
+    Attributes
+    ----------
+    sock : socket.socket
+        the connection
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.waiting = {}
+        self.closed = False
+
+    def send(self, data):
+        """Sends one message
+        """
+        with self.send_lock:
+            send_message(self.sock, data)
+
+    def request(self, data, timeout=None):
+        """Sends a request and waits for its reply
+
+        Returns
+        -------
+        dict
+            the reply, its 'id' is the one the request had
+
+        Raises
+        ------
+        errs.ReplyTimeoutError
+            no reply arrived within `timeout`
+        errs.ProtocolError
+            the channel closed first
+        """
+        event = threading.Event()
+        with self.lock:
+            if self.closed:
+                raise errs.ProtocolError('Channel closed')
+            request_id = self.next_id
+            self.next_id += 1
+            self.waiting[request_id] = [event, None]
+        original_id = data.get('id')
+        data = dict(data, id=request_id)
+        answered = False
+        try:
+            self.send(data)
+            answered = event.wait(timeout)
+        finally:
+            with self.lock:
+                reply = self.waiting.pop(request_id)[1]
+        if reply is None and not answered:
+            raise errs.ReplyTimeoutError('No reply to %s within %ss' % (
+                data.get('command'), timeout))
+        if reply is None:
+            raise errs.ProtocolError('Channel closed before the reply to %s'
+                                     % data.get('command'))
+        reply['id'] = original_id
+        return reply
+
+    def dispatch_reply(self, reply):
+        """Hands a received reply to the request waiting for it
+        """
+        with self.lock:
+            waiter = self.waiting.get(reply.get('id'))
+            if waiter is None:
+                return
+            waiter[1] = reply
+        waiter[0].set()
+
+    def close(self):
+        """Closes the socket, requests still waiting fail
+        """
+        with self.lock:
+            self.closed = True
+            waiters = self.waiting.values()
+        for event, _ in waiters:
+            event.set()
+        try:
+            # wakes up the thread reading the socket, close alone does not
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
@@ -0,0 +1,239 @@
+"""
+Persistent object identity registry shared by Maya and ZBrush
+
+Maps Maya node UUIDs to the ZBrush tool/subtool they were exchanged as,
+along with the hash and path of the last exported file. Names can change on
+either side, the UUID and subtool keys let both sides find an object
+without comparing names or walking history.
+
+The registry is a SQLite file in the shared directory so that both
+machines see the same records.
+
+Constants
+---------
+REGISTRY_FILE : str
+    File name of the registry inside the shared directory
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+from threading import Lock
+
+from . import utils
+
+REGISTRY_FILE = '.gozbruh_registry.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    uuid TEXT PRIMARY KEY,
+    maya_name TEXT,
+    tool TEXT,
+    subtool TEXT,
+    export_hash TEXT,
+    file_path TEXT,
+    updated REAL,
+    session TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_subtool ON objects (subtool, tool);
+"""
+
+_FIELDS = ('uuid', 'maya_name', 'tool', 'subtool', 'export_hash',
+           'file_path', 'updated', 'session')
+
+_registry = None
+
+
+class Registry(object):
+    """SQLite backed table of exchanged objects, keyed by Maya UUID.
+
+    Records are dicts with the keys: uuid, maya_name, tool, subtool,
+    export_hash, file_path, updated and session. The session is the
+    `utils.get_session_id` of the maya that recorded the object, the
+    registry is shared by every artist and machine.
+
+    Database errors (a locked file on a busy share, for example) are
+    printed and treated as missing records, so a broken registry never
+    stops a send.
+
+    Attributes
+    ----------
+    path : str
+        path to the SQLite file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self.lock = Lock()
+
+    def connect(self):
+        """Opens the database, creating it if necessary
+        """
+        if self.conn is None:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            # used from the servers' handler threads, guarded by self.lock
+            self.conn = sqlite3.connect(self.path, timeout=10,
+                                        check_same_thread=False)
+            self.conn.executescript(_SCHEMA)
+            columns = [row[1] for row in
+                       self.conn.execute('PRAGMA table_info(objects)')]
+            if 'session' not in columns:
+                # registries from before sessions were recorded
+                self.conn.execute(
+                    'ALTER TABLE objects ADD COLUMN session TEXT')
+        return self.conn
+
+    def close(self):
+        """Closes the database
+        """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _execute(self, sql, params=(), many=False):
+        """Runs `sql` and returns the resulting rows as records
+        """
+        try:
+            with self.lock:
+                conn = self.connect()
+                with conn:
+                    if many:
+                        cursor = conn.executemany(sql, params)
+                    else:
+                        cursor = conn.execute(sql, params)
+                    rows = cursor.fetchall()
+        except sqlite3.Error as err:
+            print 'gozbruh registry error (%s): %s' % (self.path, err)
+            return []
+        return [dict(zip(_FIELDS, row)) for row in rows]
+
+    def record(self, uuid, maya_name, tool, subtool, file_path=None,
+               export_hash=None, session=None):
+        """Adds or replaces the record for `uuid`
+        """
+        self.record_many([(uuid, maya_name, tool, subtool, file_path,
+                           export_hash)], session)
+
+    def record_many(self, records, session=None):
+        """Adds or replaces several records at once
+
+        Parameters
+        ----------
+        records : list of tuple
+            (uuid, maya_name, tool, subtool, file_path, export_hash)
+        session : str
+            (optional) session the objects were recorded in
+        """
+        now = time.time()
+        self._execute(
+            'INSERT OR REPLACE INTO objects '
+            '(uuid, maya_name, tool, subtool, file_path, export_hash, '
+            'updated, session) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [tuple(record) + (now, session) for record in records],
+            many=True)
+
+    def get(self, uuid):
+        """Returns the record for `uuid`, None if there is none
+        """
+        rows = self._execute('SELECT %s FROM objects WHERE uuid = ?'
+                             % ', '.join(_FIELDS), (uuid,))
+        return rows[0] if rows else None
+
+    def get_many(self, uuids):
+        """Returns a dict of uuid -> record for the registered `uuids`
+        """
+        found = {}
+        uuids = list(uuids)
+        # stay below sqlite's limit on query parameters
+        for start in range(0, len(uuids), 500):
+            chunk = uuids[start:start + 500]
+            rows = self._execute(
+                'SELECT %s FROM objects WHERE uuid IN (%s)'
+                % (', '.join(_FIELDS), ', '.join('?' * len(chunk))),
+                chunk)
+            for row in rows:
+                found[row['uuid']] = row
+        return found
+
+    def get_all(self):
+        """Returns every record
+        """
+        return self._execute('SELECT %s FROM objects' % ', '.join(_FIELDS))
+
+    def get_by_subtool(self, subtool, tool=None, session=None):
+        """Returns the most recent record for a ZBrush subtool, None if there
+        is none
+
+        Parameters
+        ----------
+        subtool : str
+            subtool name
+        tool : str
+            (optional) parent tool name, narrows the search
+        session : str
+            (optional) session the object was recorded in, narrows the
+            search
+        """
+        rows = self.find_subtool(subtool, tool, session)
+        return rows[0] if rows else None
+
+    def find_subtool(self, subtool, tool=None, session=None):
+        """Returns every record for a ZBrush subtool, most recent first,
+        see `get_by_subtool`
+        """
+        sql = 'SELECT %s FROM objects WHERE subtool = ?' % ', '.join(_FIELDS)
+        params = [subtool]
+        if tool is not None:
+            sql += ' AND tool = ?'
+            params.append(tool)
+        if session is not None:
+            sql += ' AND session = ?'
+            params.append(session)
+        return self._execute(sql + ' ORDER BY updated DESC', params)
+
+    def set_subtool(self, uuid, subtool):
+        """Changes the ZBrush subtool `uuid` is exchanged as
+        """
+        self._execute('UPDATE objects SET subtool = ?, updated = ? '
+                      'WHERE uuid = ?', (subtool, time.time(), uuid))
+
+    def forget(self, uuid):
+        """Removes the record for `uuid`
+        """
+        self._execute('DELETE FROM objects WHERE uuid = ?', (uuid,))
+
+
+def get_registry_path():
+    """Returns the path of the registry in the current shared directory
+    """
+    return os.path.join(utils.get_shared_dir(), REGISTRY_FILE)
+
+
+def get_registry():
+    """Returns the `Registry` for the current shared directory
+    """
+    global _registry
+
+    path = get_registry_path()
+    if _registry is None or _registry.path != path:
+        if _registry is not None:
+            _registry.close()
+        _registry = Registry(path)
+    return _registry
+
+
+def hash_file(file_path):
+    """Returns the sha1 hex digest of a file's contents
+    """
+    digest = hashlib.sha1()
+    hash_read = open(file_path, 'rb')
+    try:
+        for block in iter(lambda: hash_read.read(1024 * 1024), ''):
+            digest.update(block)
+    finally:
+        hash_read.close()
+    return digest.hexdigest()
@@ -0,0 +1,603 @@
+"""
+Relay routing gozbruh messages and meshes between workstations
+
+Without a relay every maya sends straight to the ZBrush named in its
+ZBrushHost config, and the other way around, and both need a shared
+directory. With a relay, each machine only needs the relay's address in its
+RelayHost config (or GOZBRUH_RELAY), and messages are routed by artist: what
+an artist sends from maya reaches the ZBrush the same artist is running, on
+whatever machine that is, and the files go along with the message.
+
+The relay only needs python, run it on any box both sides can reach:
+    python cmd.py relay [host][:port]
+
+Every connection to the relay starts with a framed JSON (see
+gozbruh.protocol) registration:
+    {"command": "register", "role": "maya", "artist": "jane",
+     "session": "jane@ws12", "receive": true}
+
+Receiving connections are delivered what is sent to their role and artist.
+Senders send:
+    {"command": "send", "to": "zbrush", "artist": "jane", "session": null,
+     "message": {...}, "files": [["pSphere1.ma", 1234]]}
+
+followed by the bytes of each file. The relay streams the message and the
+files to every matching receiver, or only the one registered with
+`session`, as:
+    {"command": "deliver", "id": "...", "from": {...}, "message": {...},
+     "files": [["pSphere1.ma", 1234]]}
+
+and answers the sender with the number of receivers:
+    {"ok": true, "id": "...", "receivers": 2, "error": null}
+
+Receivers answer each delivery with an ack, which the relay forwards to the
+sender:
+    {"command": "ack", "id": "...", "ok": true, "result": ...}
+
+When a receiver disconnects before it acked a delivery, the relay acks it
+for the receiver, with "ok": false, so the sender never waits for it.
+
+Files pass through the relay in CHUNK_SIZE pieces, it never holds a whole
+file.
+
+Constants
+---------
+RECONNECT_DELAY : float
+    Seconds a receiver waits before reconnecting to the relay
+SEND_TIMEOUT : float
+    Seconds a sender waits for the next reply or ack of the relay
+"""
+
+import os
+import socket
+import SocketServer
+import uuid
+from threading import Thread, Lock, Event
+
+from . import errs
+from . import protocol
+from . import utils
+
+RECONNECT_DELAY = 5.0
+SEND_TIMEOUT = 300.0
+
+#==============================================================================
+# CLASSES
+#==============================================================================
+
+class RelayConnection(object):
+    """A client registered with `RelayServer`
+
+    Attributes
+    ----------
+    sock : socket.socket
+        connection to the client
+    role : str
+        'maya' or 'zbrush'
+    artist : str
+        artist the client sends and receives for
+    session : str
+        session of the client, see `utils.get_session_id`
+    receive : bool
+        True if the client receives deliveries
+    lock : threading.Lock
+        held while writing to `sock`
+    """
+
+    def __init__(self, sock, role, artist, session=None, receive=False):
+        self.sock = sock
+        self.role = role
+        self.artist = artist
+        self.session = session
+        self.receive = receive
+        self.lock = Lock()
+
+    def send_message(self, data):
+        """Sends one framed message to the client
+        """
+        with self.lock:
+            protocol.send_message(self.sock, data)
+
+    def describe(self):
+        """Returns who the client is, sent along with deliveries and acks
+        """
+        return {'role': self.role,
+                'artist': self.artist,
+                'session': self.session}
+
+
+class RelayServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Relay server, one thread per connected client
+
+    Attributes
+    ----------
+    receivers : list of `RelayConnection`
+        connected receivers
+    pending : dict
+        delivery ID -> (sender `RelayConnection`, set of the receiving
+        `RelayConnection` that did not ack yet)
+    stats : dict
+        delivery, byte and undeliverable message counts
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address):
+        SocketServer.TCPServer.__init__(self, server_address, RelayHandler)
+        self.receivers = []
+        self.pending = {}
+        self.lock = Lock()
+        self.stats = {'messages': 0,
+                      'deliveries': 0,
+                      'undeliverable': 0,
+                      'bytes': 0}
+
+    def add_receiver(self, conn):
+        with self.lock:
+            self.receivers.append(conn)
+        print 'receiving: %(role)s %(artist)s %(session)s' % conn.describe()
+
+    def remove_receiver(self, conn):
+        """Forgets a connection that closed, and fails the deliveries it
+        did not ack back to their senders
+        """
+        unacked = []
+        with self.lock:
+            if conn in self.receivers:
+                self.receivers.remove(conn)
+                print 'gone: %(role)s %(artist)s %(session)s' % \
+                    conn.describe()
+            for delivery_id, (sender, waiting) in self.pending.items():
+                if sender is conn:
+                    # acks for this sender can no longer be forwarded
+                    del self.pending[delivery_id]
+                elif conn in waiting:
+                    waiting.discard(conn)
+                    if not waiting:
+                        del self.pending[delivery_id]
+                    unacked.append((delivery_id, sender))
+
+        for delivery_id, sender in unacked:
+            try:
+                sender.send_message({'command': 'ack',
+                                     'id': delivery_id,
+                                     'ok': False,
+                                     'result': 'Disconnected before it '
+                                               'answered',
+                                     'from': conn.describe()})
+            except socket.error:
+                pass
+
+    def get_receivers(self, role, artist, session=None):
+        """Returns the receivers of `role` for `artist`, only the one of
+        `session` if it is given
+        """
+        with self.lock:
+            return [conn for conn in self.receivers
+                    if conn.role == role and conn.artist == artist and
+                    (session is None or conn.session == session)]
+
+    def get_stats(self):
+        """Returns a copy of `stats` with the connected receivers
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['receivers'] = [conn.describe() for conn in self.receivers]
+        return stats
+
+
+class RelayHandler(SocketServer.BaseRequestHandler):
+    """Handles one client of `RelayServer`
+
+    Commands (after 'register'):
+        send   -> streams the message and its files to the receivers
+        ack    -> forwarded to the sender of the delivery
+        stats  -> `RelayServer.get_stats`
+    """
+
+    def handle(self):
+        try:
+            hello = protocol.recv_message(self.request)
+        except (errs.ProtocolError, ValueError, socket.error) as err:
+            print 'bad registration: %s' % err
+            return
+        if (not hello or hello.get('command') != 'register' or
+                not hello.get('role') or not hello.get('artist')):
+            return
+
+        conn = RelayConnection(self.request,
+                               hello['role'],
+                               utils.clean_session_id(hello['artist']),
+                               hello.get('session'),
+                               bool(hello.get('receive')))
+        try:
+            conn.send_message({'ok': True})
+            if conn.receive:
+                self.server.add_receiver(conn)
+
+            while True:
+                data = protocol.recv_message(self.request)
+                if data is None:
+                    break
+                command = data.get('command')
+                if command == 'send':
+                    self.route(conn, data)
+                elif command == 'ack':
+                    self.forward_ack(conn, data)
+                elif command == 'stats':
+                    conn.send_message(self.server.get_stats())
+                else:
+                    conn.send_message(
+                        {'ok': False,
+                         'error': 'Unknown command: %s' % command})
+        except (errs.ProtocolError, ValueError) as err:
+            print 'dropping %s: %s' % (conn.describe(), err)
+        except socket.error:
+            pass
+        finally:
+            self.server.remove_receiver(conn)
+
+    def route(self, conn, data):
+        """Streams a 'send' and the files following it to its receivers
+        """
+        to = data.get('to')
+        artist = utils.clean_session_id(data.get('artist') or conn.artist)
+        files = data.get('files') or []
+        receivers = self.server.get_receivers(to, artist, data.get('session'))
+        # always take the locks in the same order, several senders may be
+        # delivering to the same receivers
+        receivers.sort(key=id)
+
+        delivery_id = uuid.uuid4().hex
+        if receivers:
+            with self.server.lock:
+                self.server.pending[delivery_id] = (conn, set(receivers))
+
+        deliver = {'command': 'deliver',
+                   'id': delivery_id,
+                   'from': conn.describe(),
+                   'message': data.get('message'),
+                   'files': files}
+        dead = set()
+        for receiver in receivers:
+            receiver.lock.acquire()
+        try:
+            for receiver in receivers:
+                try:
+                    protocol.send_message(receiver.sock, deliver)
+                except socket.error:
+                    dead.add(receiver)
+
+            # the files are read even without receivers, the next message
+            # starts after them
+            size = 0
+            for _, file_size in files:
+                for chunk in protocol.recv_chunks(self.request, file_size):
+                    size += len(chunk)
+                    for receiver in receivers:
+                        if receiver in dead:
+                            continue
+                        try:
+                            receiver.sock.sendall(chunk)
+                        except socket.error:
+                            dead.add(receiver)
+        except:
+            # the sender went away mid-file, no receiver gets a whole
+            # message
+            dead.update(receivers)
+            raise
+        finally:
+            for receiver in receivers:
+                receiver.lock.release()
+            for receiver in dead:
+                _shutdown(receiver.sock)
+
+        delivered = len(receivers) - len(dead)
+        # every receiver still waited for answers the sender, with an ack,
+        # or with a failed one if it disconnects, see `remove_receiver`
+        expected = delivered
+        with self.server.lock:
+            entry = self.server.pending.get(delivery_id)
+            waiting = entry[1] if entry is not None else set()
+            for receiver in dead:
+                if receiver in waiting:
+                    waiting.discard(receiver)
+                else:
+                    # already failed back by remove_receiver
+                    expected += 1
+            if entry is not None and not waiting:
+                del self.server.pending[delivery_id]
+            self.server.stats['messages'] += 1
+            self.server.stats['deliveries'] += delivered
+            self.server.stats['bytes'] += size * delivered
+            if not delivered:
+                self.server.stats['undeliverable'] += 1
+
+        error = None
+        if not delivered:
+            error = 'No %s connected for %s' % (to, artist)
+            print error
+        conn.send_message({'ok': bool(delivered),
+                           'id': delivery_id,
+                           'receivers': expected,
+                           'error': error})
+
+    def forward_ack(self, conn, data):
+        """Passes a receiver's ack on to the sender of the delivery
+        """
+        with self.server.lock:
+            entry = self.server.pending.get(data.get('id'))
+            if entry is None or conn not in entry[1]:
+                return
+            entry[1].discard(conn)
+            if not entry[1]:
+                del self.server.pending[data['id']]
+        data['from'] = conn.describe()
+        try:
+            entry[0].send_message(data)
+        except socket.error:
+            pass
+
+
+class RelayClient(object):
+    """Connection to a `RelayServer`, used by maya and ZBrush
+
+    Attributes
+    ----------
+    host : str
+        host of the relay
+    port : int
+        port of the relay
+    role : str
+        'maya' or 'zbrush'
+    artist : str
+        artist to send and receive for, see `utils.get_artist`
+    session : str
+        session of this client, see `utils.get_session_id`
+    receive : bool
+        True to be delivered messages, see `serve`
+    sock : socket.socket
+        current connection
+    """
+
+    def __init__(self, host, port, role, artist=None, session=None,
+                 receive=False):
+        self.host = host
+        self.port = port
+        self.role = role
+        self.artist = artist or utils.get_artist()
+        self.session = session or utils.get_session_id()
+        self.receive = receive
+        self.sock = None
+
+    def connect(self, timeout=10):
+        """Connects and registers with the relay
+        """
+        self.close()
+
+        address = utils.validate_host(self.host)
+        utils.validate_port(self.port)
+
+        try:
+            sock = socket.create_connection((address, int(self.port)),
+                                            timeout)
+            protocol.send_message(sock, {'command': 'register',
+                                         'role': self.role,
+                                         'artist': self.artist,
+                                         'session': self.session,
+                                         'receive': self.receive})
+            reply = protocol.recv_message(sock)
+        except (socket.error, errs.ProtocolError) as err:
+            raise errs.RelayError('Relay unreachable %s:%s (%s)' % (
+                self.host, self.port, err))
+        if not reply or not reply.get('ok'):
+            sock.close()
+            raise errs.RelayError('Relay refused %s' % self.artist)
+        sock.settimeout(None)
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+    def send(self, to, message, files=(), session=None,
+             timeout=SEND_TIMEOUT):
+        """Sends `message` and `files` to the receivers of role `to` for
+        this client's artist, and waits for their acks
+
+        Parameters
+        ----------
+        to : str
+            role to send to, 'maya' or 'zbrush'
+        message : dict
+            message to deliver
+        files : list of str
+            paths of the files to send along, receivers get them by name
+        session : str
+            (optional) only deliver to the receiver of this session
+        timeout : float
+            (optional) seconds to wait for each reply or ack of the relay,
+            None waits forever
+
+        Returns
+        -------
+        list of dict
+            acks of the receivers
+        """
+        if self.sock is None:
+            raise errs.RelayError('Please connect to the relay first')
+
+        files = [(path, os.path.getsize(path)) for path in files]
+        try:
+            protocol.send_message(
+                self.sock,
+                {'command': 'send',
+                 'to': to,
+                 'artist': self.artist,
+                 'session': session,
+                 'message': message,
+                 'files': [[os.path.basename(path), size]
+                           for path, size in files]})
+            for path, size in files:
+                protocol.send_file(self.sock, path, size)
+
+            # acks of fast receivers can arrive before the relay's reply
+            self.sock.settimeout(timeout)
+            reply = None
+            acks = []
+            while reply is None or len([ack for ack in acks
+                                        if ack.get('id') == reply['id']]) \
+                    < reply['receivers']:
+                data = protocol.recv_message(self.sock)
+                if data is None:
+                    raise errs.RelayError('Relay closed the connection')
+                if data.get('command') == 'ack':
+                    acks.append(data)
+                else:
+                    reply = data
+        except socket.timeout:
+            self.close()
+            raise errs.RelayError('Timed out waiting for %s' % to)
+        except (socket.error, errs.ProtocolError) as err:
+            self.close()
+            raise errs.RelayError('Lost the relay: %s' % err)
+        finally:
+            if self.sock is not None:
+                self.sock.settimeout(None)
+
+        if not reply['ok']:
+            raise errs.RelayError(reply['error'])
+        return [ack for ack in acks if ack.get('id') == reply['id']]
+
+    def serve(self, handle_delivery, get_file_dir):
+        """Receives deliveries until the connection is closed
+
+        Parameters
+        ----------
+        handle_delivery : callable
+            called with the message, the paths of the received files and
+            the sender, returns (ok, result) for the ack
+        get_file_dir : callable
+            called with the message and the sender, returns the directory
+            received files are written to
+        """
+        while True:
+            delivery = protocol.recv_message(self.sock)
+            if delivery is None:
+                return
+            if delivery.get('command') != 'deliver':
+                continue
+
+            message = delivery.get('message') or {}
+            sender = delivery.get('from') or {}
+            file_dir = get_file_dir(message, sender)
+            paths = []
+            for name, size in delivery.get('files') or []:
+                # never write outside of file_dir
+                path = os.path.join(file_dir, os.path.basename(name))
+                protocol.recv_file(self.sock, size, path)
+                paths.append(path)
+
+            try:
+                ok, result = handle_delivery(message, paths, sender)
+            except Exception as err:
+                ok, result = False, '%s: %s' % (type(err).__name__, err)
+            protocol.send_message(self.sock, {'command': 'ack',
+                                              'id': delivery['id'],
+                                              'ok': ok,
+                                              'result': result})
+
+
+class RelayReceiver(object):
+    """Keeps a receiving `RelayClient` connected on a background thread,
+    reconnecting when the relay goes away
+
+    Attributes
+    ----------
+    role : str
+        role deliveries are received for
+    client : `RelayClient`
+        current connection
+    """
+
+    def __init__(self, role, handle_delivery, get_file_dir):
+        self.role = role
+        self.handle_delivery = handle_delivery
+        self.get_file_dir = get_file_dir
+        self.client = None
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.client is not None:
+            self.client.close()
+
+    def run(self):
+        while not self.stopped.is_set():
+            relay_info = utils.get_relay_info()
+            if relay_info is None:
+                return
+            host, port = relay_info
+            self.client = RelayClient(host, port, self.role, receive=True)
+            try:
+                self.client.connect()
+                print 'receiving from relay %s:%s as %s' % (
+                    host, port, self.client.artist)
+                self.client.serve(self.handle_delivery, self.get_file_dir)
+            except (errs.RelayError, errs.ProtocolError, socket.error,
+                    ValueError, IOError, OSError) as err:
+                if not self.stopped.is_set():
+                    print 'relay: %s' % getattr(err, 'msg', err)
+            finally:
+                self.client.close()
+            self.stopped.wait(RECONNECT_DELAY)
+
+#==============================================================================
+# FUNCTIONS
+#==============================================================================
+
+def _shutdown(sock):
+    """Shuts down a receiver whose stream was cut mid-message, its handler
+    drops it once the socket is shut down
+    """
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+        pass
+
+def start_receiver(role, handle_delivery, get_file_dir):
+    """Starts a `RelayReceiver` if a relay is configured
+
+    Returns
+    -------
+    `RelayReceiver` or None
+    """
+    if utils.get_relay_info() is None:
+        return None
+    receiver = RelayReceiver(role, handle_delivery, get_file_dir)
+    receiver.start()
+    return receiver
+
+def start_relay(host='', port=None):
+    """Runs a `RelayServer` until interrupted
+    """
+    if port is None:
+        port = utils.DEFAULT_RELAY_PORT
+    server = RelayServer((host, int(port)))
+    print 'relay listening on %s:%s' % (host or '*', port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,272 @@
+"""
+Local staging of exported files, and their publication to the shared
+directory
+
+Exports are written to a local staging directory, mirroring the shared
+directory, and `Publisher` copies them to the shared directory on a
+background thread. Each file is copied next to its destination under a
+temporary name and renamed into place, so readers of the shared directory
+never see a partial file. A send waits for the `Publication` of its files
+before it tells ZBrush they are ready.
+
+Staged files are kept, the relay sends them without publishing them (see
+gozbruh.relay), and the next export of the same object overwrites them once
+they are published, or sent and released (see `Publisher.hold`).
+gozbruh.lifecycle removes them once they are stale.
+
+Constants
+---------
+STAGING_PATH : str
+    Local directory files are staged in
+RECENT_PUBLICATIONS : int
+    Number of finished publications whose timings are kept for `get_stats`
+"""
+
+import os
+import time
+import shutil
+import getpass
+import tempfile
+from collections import deque
+from threading import Thread, Condition, Event, Lock, current_thread
+
+from . import errs
+from . import trace
+from . import utils
+
+STAGING_PATH = os.path.join(tempfile.gettempdir(),
+                            'gozbruh_staging_' + getpass.getuser())
+RECENT_PUBLICATIONS = 100
+
+
+def get_staged_path(dest_path):
+    """Returns the local path a file is staged at before it is published to
+    `dest_path`, creating its directory if necessary
+
+    The path of `dest_path` in the shared directory is kept, so a staged
+    file has the name of its destination.
+    """
+    shared_dir = utils.get_shared_dir()
+    rel_path = os.path.relpath(dest_path, shared_dir)
+    if rel_path.startswith(os.pardir):
+        # not in the shared dir, keep it apart by its directory
+        rel_path = os.path.join(
+            '_' + utils.clean_session_id(os.path.dirname(dest_path)),
+            os.path.basename(dest_path))
+    staged_path = os.path.join(STAGING_PATH, rel_path)
+    staged_dir = os.path.dirname(staged_path)
+    if not os.path.isdir(staged_dir):
+        try:
+            os.makedirs(staged_dir)
+        except OSError:
+            if not os.path.isdir(staged_dir):
+                raise
+    return staged_path
+
+
+class Publication(object):
+    """One staged file on its way to the shared directory
+
+    Attributes
+    ----------
+    staged_path : str
+        local file
+    dest_path : str
+        path in the shared directory
+    timings : dict
+        'wait' seconds queued, 'copy' seconds copying, 'rename' seconds
+        renaming into place, 'bytes' copied, filled in once published
+    error : str
+        why the file could not be published, None if it was
+    """
+
+    def __init__(self, staged_path, dest_path):
+        self.staged_path = staged_path
+        self.dest_path = dest_path
+        self.queued = time.time()
+        self.trace_id = trace.get_trace_id()
+        self.timings = {}
+        self.error = None
+        self.done = Event()
+
+    def wait(self, timeout=None):
+        """Waits until the file is in the shared directory
+
+        Raises
+        ------
+        errs.PublishError
+            the file could not be published, or not within `timeout`
+        """
+        if not self.done.wait(timeout):
+            raise errs.PublishError('Timed out publishing %s' %
+                                    self.dest_path)
+        if self.error is not None:
+            raise errs.PublishError('Could not publish %s: %s' % (
+                self.dest_path, self.error))
+
+
+class Publisher(object):
+    """Copies staged files to the shared directory, one at a time, on a
+    background thread
+
+    Publishing a file that is still queued replaces nothing, both
+    publications are carried out in order. `wait_for` lets an export wait
+    until the staged file it is about to overwrite has been copied, or
+    released if it is sent from the staging directory.
+
+    Attributes
+    ----------
+    pending : deque of `Publication`
+        publications waiting to be copied
+    held : dict
+        staged path -> number of sends still reading it, see `hold`
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.active = None
+        self.held = {}
+        self.thread = None
+        self.lock = Lock()
+        self.changed = Condition(self.lock)
+        self.published = 0
+        self.failed = 0
+        self.bytes = 0
+        self.recent = deque(maxlen=RECENT_PUBLICATIONS)
+
+    def publish(self, staged_path, dest_path):
+        """Queues `staged_path` to be copied to `dest_path`
+
+        Returns
+        -------
+        `Publication`
+        """
+        publication = Publication(staged_path, dest_path)
+        with self.lock:
+            self.pending.append(publication)
+            if self.thread is None:
+                self.thread = Thread(target=self.run,
+                                     name='gozbruh-publisher')
+                self.thread.daemon = True
+                self.thread.start()
+            self.changed.notify_all()
+        return publication
+
+    def hold(self, staged_path):
+        """Makes `wait_for` wait on `staged_path` until it is released,
+        for files that are sent straight from the staging directory
+        """
+        with self.lock:
+            self.held[staged_path] = self.held.get(staged_path, 0) + 1
+
+    def release(self, staged_path):
+        """Ends a `hold` of `staged_path`
+        """
+        with self.lock:
+            count = self.held.pop(staged_path, 0) - 1
+            if count > 0:
+                self.held[staged_path] = count
+            self.changed.notify_all()
+
+    def wait_for(self, staged_path):
+        """Waits until no publication of `staged_path` is queued or
+        running, and no send holds it
+        """
+        with self.lock:
+            while staged_path in self.held or any(
+                    publication.staged_path == staged_path
+                    for publication in self._get_unfinished()):
+                self.changed.wait()
+
+    def run(self):
+        """Publishes queued files until there are none left
+        """
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+                self.active = self.pending.popleft()
+            publication = self.active
+            try:
+                self._copy(publication)
+            finally:
+                with self.lock:
+                    self.active = None
+                    self._record(publication)
+                    self.changed.notify_all()
+                publication.done.set()
+
+    def get_pending_files(self):
+        """Returns the staged and destination paths of the publications
+        that are queued or running, and the staged paths that are held
+        """
+        with self.lock:
+            return [path for publication in self._get_unfinished()
+                    for path in (publication.staged_path,
+                                 publication.dest_path)] + list(self.held)
+
+    def get_stats(self):
+        """Returns the queue depth, totals and the timings of the most
+        recent publications, in seconds
+
+        Safe to call from any thread.
+        """
+        with self.lock:
+            now = time.time()
+            unfinished = self._get_unfinished()
+            oldest = min([publication.queued for publication in unfinished] or
+                         [now])
+            return {'depth': len(unfinished),
+                    'oldest_wait': now - oldest,
+                    'published': self.published,
+                    'failed': self.failed,
+                    'bytes': self.bytes,
+                    'recent': list(self.recent)}
+
+    def _get_unfinished(self):
+        if self.active is None:
+            return list(self.pending)
+        return [self.active] + list(self.pending)
+
+    def _copy(self, publication):
+        started = time.time()
+        dest_path = publication.dest_path
+        # next to the destination, so the rename does not cross devices
+        temp_path = '%s.%d.%d.part' % (dest_path, os.getpid(),
+                                       current_thread().ident)
+        try:
+            shutil.copyfile(publication.staged_path, temp_path)
+            # maya is often run as root, this makes sure osx can open/save
+            os.chmod(temp_path, 0o777)
+            copied = time.time()
+            if os.name == 'nt' and os.path.exists(dest_path):
+                # os.rename does not replace files on windows
+                os.remove(dest_path)
+            os.rename(temp_path, dest_path)
+        except (IOError, OSError) as err:
+            publication.error = str(err)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        finished = time.time()
+        publication.timings = {'wait': started - publication.queued,
+                               'copy': copied - started,
+                               'rename': finished - copied,
+                               'bytes': os.path.getsize(dest_path)}
+        if publication.trace_id is not None:
+            trace.record('maya.publish', started, finished - started,
+                         publication.trace_id,
+                         file=os.path.basename(dest_path),
+                         bytes=publication.timings['bytes'],
+                         wait=publication.timings['wait'])
+
+    def _record(self, publication):
+        if publication.error is None:
+            self.published += 1
+            self.bytes += publication.timings['bytes']
+        else:
+            self.failed += 1
+        self.recent.append(dict(publication.timings,
+                                file=publication.dest_path,
+                                error=publication.error))
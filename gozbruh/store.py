@@ -0,0 +1,118 @@
+"""
+Content-addressed store of exported files in the shared directory
+
+With the store enabled (see `utils.is_store_enabled`), exported files are
+kept once per content, under the sha1 hex digest of their contents:
+    <shared dir>/store/3f/3f786850e387550fdab836ed7e6dc881de23001b.ma
+
+Duplicated and instanced meshes share one file, and sending a mesh that
+did not change since it was last sent copies nothing. Messages still name
+objects by their readable names and carry the digest of each file.
+
+Maya imports stored files as they are. ZBrush names subtools after the
+files it imports, so its server links each stored file to the readable
+path it expects before the import, see `checkout`.
+
+Constants
+---------
+STORE_DIR : str
+    Directory in the shared dir holding the stored files
+"""
+
+import os
+import errno
+import shutil
+
+from . import registry
+from . import utils
+
+STORE_DIR = 'store'
+
+
+def get_store_path(digest):
+    """Returns the path of the file with contents `digest`, creating its
+    directory if necessary
+    """
+    # fan out by the first two characters, to keep directories small
+    store_dir = os.path.join(utils.get_shared_dir(), STORE_DIR, digest[:2])
+    if not os.path.isdir(store_dir):
+        try:
+            os.makedirs(store_dir)
+        except OSError:
+            if not os.path.isdir(store_dir):
+                raise
+    return os.path.join(store_dir, digest + '.ma')
+
+def is_stored(digest):
+    """Returns True if the file with contents `digest` is in the store
+
+    A stored file is touched, so gozbruh.lifecycle treats it as recently
+    used and keeps it until it was read.
+    """
+    try:
+        os.utime(get_store_path(digest), None)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return False
+    return True
+
+def put(file_path):
+    """Moves `file_path` into the store, `file_path` must be in the shared
+    directory
+
+    Returns
+    -------
+    str
+        path of the stored file
+    """
+    digest = registry.hash_file(file_path)
+    store_path = get_store_path(digest)
+    if is_stored(digest):
+        os.remove(file_path)
+        return store_path
+    try:
+        # on the same share, renaming copies nothing
+        os.rename(file_path, store_path)
+    except OSError:
+        # stored by someone else in the meantime, on windows
+        if not os.path.exists(store_path):
+            raise
+        os.remove(file_path)
+    return store_path
+
+def checkout(digest, file_path):
+    """Makes the stored file with contents `digest` available at
+    `file_path`
+
+    The stored file is hard linked where the share allows it, and copied
+    where it does not.
+
+    Raises
+    ------
+    IOError
+        the file is not in the store
+    """
+    store_path = get_store_path(digest)
+    if not os.path.exists(store_path):
+        raise IOError(errno.ENOENT, 'Not in the store: %s' % digest)
+    if os.path.exists(file_path):
+        if _is_same_file(store_path, file_path):
+            return
+        os.remove(file_path)
+    try:
+        os.link(store_path, file_path)
+    except (AttributeError, OSError):
+        # no hard links on windows, or on this share
+        shutil.copyfile(store_path, file_path)
+
+#------------------------------------------------------------------------------
+# Helpers
+#------------------------------------------------------------------------------
+
+def _is_same_file(path, other_path):
+    try:
+        return os.path.samefile(path, other_path)
+    except (AttributeError, OSError):
+        # no samefile on windows
+        return False
@@ -0,0 +1,234 @@
+"""
+End-to-end tracing of transfers between Maya and ZBrush
+
+A trace ID is created where a transfer starts (`MayaToZBrushClient.send`,
+`cmd.py send`) and travels with the JSON messages and the ZBrush loader
+zscripts. Each stage records a span with the trace ID, its wall clock start
+and its duration, appended as one JSON line to the local trace file.
+
+Trace files from both machines can be merged into one timeline:
+    python cmd.py trace_merge [--id TRACE_ID] maya_trace.jsonl zbrush_trace.jsonl
+
+Spans are ordered by wall clock start, so the timeline is only as accurate
+as the clocks of the two machines are in sync. Durations are measured with
+a monotonic clock where python has one.
+
+Tracing is off by default, set GOZBRUH_TRACE=1 to turn it on. Once the
+trace file grows past TRACE_MAX_BYTES it is moved aside to
+<TRACE_FILE>.1, replacing the previous one, and a new file is started.
+
+Constants
+---------
+TRACE_ENV : str
+    Environment variable turning tracing on when set to 1
+TRACE_FILE : str
+    Name of the trace file in CONFIG_PATH
+TRACE_MAX_BYTES : int
+    Size at which the trace file is rotated
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from contextlib import contextmanager
+
+from . import utils
+
+TRACE_ENV = 'GOZBRUH_TRACE'
+TRACE_FILE = 'trace.jsonl'
+TRACE_MAX_BYTES = 20 * 1024 * 1024
+
+_monotonic = getattr(time, 'monotonic', time.time)
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def is_enabled():
+    """Returns True if tracing is turned on with GOZBRUH_TRACE=1
+    """
+    return os.environ.get(TRACE_ENV, '0').strip() not in ('', '0')
+
+
+def get_trace_file():
+    """Returns the path of this machine's trace file
+    """
+    return os.path.join(utils.CONFIG_PATH, TRACE_FILE)
+
+
+def get_trace_files():
+    """Returns the paths of this machine's trace files that exist, the
+    rotated one first
+    """
+    path = get_trace_file()
+    return [trace_path for trace_path in (path + '.1', path)
+            if os.path.exists(trace_path)]
+
+
+def new_trace_id():
+    """Returns a new trace ID and makes it current for this thread
+    """
+    trace_id = uuid.uuid4().hex[:16]
+    set_trace_id(trace_id)
+    return trace_id
+
+
+def set_trace_id(trace_id):
+    """Makes `trace_id` the current trace for this thread
+    """
+    _local.trace_id = trace_id
+
+
+def get_trace_id():
+    """Returns the current trace ID of this thread, None if there is none
+    """
+    return getattr(_local, 'trace_id', None)
+
+
+def record(name, start, duration, trace_id=None, **attrs):
+    """Appends one span to the trace file
+
+    Parameters
+    ----------
+    name : str
+        stage name, prefixed with the application: 'maya.export'
+    start : float
+        wall clock start, `time.time()`
+    duration : float
+        seconds
+    trace_id : str
+        (optional) defaults to the current trace ID
+    attrs
+        extra values to store with the span
+    """
+    if not is_enabled():
+        return
+    if trace_id is None:
+        trace_id = get_trace_id()
+    if trace_id is None:
+        return
+
+    line = json.dumps({'trace': trace_id,
+                       'span': name,
+                       'host': socket.gethostname(),
+                       'pid': os.getpid(),
+                       'start': start,
+                       'duration': duration,
+                       'attrs': attrs})
+    path = get_trace_file()
+    with _write_lock:
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            elif os.path.exists(path) and \
+                    os.path.getsize(path) > TRACE_MAX_BYTES:
+                _rotate(path)
+            trace_write = open(path, 'a')
+            try:
+                trace_write.write(line + '\n')
+            finally:
+                trace_write.close()
+        except (IOError, OSError) as err:
+            print 'could not write trace: %s' % err
+
+
+def mark(name, trace_id=None, **attrs):
+    """Records a zero length span, for events like 'import finished'
+    """
+    record(name, time.time(), 0.0, trace_id, **attrs)
+
+
+@contextmanager
+def span(name, trace_id=None, **attrs):
+    """Records the time spent in a with block as a span
+    """
+    start = time.time()
+    started = _monotonic()
+    try:
+        yield
+    finally:
+        record(name, start, _monotonic() - started, trace_id, **attrs)
+
+
+def merge(paths, trace_id=None):
+    """Reads trace files and returns their spans ordered by start time
+
+    Parameters
+    ----------
+    paths : list of str
+        trace files, from any machine
+    trace_id : str
+        (optional) only return spans of this trace
+
+    Returns
+    -------
+    list of dict
+    """
+    spans = []
+    for path in paths:
+        trace_read = open(path, 'r')
+        try:
+            for line in trace_read:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    # a partially written line
+                    continue
+                if trace_id is None or item['trace'] == trace_id:
+                    spans.append(item)
+        finally:
+            trace_read.close()
+    spans.sort(key=lambda item: item['start'])
+    return spans
+
+
+def format_timeline(spans):
+    """Formats merged spans as a text timeline, one block per trace
+
+    Each line shows the offset from the first span of the trace, the
+    duration, the host and the span name with its attributes.
+    """
+    traces = {}
+    order = []
+    for item in spans:
+        if item['trace'] not in traces:
+            traces[item['trace']] = []
+            order.append(item['trace'])
+        traces[item['trace']].append(item)
+
+    lines = []
+    for trace_id in order:
+        items = traces[trace_id]
+        first = items[0]['start']
+        last = max(item['start'] + item['duration'] for item in items)
+        lines.append('trace %s  (%.3fs)' % (trace_id, last - first))
+        for item in items:
+            attrs = ' '.join('%s=%s' % pair
+                             for pair in sorted(item['attrs'].items()))
+            lines.append('  +%8.3fs %8.3fs  %-16s %-24s %s' % (
+                item['start'] - first,
+                item['duration'],
+                item['host'],
+                item['span'],
+                attrs))
+    return '\n'.join(lines)
+
+
+#------------------------------------------------------------------------------
+# Helpers
+#------------------------------------------------------------------------------
+
+def _rotate(path):
+    """Moves the trace file at `path` aside, replacing the one moved aside
+    before
+    """
+    rotated_path = path + '.1'
+    if os.name == 'nt' and os.path.exists(rotated_path):
+        # os.rename does not replace files on windows
+        os.remove(rotated_path)
+    os.rename(path, rotated_path)
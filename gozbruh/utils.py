@@ -16,22 +16,60 @@ MAYA_ENV : str
     String representing the Maya environment
 ZBRUSH_ENV : str
     String representing the ZBrush environment
+PROFILE_ENV : str
+    String representing the profiling switch, see gozbruh.profiling
+RELAY_ENV : str
+    String representing the relay address, see gozbruh.relay
+ARTIST_ENV : str
+    String representing the artist name messages are routed by on a relay
+DEFAULT_RELAY_PORT : int
+    Port of the relay when RelayHost only names a host
+CHANNEL_ENV : str
+    String representing the switch for maya's channel to ZBrushServer
+PROXY_ENV : str
+    String representing the proxy ratio of progressive sends
+QUOTA_ENV, MAX_AGE_ENV : str
+    String representing the size quota and the maximum age of the files
+    gozbruh leaves in the shared directory, see gozbruh.lifecycle
+DEFAULT_QUOTA : int
+    Quota in bytes when Quota is not set
+DEFAULT_MAX_AGE : float
+    Maximum age in days when MaxAge is not set
+STORE_ENV : str
+    String representing the switch for the content-addressed store, see
+    gozbruh.store
+HISTORY_ENV : str
+    String representing the number of versions kept of each object, see
+    gozbruh.history
 GOZ_HELP : str
     String representing the gozbruh help
 GOZ_LOG_PATH_FILE
     String representing the location of the gozbruh Log if it is needed
+SESSIONS_DIR : str
+    Directory in the shared dir holding each client's staging directory
+PROXY_DIR : str
+    Directory next to the exported files holding their proxies
 DEFAULT_NET : dict
     Dict containing the default values to the MAYA/ZBRUSH env keys above
 ENV_TO_CONFIG_FILE : dict
     Dict containing the names for the config files pertaining to the
     configurable keys above
+MAYA_COMMAND_PORT_OFFSET : int
+    Offset from the Maya commandPort to gozbruh's JSON command server
+RESOLVE_TTL, RESOLVE_NEGATIVE_TTL : float
+    Seconds a resolved/failed host lookup is cached for
+RESOLVE_REFRESH_AHEAD : float
+    Resolved hosts this close to expiring are refreshed in the background
 """
 
 import sys
 import os
+import re
 import socket
+import getpass
 import time
 from contextlib import contextmanager
+from threading import Lock, Thread
 
 from . import errs
 
@@ -52,6 +90,10 @@ SHARED_DIR_DEFAULT_LINUX = os.path.join(CONFIG_PATH, 'temp')
 
 GOZ_LOG_PATH_FILE = os.path.join(os.environ['HOME'], '.gozbruhLog')
 
+# per-client staging directories in the shared dir, see get_session_dir
+SESSIONS_DIR = 'sessions'
+PROXY_DIR = 'proxy'
+
 # Environment Variables
 # ----------------------
 
@@ -63,6 +105,34 @@ MAYA_ENV = 'MAYA_HOST'
 ZBRUSH_ENV = 'ZBRUSH_HOST'
 # default network info
 DEFAULT_NET = {MAYA_ENV: ':6667', ZBRUSH_ENV: ':6668'}
+# gozbruh's JSON command server in maya listens next to the commandPort
+MAYA_COMMAND_PORT_OFFSET = 2
+# profiling switch, see gozbruh.profiling
+PROFILE_ENV = 'GOZBRUH_PROFILE'
+# relay address, see gozbruh.relay, and who to route messages for
+RELAY_ENV = 'GOZBRUH_RELAY'
+ARTIST_ENV = 'GOZBRUH_ARTIST'
+DEFAULT_RELAY_PORT = 6670
+# maya keeps one connection to ZBrushServer, used in both directions
+CHANNEL_ENV = 'GOZBRUH_CHANNEL'
+# send a proxy of this fraction of the faces before the full mesh
+PROXY_ENV = 'GOZBRUH_PROXY'
+# files in the shared directory are removed beyond this size or age
+QUOTA_ENV = 'GOZBRUH_QUOTA'
+MAX_AGE_ENV = 'GOZBRUH_MAX_AGE'
+DEFAULT_QUOTA = 10 * 1024 ** 3
+DEFAULT_MAX_AGE = 14
+# exported files are kept once per content, see gozbruh.store
+STORE_ENV = 'GOZBRUH_STORE'
+# versions kept of each exchanged object, see gozbruh.history
+HISTORY_ENV = 'GOZBRUH_HISTORY'
+
+# Host Resolution
+# ---------------
+
+RESOLVE_TTL = 300.0
+RESOLVE_NEGATIVE_TTL = 10.0
+RESOLVE_REFRESH_AHEAD = 30.0
 
 # Configuration Files
 # -------------------
@@ -72,11 +142,40 @@ DEFAULT_NET = {MAYA_ENV: ':6667', ZBRUSH_ENV: ':6668'}
 ENV_TO_CONFIG_FILE = {
     MAYA_ENV: 'MayaHost',
     ZBRUSH_ENV: 'ZBrushHost',
-    SHARED_DIR_ENV: 'ShareDir'
+    SHARED_DIR_ENV: 'ShareDir',
+    PROFILE_ENV: 'Profile',
+    RELAY_ENV: 'RelayHost',
+    CHANNEL_ENV: 'Channel',
+    PROXY_ENV: 'Proxy',
+    QUOTA_ENV: 'Quota',
+    MAX_AGE_ENV: 'MaxAge',
+    STORE_ENV: 'Store',
+    HISTORY_ENV: 'History'
 }
 GOZ_HELP = '.gozbruhConfigHelp'
 ZBRUSH_PRE_EXEC = 'ZBrushPreExec'
 MAYA_PRE_EXEC = 'MayaPreExec'
+# held by the running ZBrush server, contains its pid
+ZBRUSH_SERVER_LOCK = 'zbrush_server.lock'
+
+class LazyModule(object):
+    """Stand-in for a module that is only imported on first attribute access.
+
+    Used for slow imports that only some code paths need, like pymel in the
+    Maya modules:
+
+        pm = utils.LazyModule('pymel.core')
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            __import__(self._name)
+            self._module = sys.modules[self._name]
+        return getattr(self._module, attr)
 
 @contextmanager
 def err_handler(gui):
@@ -106,12 +205,100 @@ def validate_port(port):
     except ValueError:
         raise errs.PortError(port, 'Please specify a valid port: %s' % (port))
 
+class HostResolver(object):
+    """Cache of `socket.gethostbyname` results.
+
+    Successful lookups are kept for RESOLVE_TTL seconds and failures for
+    RESOLVE_NEGATIVE_TTL seconds. A successful lookup used within
+    RESOLVE_REFRESH_AHEAD seconds of expiring is refreshed on a background
+    thread, so a slow DNS server is only waited on for new hosts.
+
+    Attributes
+    ----------
+    entries : dict
+        host -> (address or None, expiry time)
+    refreshing : set
+        hosts being refreshed in the background
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.refreshing = set()
+        self.lock = Lock()
+
+    def resolve(self, host):
+        """Returns the address of `host`
+
+        Raises
+        ------
+        socket.error
+            if `host` does not resolve, now or within RESOLVE_NEGATIVE_TTL
+        """
+        # an empty host is the local machine, keep it as is for connect/bind
+        if not host:
+            return host
+
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(host)
+        if entry is None or entry[1] <= now:
+            return self._lookup(host)
+
+        address, expires = entry
+        if address is None:
+            raise socket.gaierror('cached lookup failure: %s' % host)
+        if expires - now < RESOLVE_REFRESH_AHEAD:
+            self._refresh(host)
+        return address
+
+    def _lookup(self, host):
+        try:
+            address = socket.gethostbyname(host)
+        except socket.error:
+            with self.lock:
+                self.entries[host] = (None, time.time() + RESOLVE_NEGATIVE_TTL)
+            raise
+        with self.lock:
+            self.entries[host] = (address, time.time() + RESOLVE_TTL)
+        return address
+
+    def _refresh(self, host):
+        with self.lock:
+            if host in self.refreshing:
+                return
+            self.refreshing.add(host)
+
+        def refresh():
+            try:
+                self._lookup(host)
+            except socket.error:
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing.discard(host)
+
+        thread = Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+_resolver = HostResolver()
+
+def resolve_host(host):
+    """Returns the cached address of `host`, see `HostResolver`
+    """
+    return _resolver.resolve(host)
+
 def validate_host(host):
     """Validates IP/host, or raises and error
+
+    Returns
+    -------
+    str
+        resolved address, to be reused for connecting
     """
 
     try:
-        host = socket.gethostbyname(host)
+        return resolve_host(host)
     except socket.error:
         raise errs.IpError(host, 'Please specify a valid host: %s' % (host))
 
@@ -133,12 +320,18 @@ def validate_connection(host, port):
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.settimeout(1)
-        s.connect((host, int(port)))
+        s.connect((resolve_host(host), int(port)))
         s.close()
     except:
         return False
     return True
 
+def get_maya_command_port(port):
+    """Returns the port of gozbruh's JSON command server in Maya, given the
+    port of the Maya commandPort
+    """
+    return int(port) + MAYA_COMMAND_PORT_OFFSET
+
 def validate(net_string):
     """Runs host/port validation on a string
     """
@@ -148,6 +341,92 @@ def validate(net_string):
     validate_port(port)
     return (host, port)
 
+class ConfigCache(object):
+    """Process-wide cache of the configuration files.
+
+    Each read stats the config file and only reads it again if its
+    mtime or size changed since the last read. Validated net strings are
+    cached as well, so `validate` only runs for new values.
+
+    Attributes
+    ----------
+    entries : dict
+        var -> ((mtime, size), contents), (mtime, size) is None for a
+        missing file
+    validated : dict
+        net string -> (host, port)
+    hits : int
+        reads answered from the cache
+    misses : int
+        reads that went to the file (or to `validate`)
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.validated = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def read(self, var):
+        """Returns the contents of the config file for `var`, '' if there is
+        no file
+        """
+        try:
+            st = os.stat(get_config_file(var))
+            key = (st.st_mtime, st.st_size)
+        except OSError:
+            key = None
+
+        with self.lock:
+            entry = self.entries.get(var)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        info = config_read(var) if key is not None else ''
+        with self.lock:
+            self.entries[var] = (key, info)
+        return info
+
+    def validate(self, net_string):
+        """Cached `validate`, failures are not cached
+        """
+        with self.lock:
+            if net_string in self.validated:
+                self.hits += 1
+                return self.validated[net_string]
+            self.misses += 1
+
+        host_port = validate(net_string)
+        with self.lock:
+            self.validated[net_string] = host_port
+        return host_port
+
+    def invalidate(self, var=None):
+        """Forgets the cached contents of `var`, or of everything
+        """
+        with self.lock:
+            if var is None:
+                self.entries.clear()
+                self.validated.clear()
+            else:
+                self.entries.pop(var, None)
+
+    def get_stats(self):
+        """Returns the hit/miss counters
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+_config_cache = ConfigCache()
+
+def get_config_cache_stats():
+    """Returns hit/miss counters of the configuration cache
+    """
+    return _config_cache.get_stats()
+
 def get_config_file(var):
     """Gets the absolute path for a config file associated with a particular
     environment variable
@@ -181,6 +460,7 @@ def get_shared_dir():
     """Returns the string representation of the shared directory.
 
     First it checks for env variables and if not found, checks the config files
+    (through the config cache)
 
     Returns
     -------
@@ -190,9 +470,7 @@ def get_shared_dir():
     shared_dir = os.getenv(SHARED_DIR_ENV)
     if not shared_dir:
         # If there's no shared dir, check for the config file
-        cfg = get_config_file(SHARED_DIR_ENV)
-        if os.path.exists(cfg):
-            shared_dir = config_read(SHARED_DIR_ENV)
+        shared_dir = _config_cache.read(SHARED_DIR_ENV)
 
     # If the shared_dir still doesn't exist, lets use the defaults
     if not shared_dir:
@@ -207,7 +485,8 @@ def get_net_info(net_env):
     """Gets the net information (host, port) for a given net environment.
 
     First checks environment variables, then config files, and if
-    those are empty, it uses the DEFAULT_NET values.
+    those are empty, it uses the DEFAULT_NET values. Config files and
+    validation results are cached, see `ConfigCache`.
     **Missing SHARED_DIR_ENV forces local mode
 
     Parameters
@@ -240,21 +519,158 @@ def get_net_info(net_env):
 
         if not net_string:
             # Check for a config getter
-            cfg = get_config_file(net_env)
-            if os.path.exists(cfg):
-                net_string = config_read(net_env)
+            net_string = _config_cache.read(net_env)
 
         if net_string:
-            host, port = validate(net_string)
+            host, port = _config_cache.validate(net_string)
             return host, port
 
     # finally default to local mode
     net_string = DEFAULT_NET[net_env]
 
     if net_string:
-        host, port = validate(net_string)
+        host, port = _config_cache.validate(net_string)
         return host, port
 
+def get_relay_info():
+    """Gets the (host, port) of the relay from the environment or the
+    RelayHost config file, None if no relay is configured.
+
+    The port defaults to DEFAULT_RELAY_PORT.
+    """
+    net_string = os.environ.get(RELAY_ENV)
+    if net_string is None:
+        net_string = _config_cache.read(RELAY_ENV)
+    net_string = net_string.strip()
+    if not net_string:
+        return None
+    if ':' not in net_string:
+        net_string += ':%d' % DEFAULT_RELAY_PORT
+    return _config_cache.validate(net_string)
+
+def get_artist():
+    """Returns the name messages are routed by on a relay, the same on
+    every machine the artist works on
+    """
+    return clean_session_id(os.environ.get(ARTIST_ENV) or getpass.getuser())
+
+def is_channel_enabled():
+    """Returns True if maya and ZBrush talk over a single channel, set
+    by the environment or the Channel config file
+    """
+    value = os.environ.get(CHANNEL_ENV)
+    if value is None:
+        value = _config_cache.read(CHANNEL_ENV)
+    return value.strip() not in ('', '0')
+
+def is_store_enabled():
+    """Returns True if exported files are kept in the content-addressed
+    store, set by the environment or the Store config file
+    """
+    value = os.environ.get(STORE_ENV)
+    if value is None:
+        value = _config_cache.read(STORE_ENV)
+    return value.strip() not in ('', '0')
+
+def is_profiling_enabled():
+    """Returns True if the servers' calls are profiled, set by the
+    environment or the Profile config file, see gozbruh.profiling
+    """
+    value = os.environ.get(PROFILE_ENV)
+    if value is None:
+        value = _config_cache.read(PROFILE_ENV)
+    return value.strip() not in ('', '0')
+
+def get_history_versions():
+    """Returns how many versions of each exchanged object are kept, from
+    the environment or the History config file, 0 if no history is kept
+    """
+    value = os.environ.get(HISTORY_ENV)
+    if value is None:
+        value = _config_cache.read(HISTORY_ENV)
+    try:
+        return max(0, int(value.strip() or 0))
+    except ValueError:
+        print 'ignoring %s, not a number of versions: %r' % (HISTORY_ENV,
+                                                            value)
+        return 0
+
+def get_proxy_ratio():
+    """Returns the fraction of faces kept in the proxies of progressive
+    sends, from the environment or the Proxy config file
+
+    Returns
+    -------
+    float or None
+        ratio between 0 and 1, None if sends are not progressive
+    """
+    value = os.environ.get(PROXY_ENV)
+    if value is None:
+        value = _config_cache.read(PROXY_ENV)
+    try:
+        ratio = float(value.strip() or 0)
+    except ValueError:
+        print 'ignoring %s, not a ratio: %r' % (PROXY_ENV, value)
+        return None
+    if not 0 < ratio < 1:
+        return None
+    return ratio
+
+def get_quota():
+    """Returns the size the files gozbruh leaves in the shared directory
+    may take up, from the environment or the Quota config file
+
+    The size is in bytes, or with a K, M or G suffix, e.g. 20G.
+
+    Returns
+    -------
+    int
+        bytes, DEFAULT_QUOTA if not set
+    """
+    value = os.environ.get(QUOTA_ENV)
+    if value is None:
+        value = _config_cache.read(QUOTA_ENV)
+    value = value.strip().upper().rstrip('B')
+    if not value:
+        return DEFAULT_QUOTA
+    scale = 1
+    if value[-1] in 'KMG':
+        scale = 1024 ** ('KMG'.index(value[-1]) + 1)
+        value = value[:-1]
+    try:
+        return int(float(value) * scale)
+    except ValueError:
+        print 'ignoring %s, not a size: %r' % (QUOTA_ENV, value)
+        return DEFAULT_QUOTA
+
+def get_max_age():
+    """Returns the age in seconds after which files gozbruh left in the
+    shared directory are removed, from the environment or the MaxAge config
+    file, which are in days
+    """
+    value = os.environ.get(MAX_AGE_ENV)
+    if value is None:
+        value = _config_cache.read(MAX_AGE_ENV)
+    try:
+        days = float(value.strip() or DEFAULT_MAX_AGE)
+    except ValueError:
+        print 'ignoring %s, not a number of days: %r' % (MAX_AGE_ENV, value)
+        days = DEFAULT_MAX_AGE
+    return days * 24 * 3600
+
+def get_proxy_dir(file_dir):
+    """Returns the directory proxies of the files in `file_dir` are
+    exported to, creating it if necessary
+    """
+    proxy_dir = os.path.join(file_dir, PROXY_DIR)
+    if not os.path.exists(proxy_dir):
+        try:
+            os.makedirs(proxy_dir)
+        except OSError:
+            if not os.path.isdir(proxy_dir):
+                raise
+    return proxy_dir
+
 def split_file_name(file_path):
     """Gets the file 'name' from file, strips ext and dir
     """
@@ -263,10 +679,48 @@ def split_file_name(file_path):
 
     return file_name
 
-def make_maya_filepath(name):
+def make_maya_filepath(name, session=None, proxy=False):
     """Makes a full resolved file path for zbrush
+
+    Files sent by a `session` are staged in its own directory, see
+    `get_session_dir`. Proxies of progressive sends are in its proxy
+    directory, see `get_proxy_dir`.
+    """
+    if session is None:
+        file_dir = get_shared_dir()
+    else:
+        file_dir = get_session_dir(session)
+    if proxy:
+        file_dir = get_proxy_dir(file_dir)
+    return os.path.join(file_dir, name) + '.ma'
+
+def get_session_id():
+    """Returns the name this machine's user sends to ZBrushServer as, used
+    to keep the files and imports of several artists apart
     """
-    return os.path.join(get_shared_dir(), name) + '.ma'
+    return clean_session_id('%s@%s' % (getpass.getuser(),
+                                       socket.gethostname().split('.')[0]))
+
+def clean_session_id(session):
+    """Returns `session` with everything but letters, digits and ._@-
+    replaced, so it can be used as a directory name
+    """
+    return re.sub(r'[^\w.@-]', '_', session).lstrip('.') or 'default'
+
+def get_session_dir(session):
+    """Returns the staging directory of `session` in the shared dir,
+    creating it if necessary
+    """
+    session_dir = os.path.join(get_shared_dir(), SESSIONS_DIR,
+                               clean_session_id(session))
+    if not os.path.exists(session_dir):
+        try:
+            os.makedirs(session_dir)
+        except OSError:
+            # created by another thread in the meantime
+            if not os.path.isdir(session_dir):
+                raise
+    return session_dir
 
 def send_osa(script_path):
     """Sends a zscript file for zbrush to open
@@ -293,6 +747,8 @@ def config_write(var, text):
         cfg_write.write(text)
     finally:
         cfg_write.close()
+    # the mtime may not change if the file is rewritten within a second
+    _config_cache.invalidate(var)
 
 def config_read(var):
     """Reads the configuration file for the variable specified.
@@ -370,6 +826,125 @@ def force_zbrush_server_close(host=None, port=None):
         except:
             print 'The server has been closed!'
 
+class PhaseTimer(object):
+    """Records how long each phase of a sequence takes
+
+    Call `mark` at the end of each phase, `report` prints them all.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        """Ends `phase`, which started at the previous mark
+        """
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        """Prints every phase and the total
+        """
+        for phase, duration in self.phases:
+            print '%s: %-24s %.3fs' % (self.name, phase, duration)
+        print '%s: %-24s %.3fs' % (self.name, 'total',
+                                   self.last - self.started)
+
+def get_zbrush_server_lock_file():
+    """Returns the path of the ZBrush server's lock file
+    """
+    return os.path.join(CONFIG_PATH, ZBRUSH_SERVER_LOCK)
+
+def acquire_zbrush_server_lock(timeout=5.0):
+    """Takes the ZBrush server lock, stopping the server that holds it.
+
+    The lock is an flock on a file containing the server's pid. A server
+    that died releases it automatically, so a leftover file is never
+    mistaken for a running server, and no network probing is needed.
+
+    Parameters
+    ----------
+    timeout : float
+        seconds to wait for a previous server to exit
+
+    Returns
+    -------
+    file
+        the locked file, keep it open for as long as the server runs
+    """
+    import fcntl
+    import signal
+    import errno
+
+    lock_path = get_zbrush_server_lock_file()
+    if not os.path.exists(os.path.dirname(lock_path)):
+        os.makedirs(os.path.dirname(lock_path))
+    lock_file = open(lock_path, 'a+')
+
+    deadline = None
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except IOError as err:
+            if err.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+
+        if deadline is None:
+            # a live server holds the lock, ask it to exit
+            lock_file.seek(0)
+            pid = lock_file.read().strip()
+            if pid.isdigit():
+                print 'stopping previous server (pid %s)...' % pid
+                try:
+                    os.kill(int(pid), signal.SIGTERM)
+                except OSError:
+                    pass
+            deadline = time.time() + timeout
+        elif time.time() > deadline:
+            lock_file.close()
+            raise errs.ZBrushServerError(
+                'Previous ZBrush server did not exit (see %s)' % lock_path)
+        time.sleep(0.05)
+
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+def bind_server_socket(host, port):
+    """Returns a TCP socket bound to and listening on host:port
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind((host, int(port)))
+        sock.listen(5)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+def bind_zbrush_server_socket(host, port):
+    """Binds the ZBrush server's socket, the caller must hold the server
+    lock (see `acquire_zbrush_server_lock`).
+
+    A server started before lock files were used does not hold the lock,
+    if the port is taken it is asked to exit over the network instead.
+    """
+    try:
+        return bind_server_socket(host, port)
+    except socket.error:
+        force_zbrush_server_close(host, port)
+        # Make sure that the server is actually closed before starting the new one
+        while validate_connection(host, port):
+            time.sleep(.1)
+        return bind_server_socket(host, port)
+
 def create_config_path():
     """Creates the configuration file path for the current machine.  This needs
     to be done for each machine using gozbruh regardless of platform.
@@ -391,6 +966,7 @@ def create_config_path():
             cfg_write.write(write_val)
         finally:
             cfg_write.close()
+    _config_cache.invalidate()
 
 def get_zbrush_app_dirs():
     """Returns a list of the ZBrush install locations for OSX
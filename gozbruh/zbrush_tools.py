@@ -7,24 +7,61 @@ ZbrushServer recived strings such as:
 
 These are parsed and opened in ZBrush with the use of some apple script
 
-ZBrushToMayaClient conencts to a open commandPort in maya
+Several Maya clients can send to one ZBrushServer, each as its own session
+with its own staging directory. ZBrushImportScheduler imports their objects
+one at a time, taking turns between sessions
 
-gozbruh.maya_tools.load(file,objname,objparent) is used to open files
+ZBrushToMayaClient sends framed JSON requests to gozbruh's command server in
+maya, and falls back to a open commandPort in maya
+
+With a relay configured (see gozbruh.relay), meshes from maya are also
+received from the relay, and ZBrushToMayaClient sends its requests and files
+through the relay first
+
+In channel mode (see utils.is_channel_enabled) maya keeps one connection to
+ZBrushServer open and sends 'channel' first, after which the connection
+carries framed messages both ways (see protocol.Channel). ZBrushToMayaClient
+then hands its requests to ZBrushServer, which forwards them to maya on that
+connection
+
+gozbruh.maya_tools.queue_load(file,objname,objparent) is used to open files,
+gozbruh.maya_tools.queue_load_many(entries) is used to open several at once
 """
 import sys
 import os
 
+import math
+import time
 import socket
 import SocketServer
-from threading import Thread
+from threading import Thread, Condition, Event, Lock, current_thread
+from collections import deque
 
 import json
 
 # FIXME: this should not be necessary
 CURRDIR = os.path.dirname(os.path.dirname(os.path.abspath(sys.modules[__name__].__file__)))
 sys.path.append(CURRDIR)
+from . import chunks
+from . import errs
+from . import history
+from . import lifecycle
+from . import profiling
+from . import protocol
+from . import registry
+from . import relay
+from . import store
+from . import trace
 from . import utils
 
+# seconds to wait for maya's reply to a request forwarded on its channel,
+# maya may still be running it then, and it is not sent again
+CHANNEL_REPLY_TIMEOUT = 60.0
+# sessions without pending objects are forgotten after this many seconds
+SESSION_IDLE_TIMEOUT = 3600.0
+# each subdivision level has about 4 times the polygons of the one below
+SDIV_FACTOR = 4
+
 #==============================================================================
 # CLASSES
 #==============================================================================
@@ -54,10 +91,17 @@ class ZBrushServer(object):
         self.port = port
         self.server = None
         self.server_thread = None
+        self.collector = None
         self.status = False
 
-    def start(self):
+    def start(self, sock=None):
         """Looks for previous server, trys to start a new one
+
+        Parameters
+        ----------
+        sock : socket.socket
+            (optional) socket already bound to host/port and listening, see
+            `utils.bind_server_socket`
         """
 
         self.status = False
@@ -73,7 +117,7 @@ class ZBrushServer(object):
         print 'starting a new server!'
 
         self.server = ZBrushSocketServ(
-            (self.host, int(self.port)), ZBrushHandler)
+            (self.host, int(self.port)), ZBrushHandler, sock=sock)
         self.server.allow_reuse_address = True
         self.server_thread = Thread(target=self.server.serve_forever)
         self.server_thread.daemon = True
@@ -81,11 +125,21 @@ class ZBrushServer(object):
         print 'Serving on %s:%s' % (self.host, self.port)
         self.status = True
 
+        # remove stale files from the shared directory, except for the
+        # objects waiting to be imported
+        if self.collector is not None:
+            self.collector.stop()
+        self.collector = lifecycle.Collector(
+            self.server.scheduler.get_pending_files)
+        self.collector.start()
+
     def stop(self):
         """Shuts down ZBrushSever
         """
         self.server.shutdown()
         self.server.server_close()
+        if self.collector is not None:
+            self.collector.stop()
         print 'stoping...'
         self.status = False
 
@@ -93,29 +147,357 @@ class ZBrushServer(object):
 class ZBrushSocketServ(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
     """Extends socket server with custom settings and configures daemon mode
     for socketserv module.
+
+    Attributes
+    ----------
+    scheduler : `ZBrushImportScheduler`
+        imports the objects maya sends
+    channels : list of (str, `protocol.Channel`)
+        session and channel of each connected maya, the one that sent last
+        is at the end
     """
     timeout = 5
     daemon_threads = True
     allow_reuse_address = True
 
     # handler is the RequestHandlerClass
-    def __init__(self, server_address, handler):
+    def __init__(self, server_address, handler, sock=None):
         SocketServer.TCPServer.__init__(
             self,
             server_address,
-            handler)
+            handler,
+            bind_and_activate=sock is None)
+        if sock is not None:
+            # use the socket that was bound early during boot
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+        self.scheduler = ZBrushImportScheduler()
+        self.scheduler.start()
+        self.channels = []
+        self.channels_lock = Lock()
+
+    def server_close(self):
+        SocketServer.TCPServer.server_close(self)
+        self.scheduler.stop()
+        # maya reconnects its channel to the next server
+        with self.channels_lock:
+            channels = [channel for _, channel in self.channels]
+        for channel in channels:
+            channel.close()
+
+    def add_channel(self, session, channel):
+        """Adds a maya channel, or marks it as the one that sent last
+        """
+        with self.channels_lock:
+            self._drop_channel(channel)
+            self.channels.append((session, channel))
+
+    def remove_channel(self, channel):
+        with self.channels_lock:
+            self._drop_channel(channel)
+
+    def _drop_channel(self, channel):
+        self.channels[:] = [(session, other)
+                            for session, other in self.channels
+                            if other is not channel]
+
+    def send_to_maya(self, requests):
+        """Sends requests to the maya that sent last, on its channel
+
+        Returns
+        -------
+        list of dict or None
+            replies in request order, up to the first request that could
+            not be sent because the channel closed, None if no maya channel
+            is open. A request maya did not answer within
+            `CHANNEL_REPLY_TIMEOUT` gets a failed reply, and the requests
+            after it are not sent, maya may still be running it.
+        """
+        with self.channels_lock:
+            if not self.channels:
+                return None
+            session, channel = self.channels[-1]
+
+        replies = []
+        try:
+            for request in requests:
+                replies.append(channel.request(request, CHANNEL_REPLY_TIMEOUT))
+        except errs.ReplyTimeoutError as err:
+            print 'maya channel %s: %s' % (session, err.msg)
+            error = 'No reply from maya, it may still be running it'
+            for request in requests[len(replies):]:
+                replies.append({'id': request.get('id'),
+                                'ok': False,
+                                'result': None,
+                                'error': error,
+                                'timings': None})
+                error = 'Not sent, maya did not answer an earlier request'
+            return replies
+        except (errs.ProtocolError, socket.error) as err:
+            print 'maya channel %s: %s' % (session, err)
+            return replies or None
+        return replies
 
     def handle_timeout(self):
         print 'TIMEOUT'
 
 
+class ZBrushSession(object):
+    """Objects one client sent to `ZBrushServer`, and their statistics.
+
+    Attributes
+    ----------
+    name : str
+        session ID sent by the client, its host for older clients
+    pending : collections.deque
+        (batch, obj, parent, subtool, file_dir, queued) for each object
+        waiting to be imported
+    stats : dict
+        batches, objects, imported and errors counts, and the seconds
+        objects spent waiting (wait_time) and importing (import_time)
+    last_seen : float
+        time of the last batch
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pending = deque()
+        self.stats = {'batches': 0,
+                      'objects': 0,
+                      'imported': 0,
+                      'errors': 0,
+                      'wait_time': 0.0,
+                      'import_time': 0.0}
+        self.last_seen = time.time()
+
+    def get_stats(self):
+        """Returns a copy of `stats` with the number of pending objects
+        """
+        stats = dict(self.stats)
+        stats['pending'] = len(self.pending)
+        stats['last_seen'] = self.last_seen
+        return stats
+
+
+class ZBrushImportBatch(object):
+    """The objects of one 'open' message, done once all are imported
+
+    Attributes
+    ----------
+    errors : dict
+        object -> error, for the objects that were not imported
+    """
+
+    def __init__(self, count, trace_id=None):
+        self.remaining = count
+        self.trace_id = trace_id
+        self.errors = {}
+        self.done = Event()
+        if not count:
+            self.done.set()
+
+    def task_done(self):
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.done.set()
+
+    def wait(self):
+        self.done.wait()
+
+
+class ZBrushImportScheduler(object):
+    """Imports objects into ZBrush one at a time, taking turns between
+    sessions.
+
+    ZBrush only imports one file at a time, so handler threads queue their
+    objects here instead of driving ZBrush themselves. Sessions with pending
+    objects are served round-robin, one object per turn, so a large send
+    from one artist is interleaved with a small send from another instead
+    of holding it up until it is done.
+
+    Attributes
+    ----------
+    sessions : dict
+        session name -> `ZBrushSession`
+    ready : collections.deque
+        sessions with pending objects, in the order they get their turn
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.ready = deque()
+        self.active = None
+        self.cond = Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Starts importing on a background thread
+        """
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stops importing, batches still waiting are released without
+        being imported
+        """
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            for session in self.sessions.itervalues():
+                for item in session.pending:
+                    item[0].errors[item[1]] = 'ZBrush server stopped'
+                    item[0].done.set()
+                session.pending.clear()
+            self.ready.clear()
+            self.cond.notify_all()
+        # let an import in progress finish
+        if self.thread is not None and self.thread is not current_thread():
+            self.thread.join(5)
+
+    def submit(self, session_name, items, file_dir, trace_id=None):
+        """Queues objects for import
+
+        Parameters
+        ----------
+        session_name : str
+        items : list of (str, str, str)
+            (obj, parent, subtool) for each object, subtool may be None
+        file_dir : str
+            directory the object files are staged in
+        trace_id : str
+            (optional) trace the imports are recorded in
+
+        Returns
+        -------
+        `ZBrushImportBatch`
+            wait on it for the imports to finish
+        """
+        batch = ZBrushImportBatch(len(items), trace_id)
+        now = time.time()
+        with self.cond:
+            if not self.running:
+                for obj, _, _ in items:
+                    batch.errors[obj] = 'ZBrush server stopped'
+                batch.done.set()
+                return batch
+            self._forget_idle(now)
+            session = self.sessions.get(session_name)
+            if session is None:
+                session = self.sessions[session_name] = \
+                    ZBrushSession(session_name)
+            session.last_seen = now
+            session.stats['batches'] += 1
+            session.stats['objects'] += len(items)
+            for obj, parent, subtool in items:
+                session.pending.append(
+                    (batch, obj, parent, subtool, file_dir, now))
+            if session.pending and session not in self.ready:
+                self.ready.append(session)
+            self.cond.notify()
+        return batch
+
+    def _forget_idle(self, now):
+        for name, session in self.sessions.items():
+            if not session.pending and \
+                    now - session.last_seen > SESSION_IDLE_TIMEOUT:
+                del self.sessions[name]
+
+    def run(self):
+        """Imports pending objects until stopped
+        """
+        while True:
+            with self.cond:
+                while self.running and not self.ready:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                session = self.ready.popleft()
+                item = session.pending.popleft()
+                if session.pending:
+                    # back of the line
+                    self.ready.append(session)
+                self.active = item
+            try:
+                self._import(session, item)
+            finally:
+                with self.cond:
+                    self.active = None
+
+    def _import(self, session, item):
+        """Writes the loader zscript for one object and sends it to ZBrush
+        """
+        batch, obj, parent, subtool, file_dir, queued = item
+        started = time.time()
+        trace.record('zbrush.session_wait', queued, started - queued,
+                     batch.trace_id, obj=obj, session=session.name)
+        ok = True
+        try:
+            print 'got: ' + obj
+            with trace.span('zbrush.loader_zscript', batch.trace_id,
+                            obj=obj):
+                zs_temp = ZBrushHandler.get_loader_zscript(
+                    obj + '.ma', parent, subtool, batch.trace_id, file_dir)
+            with trace.span('zbrush.osascript', batch.trace_id, obj=obj):
+                utils.send_osa(zs_temp)
+        except Exception as err:
+            ok = False
+            batch.errors[obj] = str(err)
+            print 'could not import %s: %s' % (obj, err)
+        finished = time.time()
+
+        with self.cond:
+            stats = session.stats
+            stats['imported' if ok else 'errors'] += 1
+            stats['wait_time'] += started - queued
+            stats['import_time'] += finished - started
+            batch.task_done()
+
+    def get_pending_files(self):
+        """Returns the paths of the files of the objects waiting to be
+        imported, and of the one being imported
+        """
+        with self.cond:
+            items = [item for session in self.sessions.itervalues()
+                     for item in session.pending]
+            if self.active is not None:
+                items.append(self.active)
+        # batch, obj, parent, subtool, file_dir, queued
+        return [os.path.join(item[4] or utils.get_shared_dir(), item[1] + '.ma')
+                for item in items]
+
+    def get_stats(self):
+        """Returns the statistics of every session
+        """
+        with self.cond:
+            return dict((name, session.get_stats())
+                        for name, session in self.sessions.iteritems())
+
+
 class ZBrushHandler(SocketServer.BaseRequestHandler):
     """Custom handler for ZBrushSever and handles loading objects from maya
 
     splits the open command:
     open|objectname#objectparent:anotherobject#anotherparent...
 
-    Also response with 'loaded' on sucessful object load
+    Also response with 'loaded' on sucessful object load. The objects are
+    imported by the server's `ZBrushImportScheduler`, in the session the
+    message names
+
+    A 'stats' command is answered with the statistics of each session
+
+    A 'channel' command turns the connection into a maya channel, see
+    `serve_channel`, and 'to_maya' forwards requests from
+    `ZBrushToMayaClient` to the maya channel that sent last. Both are
+    framed (see gozbruh.protocol), the other messages are bare json
+    strings, as older clients send them
 
     If 'check' is send from MayaToZBrushClient a 'ok' send back
     this is used to check if the server is up/ready
@@ -126,38 +508,198 @@ class ZBrushHandler(SocketServer.BaseRequestHandler):
 
     def handle(self):
         # keep handle open until client/server close
+        decoder = json.JSONDecoder()
+        buf = ''
         while True:
-            data = self.request.recv(1024).strip()
-            if not data:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                self.request.close()
+                break
+            buf += chunk
+
+            # split frames, 'check'/'EXIT' and complete json strings off the
+            # front of the buffer
+            while buf:
+                buf = buf.lstrip()
+                if not buf:
+                    break
+
+                if protocol.is_framed(buf):
+                    try:
+                        data, buf = protocol.split_message(buf)
+                    except (errs.ProtocolError, ValueError) as err:
+                        print 'dropping connection: %s' % err
+                        self.request.close()
+                        return
+                    if data is None:
+                        # incomplete frame, wait for more
+                        break
+                    if data.get('command') == 'channel':
+                        self.serve_channel(data)
+                        return
+                    self.handle_message(data)
+                    continue
+
+                # check for conn-reset/disconnect by peer (on client)
+                if buf.startswith('check'):
+                    self.request.send('ok')
+                    buf = buf[len('check'):]
+                    continue
+
+                # Shutdown sequence
+                if buf.startswith('EXIT'):
+                    self.server.server_close()
+                    return
+
+                try:
+                    data, end = decoder.raw_decode(buf)
+                except ValueError:
+                    # incomplete json string, wait for more
+                    break
+                buf = buf[end:]
+                if data.get('command') == 'channel':
+                    self.serve_channel(data)
+                    return
+                self.handle_message(data)
+
+            if len(buf) > protocol.MAX_MESSAGE_SIZE:
+                print 'dropping connection, unreadable message'
                 self.request.close()
                 break
 
-            # check for conn-reset/disconnect by peer (on client)
-            if data == 'check':
-                self.request.send('ok')
-
-            # Shutdown sequence
-            if data == 'EXIT':
-                self.server.server_close()
-
-            # if we get to here then data must be our json string
-            data = json.loads(data)
-
-            # parse object list from maya
-            if data.get('command') == 'open':
-                objData = data.get('objData')
-                for parent, objs in objData.iteritems():
-                    for obj in objs:
-                        print 'got: ' + obj
-                        zs_temp = self.get_loader_zscript(obj + '.ma', parent)
-                        utils.send_osa(zs_temp)
+    @profiling.profiled('zbrush.handle', lambda self, data:
+                        profiling.label_objects(
+                            obj for objs in data.get('objData', {}).values()
+                            for obj in objs))
+    def handle_message(self, data):
+        """Handles one json message from MayaToZBrushClient
+        """
+        # parse object list from maya
+        if data.get('command') == 'open':
+            session, file_dir = self.get_session(data)
+            failures = open_objects(self.server.scheduler, data, session,
+                                    file_dir)
+            if failures:
+                self.request.send('error: ' + format_failures(failures))
+            else:
                 print 'loaded all objs!'
                 self.request.send('loaded')
+        elif data.get('command') == 'stats':
+            self.request.sendall(json.dumps(self.server.scheduler.get_stats()))
+        elif data.get('command') == 'to_maya':
+            protocol.send_message(
+                self.request,
+                self.server.send_to_maya(data.get('requests') or []))
+
+    def serve_channel(self, data):
+        """Serves a maya channel until maya disconnects
+
+        Maya sends 'open' messages and replies to the requests forwarded by
+        `ZBrushSocketServ.send_to_maya`, both framed. 'open' is answered
+        with 'loaded' once the objects are imported.
+        """
+        session, file_dir = self.get_session(data)
+        channel = protocol.Channel(self.request)
+        try:
+            channel.send({'ok': True})
+            self.server.add_channel(session, channel)
+            print 'maya channel open: %s' % session
+            while True:
+                message = protocol.recv_message(self.request)
+                if message is None:
+                    break
+                if 'command' not in message:
+                    channel.dispatch_reply(message)
+                elif message['command'] == 'open':
+                    self.server.add_channel(session, channel)
+                    # imports take long, keep reading replies meanwhile
+                    thread = Thread(target=self.channel_open,
+                                    args=(channel, message, session,
+                                          file_dir))
+                    thread.daemon = True
+                    thread.start()
+                else:
+                    channel.send({'id': message.get('id'),
+                                  'ok': False,
+                                  'result': None,
+                                  'error': 'Unknown command: %s' %
+                                  message['command']})
+        except (errs.ProtocolError, ValueError, socket.error) as err:
+            print 'maya channel %s: %s' % (session, err)
+        finally:
+            self.server.remove_channel(channel)
+            channel.close()
+            print 'maya channel closed: %s' % session
+
+    @profiling.profiled('zbrush.handle', lambda self, channel, data, *args:
+                        profiling.label_objects(
+                            obj for objs in data.get('objData', {}).values()
+                            for obj in objs))
+    def channel_open(self, channel, data, session, file_dir):
+        """Imports the objects of an 'open' sent on a maya channel, and
+        replies with 'loaded', or with the objects that failed
+        """
+        try:
+            failures = open_objects(self.server.scheduler, data, session,
+                                    file_dir)
+            if failures:
+                reply = {'ok': False, 'result': None,
+                         'error': format_failures(failures)}
+            else:
+                reply = {'ok': True, 'result': 'loaded', 'error': None}
+        except Exception as err:
+            reply = {'ok': False, 'result': None,
+                     'error': '%s: %s' % (type(err).__name__, err)}
+        reply['id'] = data.get('id')
+        try:
+            channel.send(reply)
+        except socket.error:
+            pass
+
+    def get_session(self, data):
+        """Returns the session a message belongs to, and the directory its
+        files are staged in
+
+        Older clients do not send a session, they are grouped by host and
+        their files are in the shared directory.
+        """
+        session = data.get('session')
+        if session:
+            session = utils.clean_session_id(session)
+            return session, utils.get_session_dir(session)
+        return self.client_address[0], utils.get_shared_dir()
+
+    @staticmethod
+    def get_subtools(uuids):
+        """Looks up the subtools objects are registered as
+
+        Parameters
+        ----------
+        uuids : dict
+            object -> maya UUID, sent by MayaToZBrushClient
+
+        Returns
+        -------
+        dict
+            object -> subtool name, for registered objects
+        """
+        records = registry.get_registry().get_many(uuids.values())
+        subtools = {}
+        for obj, uuid in uuids.iteritems():
+            if uuid in records and records[uuid]['subtool']:
+                subtools[obj] = records[uuid]['subtool']
+        return subtools
 
     @staticmethod
-    def get_loader_zscript(name, parent):
+    def get_loader_zscript(name, parent, subtool=None, trace_id=None,
+                           file_dir=None):
         """Writes a temporary zscript to perform the loading of file `name`.
 
+        The file is read from `file_dir`, which defaults to the shared
+        directory, and imported into `subtool`, which defaults to the name of
+        the file without extension. With a `trace_id`, the script records
+        when the import finished in the trace file.
+
         The script is saved in CONFIG_PATH/.zbrush/gozbruh/temp/zbrush_load.txt
         """
         script_path = os.path.join(utils.CONFIG_PATH, 'temp')
@@ -166,7 +708,7 @@ class ZBrushHandler(SocketServer.BaseRequestHandler):
         script_path = os.path.join(script_path, 'zbrush_load.txt')
         zs_temp = open(script_path, 'w+')
 
-        env = utils.get_shared_dir()
+        env = file_dir or utils.get_shared_dir()
         print env
 
         # zbrush script to iterate through sub tools,
@@ -313,7 +855,13 @@ class ZBrushHandler(SocketServer.BaseRequestHandler):
         # swap above zscript #'s with info from maya
         # then write to temp file
         zscript = zscript.replace('#FILENAME', os.path.join(env, name))
-        zscript = zscript.replace('#TOOLNAME', name.replace('.ma', ''))
+        if subtool is None:
+            subtool = name.replace('.ma', '')
+        zscript = zscript.replace('#TOOLNAME', subtool)
+        if trace_id is not None and trace.is_enabled():
+            zscript += '[ShellExecute, "%s %s trace_mark %s zbrush.import_done %s"]' % (
+                sys.executable, utils.get_goz_command_script(), trace_id,
+                name.replace('.ma', ''))
         zscript = zscript.replace('#PARENT', parent)
         zs_temp.write(zscript)
         zs_temp.flush()
@@ -354,7 +902,7 @@ class ZBrushToMayaClient(object):
     def test_client(self):
         """ tests connection with maya, creates a sphere and deletes it """
 
-        utils.validate_host(self.host)
+        address = utils.validate_host(self.host)
         utils.validate_port(self.port)
 
         maya_cmd = 'import maya.cmds as cmds;'
@@ -363,7 +911,7 @@ class ZBrushToMayaClient(object):
         maya = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         maya.settimeout(5)
         try:
-            maya.connect((self.host, int(self.port)))
+            maya.connect((address, int(self.port)))
         except socket.error as err:
             print err
             print 'connection refused'
@@ -377,7 +925,9 @@ class ZBrushToMayaClient(object):
             return True
 
     @staticmethod
-    def send(obj_name, parent_name):
+    @profiling.profiled('zbrush.send',
+                        lambda obj_name, parent_name, proxy=False: obj_name)
+    def send(obj_name, parent_name, proxy=False):
         """Sends a file to maya
 
         includes filepath, object name, and the "parent"
@@ -385,24 +935,266 @@ class ZBrushToMayaClient(object):
         The parent is the top level tool or sub tool 0 of the current tool
         this is used to preserve organization when loading back into ZBrush
 
-        connects to maya commandPort and sends the maya commands
+        sends a 'queue_load' request to gozbruh's maya command server, maya
+        imports the file when it is idle. falls back
+        to sending the maya commands to the commandPort if it is not running
+
+        `proxy` sends the proxy of a progressive send, maya replaces it with
+        the full mesh sent after it
+
+        With the `store` enabled the exported file is moved into the store,
+        and maya reads it from there. The file is recorded in the object's
+        `history`, if it is kept.
 
         """
 
         print 'Parent tool: ' + parent_name
 
+        trace.new_trace_id()
+
         # construct file read path for maya, uses SHARED_DIR_ENV
         # make realative path
-        file_path = utils.make_maya_filepath(obj_name)
+        file_path = utils.make_maya_filepath(obj_name, proxy=proxy)
+        if utils.is_store_enabled():
+            file_path = store.put(file_path)
 
         print file_path
 
-        maya_cmd = 'import gozbruh.maya_tools as maya_tools;maya_tools.load(\'' + \
-            file_path + '\',\'' + obj_name + \
-            '\',\'' + \
-            parent_name + \
-            '\')'
+        request = {'command': 'queue_load',
+                   'args': {'file_path': file_path,
+                            'obj_name': obj_name,
+                            'parent_name': parent_name}}
+        if proxy:
+            request['proxy'] = True
+        with trace.span('zbrush.send_to_maya', obj=obj_name, proxy=proxy):
+            replies = ZBrushToMayaClient.send_requests([request])
+        if replies is None:
+            maya_cmd = 'import gozbruh.maya_tools as maya_tools;maya_tools.queue_load(\'' + \
+                file_path + '\',\'' + obj_name + \
+                '\',\'' + \
+                parent_name + \
+                '\'' + (',proxy=True' if proxy else '') + ')'
+
+            ZBrushToMayaClient._send_maya_cmd(maya_cmd)
+
+        # maya has the file, keep it in the history meanwhile
+        if not proxy:
+            history.record_in_background([(obj_name, file_path)], 'zbrush')
+        return replies
+
+    @staticmethod
+    @profiling.profiled('zbrush.send_many', lambda obj_parents, proxy=False:
+                        profiling.label_objects(obj for obj, _ in obj_parents))
+    def send_many(obj_parents, proxy=False):
+        """Sends several files to maya with a single queue_load_many command
+
+        Used by the send-all and send-visible buttons so that maya queues
+        every subtool in one command instead of one command per subtool
+
+        With the `store` enabled the files are moved into it, see `send`
+
+        Parameters
+        ----------
+        obj_parents : list of (str, str)
+            list of object, parent pairs
+        proxy : bool
+            True to send the proxies of a progressive send
+        """
+        trace.new_trace_id()
+
+        entries = [(utils.make_maya_filepath(obj_name, proxy=proxy),
+                    obj_name, parent_name)
+                   for obj_name, parent_name in obj_parents]
+        if utils.is_store_enabled():
+            entries = [(store.put(file_path), obj_name, parent_name)
+                       for file_path, obj_name, parent_name in entries]
+
+        request = {'command': 'queue_load_many', 'args': {'entries': entries}}
+        if proxy:
+            request['proxy'] = True
+        with trace.span('zbrush.send_to_maya', objects=len(entries),
+                        proxy=proxy):
+            replies = ZBrushToMayaClient.send_requests([request])
+        if replies is None:
+            maya_cmd = 'import gozbruh.maya_tools as maya_tools;' \
+                'maya_tools.queue_load_many(%r, proxy=%r)' % (entries, proxy)
+
+            ZBrushToMayaClient._send_maya_cmd(maya_cmd)
+
+        if not proxy:
+            history.record_in_background(
+                [(obj_name, file_path) for file_path, obj_name, _ in entries],
+                'zbrush')
+        return replies
+
+    @staticmethod
+    def send_requests(requests):
+        """Sends framed JSON requests to gozbruh's maya command server
+
+        With a relay configured the requests go through the relay first,
+        otherwise all requests are written before any reply is read, so maya
+        can work through them back to back. See `gozbruh.protocol` for the
+        format.
+
+        Parameters
+        ----------
+        requests : list of dict
+            requests with 'command' and 'args' keys, ids and the current
+            trace ID are assigned here
+
+        Returns
+        -------
+        list of dict or None
+            replies in request order, None if the server could not be reached
+        """
+        trace_id = trace.get_trace_id()
+        for request_id, request in enumerate(requests):
+            request['id'] = request_id
+            if trace_id is not None:
+                request['trace'] = trace_id
+
+        replies = ZBrushToMayaClient.send_relay(requests)
+        if replies is None:
+            replies = ZBrushToMayaClient.send_channel(requests)
+            if replies is not None and len(replies) < len(requests):
+                # the channel closed, the requests left were not run
+                print 'sending %d requests without the channel' % (
+                    len(requests) - len(replies))
+                replies.extend(ZBrushToMayaClient.send_command_server(
+                    requests[len(replies):]) or [])
+        if replies is None:
+            replies = ZBrushToMayaClient.send_command_server(requests)
+        if replies is None:
+            return None
+
+        for reply in replies:
+            if reply['ok']:
+                print 'maya: %s (wait %.3fs, run %.3fs)' % (
+                    reply['result'],
+                    reply['timings']['wait'],
+                    reply['timings']['run'])
+            else:
+                print 'maya error: %s' % reply['error']
+        return replies
+
+    @staticmethod
+    def send_channel(requests):
+        """Hands `requests` to ZBrushServer, which forwards them on the
+        channel of the maya that sent last, in channel mode
+
+        Returns
+        -------
+        list of dict or None
+            replies in request order, None if not in channel mode or no maya
+            channel is open
+        """
+        if not utils.is_channel_enabled():
+            return None
+
+        host, port = utils.get_net_info(utils.ZBRUSH_ENV)
+        try:
+            zbrush_sock = socket.create_connection(
+                (utils.resolve_host(host), int(port)), 5)
+        except socket.error as err:
+            print 'no ZBrushServer on %s:%s (%s)' % (host, port, err)
+            return None
+        # ZBrushServer gives up on each request after CHANNEL_REPLY_TIMEOUT
+        zbrush_sock.settimeout(CHANNEL_REPLY_TIMEOUT * len(requests) + 5)
+
+        try:
+            with trace.span('zbrush.channel_send', requests=len(requests)):
+                protocol.send_message(zbrush_sock, {'command': 'to_maya',
+                                                    'requests': requests})
+                return protocol.recv_message(zbrush_sock)
+        except (errs.ProtocolError, socket.error) as err:
+            print 'maya channel: %s' % err
+            return None
+        finally:
+            zbrush_sock.close()
+
+    @staticmethod
+    def send_command_server(requests):
+        """Pipelines `requests` to gozbruh's maya command server
+
+        Returns
+        -------
+        list of dict or None
+            replies in request order, None if the server could not be reached
+        """
+        host, port = utils.get_net_info(utils.MAYA_ENV)
+        port = utils.get_maya_command_port(port)
+
+        maya_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        maya_sock.settimeout(5)
+        try:
+            maya_sock.connect((utils.resolve_host(host), port))
+        except socket.error as err:
+            print 'no command server on %s:%s (%s)' % (host, port, err)
+            maya_sock.close()
+            return None
+        # imports can take a long time, only the connect is timed out
+        maya_sock.settimeout(None)
+
+        replies = []
+        try:
+            for request in requests:
+                protocol.send_message(maya_sock, request)
+            for _ in requests:
+                reply = protocol.recv_message(maya_sock)
+                if reply is None:
+                    break
+                replies.append(reply)
+        finally:
+            maya_sock.close()
+        return replies
+
+    @staticmethod
+    def send_relay(requests):
+        """Sends `requests` and the files they load to every maya of this
+        artist through the relay
+
+        Returns
+        -------
+        list of dict or None
+            replies in request order, the first maya's when several
+            received a request, None if no relay is configured or no maya
+            could be reached through it
+        """
+        relay_info = utils.get_relay_info()
+        if relay_info is None:
+            return None
+
+        client = relay.RelayClient(relay_info[0], relay_info[1], 'zbrush')
+        replies = []
+        try:
+            client.connect()
+            for request in requests:
+                with trace.span('zbrush.relay_send',
+                                command=request['command']):
+                    acks = chunks.send_files(client, 'maya', request,
+                                             _get_request_files(request))
+                for ack in acks:
+                    if not ack['ok']:
+                        print 'maya on %s: %s' % (ack['from']['session'],
+                                                  ack['result'])
+                replies.append(acks[0]['result'] if acks[0]['ok'] else
+                               {'id': request['id'],
+                                'ok': False,
+                                'result': None,
+                                'error': acks[0]['result'],
+                                'timings': {'wait': 0.0, 'run': 0.0}})
+        except errs.RelayError as err:
+            print 'relay: %s' % err.msg
+            if not replies:
+                return None
+        finally:
+            client.close()
+        return replies
 
+    @staticmethod
+    def _send_maya_cmd(maya_cmd):
+        """Connects to the maya commandPort and sends `maya_cmd`
+        """
         print maya_cmd
 
         maya_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -412,7 +1204,7 @@ class ZBrushToMayaClient(object):
         print host, port
 
         try:
-            maya_sock.connect((host, int(port)))
+            maya_sock.connect((utils.resolve_host(host), int(port)))
         except socket.error as err:
             print err
             print 'connection refused'
@@ -426,13 +1218,29 @@ class ZBrushToMayaClient(object):
 # FUNCTIONS
 #==============================================================================
 
-def start_zbrush_server():
+def start_zbrush_server(sock=None, timer=None):
     """Start the server and execute the UI installation for ZBrush.
 
     Assumes ZBrush is running.
+
+    A previous server is stopped through its lock file (see
+    `utils.acquire_zbrush_server_lock`), and the ZBrush UI is installed
+    while the server starts.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        (optional) socket already bound to the server's host/port, the
+        caller must already hold the server lock
+    timer : `utils.PhaseTimer`
+        (optional) timer for the boot phases, reported once the UI is
+        installed
     """
     import time
 
+    if timer is None:
+        timer = utils.PhaseTimer('boot')
+
     # Guarentee that the pre-button script has run once before server starts
 
 #     pre_btn_script = utils.get_zbrush_exec_script()
@@ -442,27 +1250,144 @@ def start_zbrush_server():
     host, port = utils.get_net_info(utils.ZBRUSH_ENV)
     print host, port
 
-    # Make sure that all previous servers have been shutdown before attempting
-    #     to start a new one!
-    if utils.validate_connection(host, port):
-        utils.force_zbrush_server_close()
-        # Make sure that the server is actually closed before starting the new one
-        while utils.validate_connection(host, port):
-            time.sleep(.1)
+    if sock is None:
+        # held until this process exits
+        lock = utils.acquire_zbrush_server_lock()
+        timer.mark('lock')
+        sock = utils.bind_zbrush_server_socket(host, port)
+        timer.mark('bind')
 
-    # Start the server
+    # Install the UI while the server starts
+    ui_thread = Thread(target=activate_zscript_ui)
+    ui_thread.start()
 
     server = ZBrushServer(host, port)
-    server.start()
+    server.start(sock=sock)
+    start_relay_receiver(server.server.scheduler)
+    timer.mark('server start')
 
-    # Now that the server has been started, run the UI script
-    activate_zscript_ui()
+    ui_thread.join()
+    timer.mark('ui install')
+    timer.report()
 
     # Listen loop for the server thread
 
     while server.server_thread.isAlive():
         time.sleep(1)
 
+def open_objects(scheduler, data, session, file_dir):
+    """Imports the objects of an 'open' message from maya, in `session`,
+    and returns once they are all imported
+
+    Parameters
+    ----------
+    scheduler : `ZBrushImportScheduler`
+        scheduler the objects are imported by
+    data : dict
+        the message, see `gozbruh.maya_tools.MayaToZBrushClient`
+    session : str
+        session the objects are imported in
+    file_dir : str
+        directory the files are read from, proxies are read from its proxy
+        directory. Files sent through the `store` are linked there first.
+
+    Returns
+    -------
+    dict
+        object -> error, for the objects that were not imported
+    """
+    if data.get('proxy'):
+        file_dir = utils.get_proxy_dir(file_dir)
+    trace_id = data.get('trace')
+    trace.set_trace_id(trace_id)
+    try:
+        with trace.span('zbrush.handle_open', session=session):
+            objData = data.get('objData') or {}
+            subtools = ZBrushHandler.get_subtools(data.get('uuids', {}))
+            digests = data.get('store') or {}
+            failures = {}
+            items = []
+            for parent, objs in objData.iteritems():
+                for obj in objs:
+                    if obj in digests:
+                        try:
+                            store.checkout(digests[obj], os.path.join(
+                                file_dir, obj + '.ma'))
+                        except (IOError, OSError) as err:
+                            print 'could not import %s: %s' % (obj, err)
+                            failures[obj] = str(err)
+                            continue
+                    items.append((obj, parent, subtools.get(obj)))
+            batch = scheduler.submit(session, items, file_dir, trace_id)
+            batch.wait()
+            failures.update(batch.errors)
+            return failures
+    finally:
+        trace.set_trace_id(None)
+
+def format_failures(failures):
+    """Returns the message reporting the objects `open_objects` could not
+    import
+    """
+    return 'could not import ' + ', '.join(
+        '%s (%s)' % (obj, failures[obj]) for obj in sorted(failures))
+
+def start_relay_receiver(scheduler):
+    """Receives meshes from maya through the relay, if one is configured,
+    and imports them with `scheduler`
+
+    Returns
+    -------
+    `relay.RelayReceiver` or None
+    """
+    def get_session(message, sender):
+        return utils.clean_session_id(message.get('session') or
+                                      sender.get('session') or 'relay')
+
+    def get_file_dir(message, sender):
+        file_dir = utils.get_session_dir(get_session(message, sender))
+        if message.get('proxy'):
+            return utils.get_proxy_dir(file_dir)
+        return file_dir
+
+    def handle_delivery(message, paths, sender):
+        session = get_session(message, sender)
+        file_dir = get_file_dir(message, sender)
+        handled = chunks.receive(message, paths, file_dir)
+        if handled is not None:
+            return handled
+        if message.get('command') != 'open':
+            return False, 'Unknown command: %s' % message.get('command')
+        chunks.join_all(message, file_dir)
+        failures = open_objects(scheduler, message, session,
+                                utils.get_session_dir(session))
+        if failures:
+            return False, format_failures(failures)
+        print 'loaded all objs from %s!' % session
+        return True, 'loaded'
+
+    return relay.start_receiver('zbrush', handle_delivery, get_file_dir)
+
+def _get_request_files(request):
+    """Returns the files a request to maya loads, sent along with it
+    through the relay
+    """
+    args = request.get('args') or {}
+    if 'file_path' in args:
+        return [args['file_path']]
+    return [entry[0] for entry in args.get('entries') or []]
+
+def get_proxy_levels(ratio):
+    """Returns how many subdivision levels below the highest the proxies of
+    progressive sends are exported at, for a polygon `ratio`
+
+    ZBrush proxies are lower subdivision levels rather than decimated
+    meshes, the level closest to `ratio` of the polygons is picked.
+    """
+    if ratio is None:
+        return 0
+    return max(1, int(round(math.log(1.0 / ratio, SDIV_FACTOR))))
+
 def activate_zbrush():
     """Apple script to open ZBrush and bring to front
     """
@@ -473,8 +1398,30 @@ def activate_zscript_ui():
     The config variables are read in and then used.
     """
 
-    # zscript to create the 'send' button
+    # zscript setting the subdivision level exported by progressive sends,
+    # proxy_pass 1 drops #PROXY_DROP levels below the highest, 0 exports the
+    # highest level
+    #
+    # The send buttons run the proxy pass and the full pass back to back.
+    # ZScript runs on ZBrush's interface thread, with no way to run a routine
+    # later or on another thread, and an export is a press of Tool:Export on
+    # that thread, so the full pass can not leave the loop. The proxy pass
+    # only adds its export and send: the send's ShellExecute returns once
+    # maya queued the proxies, and maya imports them while the full pass
+    # exports.
     zscript = """
+    [RoutineDef, set_export_sdiv,
+        [VarSet, sdiv, [IGetMax, Tool:Geometry:SDiv]]
+        [If, proxy_pass,
+            [VarSet, sdiv, sdiv - #PROXY_DROP]
+            [If, sdiv < 1, [VarSet, sdiv, 1],]
+        ,]
+        [ISet, Tool:Geometry:SDiv, sdiv]
+    , proxy_pass]
+    """
+
+    # zscript to create the 'send' button
+    zscript += """
     [RoutineDef, send_file,
 
         //GET CURRENT ENV VARIABLES FROM THE CONFIG FILE
@@ -505,52 +1452,74 @@ def activate_zscript_ui():
         [MemReadString, envVarBlock, env_path]
         [VarSet, env_path, [StrMerge, "!:", env_path, "/"]]
 
-        //extracts the current active tool name
-        [VarSet, tool_name,[FileNameExtract, [GetActiveToolPath], 2]]
-
-        //appends .ma to the path for export, construct filename
-        [VarSet, file_name, [StrMerge,tool_name,".ma"]]
+        [VarSet, active_subtool, [SubToolGetActiveIndex]]
+
+        //progressive sends export every object twice, the proxy first
+        [VarSet, passes, #PASSES]
+        [VarSet, pass, 0]
+        [Loop, passes,
+            [VarSet, pass, pass + 1]
+            [VarSet, proxy_pass, pass < passes]
+            [VarSet, sub_dir, ""]
+            [VarSet, send_flag, ""]
+            [VarSet, list_path, "#SEND_LIST_PATH"]
+            [If, proxy_pass,
+                [VarSet, sub_dir, "#PROXY_DIR/"]
+                [VarSet, send_flag, " proxy"]
+                [VarSet, list_path, "#PROXY_SEND_LIST_PATH"]
+            ,]
+            [SubToolSelect, active_subtool]
+            [If, passes > 1,
+                [RoutineCall, set_export_sdiv, proxy_pass]
+            ,]
+
+            //extracts the current active tool name
+            [VarSet, tool_name,[FileNameExtract, [GetActiveToolPath], 2]]
+
+            //appends .ma to the path for export, construct filename
+            [VarSet, file_name, [StrMerge,tool_name,".ma"]]
 
-        //python module execution command, needs to be abs path
-        [VarSet, module_path, "/usr/bin/python #GOZ_COMMAND_SCRIPT send "]
+            //python module execution command, needs to be abs path
+            [VarSet, module_path, "/usr/bin/python #GOZ_COMMAND_SCRIPT send "]
 
-        [VarSet, validpath,[FileExists, #env_path]]
+            [VarSet, validpath,[FileExists, #env_path]]
 
-        [If, validpath != 1,
+            [If, validpath != 1,
 
 
-            //prevents zbrush crash from exporting to a invalid path
-            //if zbrush exports to a bad path it will lock up
-            [MessageOK, "Invalid ZDOCS file path for export"]
-            [MessageOK, #env_path]
-            [Exit]
-            ,
+                //prevents zbrush crash from exporting to a invalid path
+                //if zbrush exports to a bad path it will lock up
+                [MessageOK, "Invalid ZDOCS file path for export"]
+                [MessageOK, #env_path]
+                [Exit]
+                ,
 
 
-        ]
+            ]
 
-        //append env to file path
-        [VarSet, export_path, [StrMerge,env_path,file_name] ]
+            //append env to file path
+            [VarSet, export_path, [StrMerge,env_path,sub_dir,file_name] ]
 
-        //set the maya 'template?' I think ofer spelled something wrong
-        //this sets the file name for the next export \w correct 'template'
-        [FileNameSetNext, #export_path,"ZSTARTUP_ExportTamplates\Maya.ma"]
+            //set the maya 'template?' I think ofer spelled something wrong
+            //this sets the file name for the next export \w correct 'template'
+            [FileNameSetNext, #export_path,"ZSTARTUP_ExportTamplates\Maya.ma"]
 
-        //finally export the tool
-        [IPress,Tool:Export]
+            //finally export the tool
+            [IPress,Tool:Export]
 
-        //get base tool
-        [SubToolSelect,0]
+            //get base tool
+            [SubToolSelect,0]
 
-        [VarSet,base_tool,[IgetTitle, Tool:Current Tool]]
-        [VarSet,base_tool, [FileNameExtract, #base_tool, 2]]
+            [VarSet,base_tool,[IgetTitle, Tool:Current Tool]]
+            [VarSet,base_tool, [FileNameExtract, #base_tool, 2]]
 
-        //trigger the python module to send maya the load commands
+            //trigger the python module to send maya the load commands
 
-        [ShellExecute,
-            //merge the python command with the tool name
-            [StrMerge, #module_path,
-                    #tool_name, " ",#base_tool
+            [ShellExecute,
+                //merge the python command with the tool name
+                [StrMerge, #module_path,
+                        #tool_name, " ",#base_tool, #send_flag
+                ]
             ]
         ]
     ]
@@ -585,70 +1554,105 @@ def activate_zscript_ui():
         //set all tools to lowest sub-d
         [IPress, Tool:SubTool:All Low]
 
-        //iterator variable
-        [VarSet,t,0]
+        //progressive sends export every object twice, the proxy first
+        [VarSet, passes, #PASSES]
+        [VarSet, pass, 0]
+        [Loop, passes,
+            [VarSet, pass, pass + 1]
+            [VarSet, proxy_pass, pass < passes]
+            [VarSet, sub_dir, ""]
+            [VarSet, send_flag, ""]
+            [VarSet, list_path, "#SEND_LIST_PATH"]
+            [If, proxy_pass,
+                [VarSet, sub_dir, "#PROXY_DIR/"]
+                [VarSet, send_flag, " proxy"]
+                [VarSet, list_path, "#PROXY_SEND_LIST_PATH"]
+            ,]
+
+            //iterator variable
+            [VarSet,t,0]
+
+            //list of "tool parent " pairs, sent to maya in one batch at the end
+            [VarSet, list_offset, 0]
+            [MemCreate, sendList, 65536, 0]
+
+            //start at the first subtool
+            [SubToolSelect,0]
 
-        //start at the first subtool
-        [SubToolSelect,0]
+            //iterate through all subtools
+            [Loop,[SubToolGetCount],
 
-        //iterate through all subtools
-        [Loop,[SubToolGetCount],
+                //increment iterator
+                [VarSet,t,t+1]
 
-            //increment iterator
-            [VarSet,t,t+1]
+                //select current subtool index in loop
+                [SubToolSelect,t-1]
+                [If, passes > 1,
+                    [RoutineCall, set_export_sdiv, proxy_pass]
+                ,]
 
-            //select current subtool index in loop
-            [SubToolSelect,t-1]
+                //set base export path #ENVPATH is replace with SHARED_DIR_ENV (expanded)
+                [VarSet, env_path, "!:#ENVPATH"]
+                [MemCreateFromFile, envVarBlock, #env_path]
+                [MemReadString, envVarBlock, env_path]
+                [VarSet, env_path, [StrMerge, "!:", env_path, "/"]]
 
-            //set base export path #ENVPATH is replace with SHARED_DIR_ENV (expanded)
-            [VarSet, env_path, "!:#ENVPATH"]
-            [MemCreateFromFile, envVarBlock, #env_path]
-            [MemReadString, envVarBlock, env_path]
-            [VarSet, env_path, [StrMerge, "!:", env_path, "/"]]
+                //current tool name
+                [VarSet, tool_name, [FileNameExtract, [GetActiveToolPath], 2]]
 
-            //current tool name
-            [VarSet, tool_name, [FileNameExtract, [GetActiveToolPath], 2]]
+                //start constructing export file path /some/dir/tool.ma
+                [VarSet, file_name, [StrMerge,tool_name,".ma"]]
 
-            //start constructing export file path /some/dir/tool.ma
-            [VarSet, file_name, [StrMerge,tool_name,".ma"]]
+                //base python module shell command, needs to be abs path
+                [VarSet, module_path, "/usr/bin/python #GOZ_COMMAND_SCRIPT send "]
 
-            //base python module shell command, needs to be abs path
-            [VarSet, module_path, "/usr/bin/python #GOZ_COMMAND_SCRIPT send "]
+                [VarSet, validpath,[FileExists, #env_path]]
 
-            [VarSet, validpath,[FileExists, #env_path]]
+                [If, validpath != 1,
 
-            [If, validpath != 1,
 
+                    //prevents zbrush crash from exporting to a invalid path
+                    //if zbrush exports to a bad path it will lock up
+                    [MessageOK, "Invalid ZDOCS file path for export"]
+                    [MessageOK, #env_path]
+                    [Exit]
+                    ,
 
-                //prevents zbrush crash from exporting to a invalid path
-                //if zbrush exports to a bad path it will lock up
-                [MessageOK, "Invalid ZDOCS file path for export"]
-                [MessageOK, #env_path]
-                [Exit]
-                ,
 
+                ]
 
-            ]
+                //full export path
+                [VarSet, export_path, [StrMerge,env_path,sub_dir,file_name] ]
 
-            //full export path
-            [VarSet, export_path, [StrMerge,env_path,file_name] ]
+                //set export path to be used by next command
+                [FileNameSetNext, #export_path,"ZSTARTUP_ExportTamplates\Maya.ma"]
 
-            //set export path to be used by next command
-            [FileNameSetNext, #export_path,"ZSTARTUP_ExportTamplates\Maya.ma"]
+                //finally export
+                [IPress,Tool:Export]
 
-            //finally export
-            [IPress,Tool:Export]
 
+                //get base tool
+                [SubToolSelect,0]
+                [VarSet,base_tool,[IgetTitle, Tool:Current Tool]]
+                [VarSet,base_tool, [FileNameExtract, #base_tool, 2]]
 
-            //get base tool
-            [SubToolSelect,0]
-            [VarSet,base_tool,[IgetTitle, Tool:Current Tool]]
-            [VarSet,base_tool, [FileNameExtract, #base_tool, 2]]
+                //append tool_name base_tool for maya to load
+                [VarSet, list_entry, [StrMerge, #tool_name, " ", #base_tool, " "]]
+                [MemWriteString, sendList, #list_entry, list_offset, 0]
+                [VarSet, list_offset, list_offset + [StrLength, #list_entry]]
+            ]
 
-            [ShellExecute,
-                //join module_path tool_name for maya to load
-                [StrMerge, #module_path, #tool_name, " ",#base_tool]
+            //write the list and have maya load everything at once
+            [If, list_offset > 0,
+                [MemResize, sendList, list_offset]
+                [MemSaveToFile, sendList, [StrMerge, "!:", list_path], 1]
+                [ShellExecute,
+                    [StrMerge, "/usr/bin/python #GOZ_COMMAND_SCRIPT send_many ",
+                               list_path, send_flag]
+                ]
+                ,
             ]
+            [MemDelete, sendList]
         ]
     ]
     [IButton, "TOOL:Send to Maya -all", "Export model as a *.ma to maya",
@@ -679,76 +1683,111 @@ def activate_zscript_ui():
         //set all tools to lowest sub-d
         [IPress, Tool:SubTool:All Low]
 
-        //iterator variable
-        [VarSet,t,0]
+        //progressive sends export every object twice, the proxy first
+        [VarSet, passes, #PASSES]
+        [VarSet, pass, 0]
+        [Loop, passes,
+            [VarSet, pass, pass + 1]
+            [VarSet, proxy_pass, pass < passes]
+            [VarSet, sub_dir, ""]
+            [VarSet, send_flag, ""]
+            [VarSet, list_path, "#SEND_LIST_PATH"]
+            [If, proxy_pass,
+                [VarSet, sub_dir, "#PROXY_DIR/"]
+                [VarSet, send_flag, " proxy"]
+                [VarSet, list_path, "#PROXY_SEND_LIST_PATH"]
+            ,]
+
+            //iterator variable
+            [VarSet,t,0]
+
+            //list of "tool parent " pairs, sent to maya in one batch at the end
+            [VarSet, list_offset, 0]
+            [MemCreate, sendList, 65536, 0]
+
+            //start at the first subtool
+            [SubToolSelect,0]
 
-        //start at the first subtool
-        [SubToolSelect,0]
+            //iterate through all subtools
+            [Loop,[SubToolGetCount],
 
-        //iterate through all subtools
-        [Loop,[SubToolGetCount],
+                //increment iterator
+                [VarSet,t,t+1]
 
-            //increment iterator
-            [VarSet,t,t+1]
+                //select current subtool index in loop
+                [SubToolSelect,t-1]
+                [If, passes > 1,
+                    [RoutineCall, set_export_sdiv, proxy_pass]
+                ,]
 
-            //select current subtool index in loop
-            [SubToolSelect,t-1]
+                //set base export path #ENVPATH is replace with SHARED_DIR_ENV (expanded)
+                [VarSet, env_path, "!:#ENVPATH"]
+                [MemCreateFromFile, envVarBlock, #env_path]
+                [MemReadString, envVarBlock, env_path]
+                [VarSet, env_path, [StrMerge, "!:", env_path, "/"]]
 
-            //set base export path #ENVPATH is replace with SHARED_DIR_ENV (expanded)
-            [VarSet, env_path, "!:#ENVPATH"]
-            [MemCreateFromFile, envVarBlock, #env_path]
-            [MemReadString, envVarBlock, env_path]
-            [VarSet, env_path, [StrMerge, "!:", env_path, "/"]]
+                //current tool name
+                [VarSet, tool_name, [FileNameExtract, [GetActiveToolPath], 2]]
 
-            //current tool name
-            [VarSet, tool_name, [FileNameExtract, [GetActiveToolPath], 2]]
+                //start constructing export file path /some/dir/tool.ma
+                [VarSet, file_name, [StrMerge,tool_name,".ma"]]
 
-            //start constructing export file path /some/dir/tool.ma
-            [VarSet, file_name, [StrMerge,tool_name,".ma"]]
+                //base python module shell command, needs to be absolute path
+                [VarSet, module_path, "/usr/bin/python #GOZ_COMMAND_SCRIPT send "]
 
-            //base python module shell command, needs to be absolute path
-            [VarSet, module_path, "/usr/bin/python #GOZ_COMMAND_SCRIPT send "]
+                [VarSet, validpath,[FileExists, #env_path]]
 
-            [VarSet, validpath,[FileExists, #env_path]]
+                [If, validpath != 1,
 
-            [If, validpath != 1,
 
+                    //prevents zbrush crash from exporting to a invalid path
+                    //if zbrush exports to a bad path it will lock up
+                    [MessageOK, "Invalid ZDOCS file path for export"]
+                    [MessageOK, #env_path]
+                    [Exit]
+                    ,
 
-                //prevents zbrush crash from exporting to a invalid path
-                //if zbrush exports to a bad path it will lock up
-                [MessageOK, "Invalid ZDOCS file path for export"]
-                [MessageOK, #env_path]
-                [Exit]
-                ,
 
+                ]
+
+                //full export path
+                [VarSet, export_path, [StrMerge,env_path,sub_dir,file_name] ]
 
-            ]
+                //set export path to be used by next command
+                [FileNameSetNext, #export_path,"ZSTARTUP_ExportTamplates\Maya.ma"]
 
-            //full export path
-            [VarSet, export_path, [StrMerge,env_path,file_name] ]
+                //check visablility
+                [VarSet,curTool,[IgetTitle, Tool:Current Tool]]
+                //look at interface mod
+                [If,[IModGet,[StrMerge,"Tool:SubTool:",curTool]] >= 16,
+                    //finally export if visable
+                    [IPress,Tool:Export]
 
-            //set export path to be used by next command
-            [FileNameSetNext, #export_path,"ZSTARTUP_ExportTamplates\Maya.ma"]
+                    //get base tool
+                    [SubToolSelect,0]
+                    [VarSet,base_tool,[IgetTitle, Tool:Current Tool]]
+                    [VarSet,base_tool, [FileNameExtract, #base_tool, 2]]
 
-            //check visablility
-            [VarSet,curTool,[IgetTitle, Tool:Current Tool]]
-            //look at interface mod
-            [If,[IModGet,[StrMerge,"Tool:SubTool:",curTool]] >= 16,
-                //finally export if visable
-                [IPress,Tool:Export]
+                    //append tool_name base_tool for maya to load
+                    [VarSet, list_entry, [StrMerge, #tool_name, " ", #base_tool, " "]]
+                    [MemWriteString, sendList, #list_entry, list_offset, 0]
+                    [VarSet, list_offset, list_offset + [StrLength, #list_entry]]
 
-                //get base tool
-                [SubToolSelect,0]
-                [VarSet,base_tool,[IgetTitle, Tool:Current Tool]]
-                [VarSet,base_tool, [FileNameExtract, #base_tool, 2]]
+                    ,
+                ]
+            ]
 
+            //write the list and have maya load everything at once
+            [If, list_offset > 0,
+                [MemResize, sendList, list_offset]
+                [MemSaveToFile, sendList, [StrMerge, "!:", list_path], 1]
                 [ShellExecute,
-                    //join module_path tool_name for maya to load
-                    [StrMerge, #module_path, #tool_name, " ",#base_tool]
+                    [StrMerge, "/usr/bin/python #GOZ_COMMAND_SCRIPT send_many ",
+                               list_path, send_flag]
                 ]
-
                 ,
             ]
+            [MemDelete, sendList]
         ]
     ]
     [IButton, "TOOL:Send to Maya -visible", "Export model as a *.ma to maya",
@@ -765,6 +1804,8 @@ def activate_zscript_ui():
     script_path = os.path.join(utils.CONFIG_PATH, 'temp')
     if not os.path.exists(script_path):
         os.makedirs(script_path)
+    send_list_path = os.path.join(script_path, 'send_list.txt')
+    proxy_send_list_path = os.path.join(script_path, 'send_list_proxy.txt')
     script_path = os.path.join(script_path, 'zbrush_gui.txt')
 
     env = utils.get_shared_dir_config()
@@ -772,6 +1813,16 @@ def activate_zscript_ui():
     zscript = zscript.replace('#ENVPATH', env)
     zscript = zscript.replace('#GOZ_COMMAND_SCRIPT', command_script)
     zscript = zscript.replace('#PRE_EXEC_SCRIPT', script_to_exec)
+    zscript = zscript.replace('#PROXY_SEND_LIST_PATH', proxy_send_list_path)
+    zscript = zscript.replace('#SEND_LIST_PATH', send_list_path)
+
+    # progressive sends, exporting to a missing directory locks ZBrush up
+    ratio = utils.get_proxy_ratio()
+    if ratio is not None:
+        utils.get_proxy_dir(utils.get_shared_dir())
+    zscript = zscript.replace('#PASSES', '1' if ratio is None else '2')
+    zscript = zscript.replace('#PROXY_DROP', str(get_proxy_levels(ratio)))
+    zscript = zscript.replace('#PROXY_DIR', utils.PROXY_DIR)
 
     try:
         zs_temp = open(script_path, 'w+')
@@ -0,0 +1,65 @@
+"""
+Fake maya and a sandboxed shared directory for the tests, using the
+stand-ins of benchmarks.fakes
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks import fakes
+
+_scene = None
+
+
+def get_scene():
+    """Installs the fake maya modules the first time, and returns their
+    scene
+    """
+    global _scene
+    if _scene is None:
+        _scene = fakes.install()
+    return _scene
+
+
+class SandboxTest(unittest.TestCase):
+    """Runs each test with an empty scene, and gozbruh's config, shared and
+    staging directories in a temporary directory
+
+    Attributes
+    ----------
+    scene : `fakes.FakeScene`
+    root : str
+        the temporary directory
+    env : dict
+        paths and ports of the sandbox, see `fakes.sandbox`
+    """
+
+    def setUp(self):
+        self.scene = get_scene()
+        self.scene.nodes.clear()
+        self.scene.uuids.clear()
+        self.scene.selection = []
+        self.scene.option_vars.clear()
+
+        from gozbruh import staging
+        from gozbruh import utils
+        self.config_path = utils.CONFIG_PATH
+        self.staging_path = staging.STAGING_PATH
+        self.root = tempfile.mkdtemp(prefix='gozbruh_test_')
+        self.env = fakes.sandbox(self.root)
+        staging.STAGING_PATH = os.path.join(self.root, 'staging')
+
+    def tearDown(self):
+        from gozbruh import registry
+        from gozbruh import staging
+        from gozbruh import utils
+        registry.get_registry().close()
+        utils.CONFIG_PATH = self.config_path
+        staging.STAGING_PATH = self.staging_path
+        shutil.rmtree(self.root, ignore_errors=True)
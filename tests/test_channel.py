@@ -0,0 +1,114 @@
+"""
+Tests of maya's channel to ZBrushServer, with the fake maya and ZBrush of
+benchmarks.fakes, run from the root of the repository:
+    python -m unittest tests.test_channel
+"""
+
+import os
+import time
+import unittest
+
+from tests import fixtures
+
+fixtures.get_scene()
+
+from benchmarks import fakes
+from gozbruh import errs
+from gozbruh import maya_tools
+from gozbruh import utils
+from gozbruh import zbrush_tools
+
+
+class ChannelTest(fixtures.SandboxTest):
+
+    def setUp(self):
+        fixtures.SandboxTest.setUp(self)
+        os.environ[utils.CHANNEL_ENV] = '1'
+        self.zbrush = fakes.FakeZBrush()
+        self.send_osa = utils.send_osa
+        utils.send_osa = self.zbrush.send_osa
+        self.server = zbrush_tools.ZBrushServer('localhost',
+                                                self.env['zbrush_port'])
+        self.server.start()
+        self.client = maya_tools.MayaToZBrushClient()
+        self.client.connect()
+        self.wait_for_channel()
+
+    def tearDown(self):
+        maya_tools.stop_channel()
+        self.server.stop()
+        utils.send_osa = self.send_osa
+        del os.environ[utils.CHANNEL_ENV]
+        fixtures.SandboxTest.tearDown(self)
+
+    def wait_for_channel(self):
+        deadline = time.time() + 5
+        while not self.server.server.channels:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def test_round_trip(self):
+        self.scene.create_mesh('ball', 100)
+        self.client.send(['ball'])
+        self.assertEqual(self.zbrush.imports, 1)
+        self.assertEqual(self.zbrush.tools.keys(), ['ball'])
+
+        # the command server is not running, maya can only be reached on
+        # the channel
+        self.scene.delete('ball')
+        self.zbrush.export_tools(['ball'])
+        replies = zbrush_tools.ZBrushToMayaClient.send_many([('ball',
+                                                               'ball')])
+        self.assertEqual([reply['ok'] for reply in replies], [True])
+        self.assertTrue(self.scene.objExists('ball'))
+
+    def test_fallback(self):
+        def disconnected(data, timeout=None, reply_timeout=None):
+            raise errs.ZBrushServerError('maya channel is not connected')
+        self.client.channel.send = disconnected
+        self.scene.create_mesh('ball', 100)
+        self.client.send(['ball'])
+        self.assertEqual(self.zbrush.imports, 1)
+
+    def test_zbrush_reply_timeout(self):
+        # still importing when maya stops waiting
+        self.zbrush.base_cost = 0.5
+        reply_timeout = maya_tools.CHANNEL_REPLY_TIMEOUT
+        maya_tools.CHANNEL_REPLY_TIMEOUT = 0.1
+        try:
+            self.scene.create_mesh('ball', 100)
+            self.assertRaises(errs.ZBrushServerError, self.client.send,
+                              ['ball'])
+        finally:
+            maya_tools.CHANNEL_REPLY_TIMEOUT = reply_timeout
+        time.sleep(1.0)
+        # not sent again without the channel
+        self.assertEqual(self.zbrush.imports, 1)
+
+    def test_maya_reply_timeout(self):
+        runs = []
+
+        def slow():
+            runs.append(time.time())
+            time.sleep(0.5)
+            return 'done'
+        maya_tools.COMMANDS['slow'] = slow
+        reply_timeout = zbrush_tools.CHANNEL_REPLY_TIMEOUT
+        zbrush_tools.CHANNEL_REPLY_TIMEOUT = 0.1
+        # a resend would reach the command server
+        maya_tools.start_command_server('localhost',
+                                        self.env['maya_command_port'])
+        try:
+            replies = zbrush_tools.ZBrushToMayaClient.send_requests(
+                [{'command': 'slow'}, {'command': 'ping'}])
+        finally:
+            zbrush_tools.CHANNEL_REPLY_TIMEOUT = reply_timeout
+            del maya_tools.COMMANDS['slow']
+            maya_tools.stop_command_server()
+        self.assertEqual([reply['ok'] for reply in replies], [False, False])
+        time.sleep(1.0)
+        self.assertEqual(len(runs), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
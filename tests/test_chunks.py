@@ -0,0 +1,165 @@
+"""
+Tests of gozbruh.chunks, run from the root of the repository:
+    python -m unittest tests.test_chunks
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from gozbruh import chunks
+from gozbruh import errs
+
+CHUNK_SIZE = 1000
+
+
+class FakeRelayClient(object):
+    """Delivers chunk messages straight to `chunks.receive` in
+    `file_dir`, failing after `fail_after` chunks
+    """
+
+    def __init__(self, file_dir, fail_after=None):
+        self.file_dir = file_dir
+        self.fail_after = fail_after
+        self.sent = []
+
+    def send(self, to, message, paths=()):
+        if message['command'] == 'chunk':
+            if len(self.sent) == self.fail_after:
+                raise errs.RelayError('relay went away')
+            self.sent.append(message['chunk']['index'])
+            # the relay hands the receiver a copy of the file
+            copy_path = os.path.join(self.file_dir, 'received')
+            shutil.copyfile(paths[0], copy_path)
+            paths = [copy_path]
+        ok, result = chunks.receive(message, paths, self.file_dir)
+        return [{'ok': ok, 'result': result}]
+
+
+class ChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='gozbruh_test_')
+        self.send_dir = os.path.join(self.root, 'send')
+        self.file_dir = os.path.join(self.root, 'receive')
+        os.makedirs(self.send_dir)
+        os.makedirs(self.file_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_file(self, size, name='ball.ma'):
+        path = os.path.join(self.send_dir, name)
+        rand = random.Random(size)
+        data_write = open(path, 'wb')
+        try:
+            data_write.write(''.join(chr(rand.randint(0, 255))
+                                     for _ in range(size)))
+        finally:
+            data_write.close()
+        return path
+
+    def read(self, path):
+        data_read = open(path, 'rb')
+        try:
+            return data_read.read()
+        finally:
+            data_read.close()
+
+    def send(self, client, path):
+        return chunks.send_chunked(client, 'zbrush', path, CHUNK_SIZE,
+                                   progress=lambda *args: None)
+
+    def test_split_and_join(self):
+        for size in (0, 10, CHUNK_SIZE, 3 * CHUNK_SIZE, 3 * CHUNK_SIZE + 1):
+            path = self.make_file(size)
+            client = FakeRelayClient(self.file_dir)
+            manifest = self.send(client, path)
+
+            self.assertEqual([chunk['size'] for chunk in manifest['chunks']],
+                             [min(CHUNK_SIZE, size - start) for start in
+                              range(0, max(size, 1), CHUNK_SIZE)])
+            joined = chunks.join(self.file_dir, manifest)
+            self.assertEqual(self.read(joined), self.read(path))
+            # the chunks are removed once joined, on both ends
+            self.assertFalse(os.path.exists(
+                chunks.get_chunk_dir(self.file_dir, 'ball.ma')))
+            self.assertEqual(os.listdir(self.send_dir), ['ball.ma'])
+
+    def test_resume(self):
+        path = self.make_file(5 * CHUNK_SIZE + 10)
+        client = FakeRelayClient(self.file_dir, fail_after=3)
+        self.assertRaises(errs.RelayError, self.send, client, path)
+        self.assertEqual(client.sent, [0, 1, 2])
+
+        client = FakeRelayClient(self.file_dir)
+        manifest = self.send(client, path)
+        self.assertEqual(client.sent, [3, 4, 5])
+        self.assertEqual(self.read(chunks.join(self.file_dir, manifest)),
+                         self.read(path))
+
+    def test_held_chunks_are_not_written(self):
+        path = self.make_file(3 * CHUNK_SIZE)
+        chunk_dir = tempfile.mkdtemp(dir=self.root)
+        sent = list(chunks.split(path, chunk_dir, CHUNK_SIZE))
+        held = set((chunk['index'], chunk['sha1']) for chunk, _ in sent[:2])
+        for _, chunk_path in sent:
+            os.remove(chunk_path)
+
+        split = list(chunks.split(path, chunk_dir, CHUNK_SIZE, held=held))
+        self.assertEqual([chunk for chunk, _ in split],
+                         [chunk for chunk, _ in sent])
+        self.assertEqual([chunk_path is None for _, chunk_path in split],
+                         [True, True, False])
+        self.assertEqual(len(os.listdir(chunk_dir)), 1)
+
+    def test_changed_chunks_are_sent_again(self):
+        path = self.make_file(3 * CHUNK_SIZE)
+        self.assertRaises(errs.RelayError, self.send,
+                          FakeRelayClient(self.file_dir, fail_after=2), path)
+        # the second chunk changes before the send is resumed
+        data_write = open(path, 'r+b')
+        try:
+            data_write.seek(CHUNK_SIZE + 5)
+            data_write.write('changed')
+        finally:
+            data_write.close()
+        client = FakeRelayClient(self.file_dir)
+        manifest = self.send(client, path)
+        self.assertEqual(client.sent, [1, 2])
+        self.assertEqual(self.read(chunks.join(self.file_dir, manifest)),
+                         self.read(path))
+
+    def test_rejects_corrupt_chunk(self):
+        path = self.make_file(2 * CHUNK_SIZE)
+        chunk_dir = tempfile.mkdtemp(dir=self.root)
+        chunk, chunk_path = next(chunks.split(path, chunk_dir, CHUNK_SIZE))
+        chunk_write = open(chunk_path, 'r+b')
+        try:
+            chunk_write.write('x')
+        finally:
+            chunk_write.close()
+
+        self.assertRaises(errs.ProtocolError, chunks.store, self.file_dir,
+                          'ball.ma', chunk, chunk_path)
+        self.assertFalse(os.path.exists(chunk_path))
+        self.assertEqual(chunks.get_held(self.file_dir, 'ball.ma'), [])
+
+    def test_join_checks_manifest(self):
+        path = self.make_file(2 * CHUNK_SIZE)
+        manifest = self.send(FakeRelayClient(self.file_dir), path)
+        missing = dict(manifest, chunks=manifest['chunks'][:1] + [
+            dict(manifest['chunks'][1], sha1='0' * 40)])
+        self.assertRaises(errs.ProtocolError, chunks.join, self.file_dir,
+                          missing)
+        wrong = dict(manifest, sha1='0' * 40)
+        self.assertRaises(errs.ProtocolError, chunks.join, self.file_dir,
+                          wrong)
+        self.assertEqual(self.read(chunks.join(self.file_dir, manifest)),
+                         self.read(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Tests of gozbruh.export_profiles, run from the root of the repository:
+    python -m unittest tests.test_export_profiles
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gozbruh import export_profiles
+
+MESH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                         'mesh.ma')
+
+# lines of data/mesh.ma that only travel with each channel
+CHANNEL_LINES = {
+    'uvs': ['\tsetAttr ".uvst[0].uvsn" -type "string" "map1";\n',
+            '\t\t 1 1 0 1;\n',
+            '\tsetAttr ".cuvs" -type "string" "map1";\n',
+            '\t\tmu 0 3 0 1 2\n'],
+    'normals': ['\tsetAttr -s 6 ".n[0:5]" -type "float3"  '
+                '0 1 0 0 1 0 0 1 0\n',
+                '\t\t 0 1 0 0 1 0 0 1 0;\n'],
+    'colors': ['\tsetAttr ".dcol" yes;\n',
+               '\t\t 0 0 1 1 1 1 1 1;\n',
+               '\t\tmc 0 3 0 1 2\n'],
+    'materials': ['createNode lambert -n "clay";\n',
+                  '\tsetAttr ".c" -type "float3" 0.5 0.4 0.3 ;\n',
+                  'createNode shadingEngine -n "claySG";\n',
+                  'connectAttr "clay.oc" "claySG.ss";\n',
+                  'connectAttr "planeShape.iog" "claySG.dsm" -na;\n'],
+}
+# lines of data/mesh.ma every profile keeps
+KEPT_LINES = ['createNode mesh -n "planeShape" -p "plane";\n',
+              '\tsetAttr -s 4 ".vt[0:3]"  -1 0 1 1 0 1\n',
+              '\t\t 1 0 -1 -1 0 -1;\n',
+              '\tsetAttr -s 5 ".ed[0:4]"  0 1 0 1 2 0 2 3 0 3 0 0 0 2 1;\n',
+              '\t\tf 3 0 1 -5\n',
+              '\t\tf 3 4 2 3\n',
+              '\tsetAttr ".cd" -type "dataPolyComponent" Index_Data Edge 0 ;\n',
+              '// End of mesh.ma\n']
+
+
+class FilterFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='gozbruh_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def filter(self, profile):
+        dest_path = os.path.join(self.root, profile + '.ma')
+        export_profiles.filter_file(MESH_PATH, dest_path,
+                                    export_profiles.get_channels(profile))
+        return self.read_lines(dest_path)
+
+    def read_lines(self, path):
+        ma_read = open(path, 'r')
+        try:
+            return ma_read.readlines()
+        finally:
+            ma_read.close()
+
+    def assert_channels(self, lines, channels):
+        for line in KEPT_LINES:
+            self.assertIn(line, lines)
+        for channel, channel_lines in CHANNEL_LINES.iteritems():
+            for line in channel_lines:
+                if channel in channels:
+                    self.assertIn(line, lines)
+                else:
+                    self.assertNotIn(line, lines)
+
+    def assert_faces_closed(self, lines):
+        start = lines.index('\tsetAttr -s 2 -ch 6 ".fc[0:1]" '
+                            '-type "polyFaces" \n')
+        end = start + 1
+        while not lines[end].rstrip().endswith(';'):
+            self.assertTrue(lines[end].startswith('\t\t'))
+            end += 1
+        self.assertEqual(lines[end + 1],
+                         '\tsetAttr ".cd" -type "dataPolyComponent" '
+                         'Index_Data Edge 0 ;\n')
+
+    def test_profiles(self):
+        for profile, channels in export_profiles.EXPORT_PROFILES.iteritems():
+            lines = self.filter(profile)
+            self.assert_channels(lines, channels)
+            self.assert_faces_closed(lines)
+
+    def test_full_is_a_copy(self):
+        self.assertFalse(export_profiles.is_filtered(
+            export_profiles.get_channels('full')))
+        self.assertEqual(self.filter('full'), self.read_lines(MESH_PATH))
+
+    def test_joined_channels(self):
+        lines = self.filter('colors+materials')
+        self.assert_channels(lines, ['colors', 'materials'])
+        self.assert_faces_closed(lines)
+
+    def test_get_channels(self):
+        self.assertEqual(export_profiles.get_channels('uvs + normals'),
+                         frozenset(['uvs', 'normals']))
+        self.assertEqual(export_profiles.get_channels('uvs+wrinkles'), None)
+        self.assertEqual(export_profiles.get_channels('sculpty'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Tests of gozbruh.history, run from the root of the repository:
+    python -m unittest tests.test_history
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from tests import fixtures
+
+from benchmarks import fakes
+from gozbruh import errs
+from gozbruh import history
+from gozbruh import utils
+
+
+def make_version(number, verts=50):
+    """Returns the lines of a mesh whose vertices move with `number`
+    """
+    lines = fakes.MESH_HEADER % {'name': 'ball'}
+    lines += ''.join('\tsetAttr ".pt[%d]" -type "float3" %d 0 0;\n'
+                     % (index, index * number) for index in range(verts))
+    return lines.splitlines(True)
+
+
+class DeltaTest(unittest.TestCase):
+
+    def check_round_trip(self, base_lines, lines):
+        delta = history._make_delta(base_lines, lines)
+        self.assertEqual(history._apply_delta(base_lines, delta), lines)
+
+    def test_same_length(self):
+        base_lines = make_version(2)
+        lines = make_version(1)
+        self.check_round_trip(base_lines, lines)
+        # unchanged lines are copied, not stored
+        delta = history._make_delta(base_lines, lines)
+        stored = sum(len(op) for op in delta if isinstance(op, list))
+        self.assertLess(stored, len(lines))
+
+    def test_different_length(self):
+        self.check_round_trip(make_version(2, 80), make_version(1, 50))
+        self.check_round_trip(make_version(2, 50), make_version(1, 80))
+        self.check_round_trip([], make_version(1))
+        self.check_round_trip(make_version(1), [])
+
+    def test_write_and_read(self):
+        base_lines = make_version(2, 80)
+        lines = make_version(1, 50) + ['no newline at the end']
+        delta = history._make_delta(base_lines, lines)
+        fixture_dir = tempfile.mkdtemp(prefix='gozbruh_test_')
+        try:
+            delta_path = os.path.join(fixture_dir, '1.delta')
+            history._write_delta(delta_path, delta)
+            self.assertEqual(history._read_delta(delta_path), delta)
+        finally:
+            shutil.rmtree(fixture_dir)
+
+
+class HistoryTest(fixtures.SandboxTest):
+
+    def setUp(self):
+        fixtures.SandboxTest.setUp(self)
+        os.environ[utils.HISTORY_ENV] = '3'
+
+    def tearDown(self):
+        del os.environ[utils.HISTORY_ENV]
+        fixtures.SandboxTest.tearDown(self)
+
+    def record(self, number, verts=50):
+        path = os.path.join(self.root, 'ball.ma')
+        ma_write = open(path, 'wb')
+        try:
+            ma_write.writelines(make_version(number, verts))
+        finally:
+            ma_write.close()
+        return history.record('ball', path, 'maya')
+
+    def test_prunes_oldest_versions(self):
+        for number in range(1, 6):
+            self.assertEqual(self.record(number)['version'], number)
+
+        self.assertEqual([entry['version']
+                          for entry in history.get_versions('ball')],
+                         [3, 4, 5])
+        self.assertEqual(sorted(os.listdir(history.get_history_dir('ball'))),
+                         ['3.delta', '4.delta', '5.ma', 'versions.json'])
+        self.assertRaises(errs.HistoryError, history.get_lines, 'ball', 2)
+
+    def test_restores_every_version(self):
+        # topology changes in between, for both kinds of delta
+        sizes = {1: 50, 2: 50, 3: 70}
+        for number in sorted(sizes):
+            self.record(number, sizes[number])
+
+        for number in sorted(sizes):
+            path = os.path.join(self.root, 'restored.ma')
+            history.restore('ball', number, path)
+            self.assertEqual(history._read_lines(path),
+                             make_version(number, sizes[number]))
+
+    def test_unchanged_file_adds_no_version(self):
+        self.record(1)
+        self.assertEqual(self.record(1), None)
+        self.assertEqual(len(history.get_versions('ball')), 1)
+
+    def test_takes_over_stale_lock(self):
+        self.record(1)
+        lock_path = os.path.join(history.get_history_dir('ball'),
+                                 history._LOCK_DIR)
+        os.mkdir(lock_path)
+        owner = open(os.path.join(lock_path, history._LOCK_OWNER), 'w')
+        try:
+            # above the largest process ID linux hands out
+            owner.write('%s %d' % (socket.gethostname(), 2 ** 22 + 1))
+        finally:
+            owner.close()
+
+        self.assertEqual(self.record(2)['version'], 2)
+        self.assertFalse(os.path.exists(lock_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
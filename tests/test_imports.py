@@ -0,0 +1,45 @@
+"""
+Tests that importing the maya modules does not import pymel, run from the
+root of the repository:
+    python -m unittest tests.test_imports
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds the fake pymel.core takes to import, well above the import of
+# the gozbruh modules themselves
+PYMEL_IMPORT_COST = 2.0
+
+# the modules are imported in a new interpreter, the other tests have
+# already imported them in this one
+IMPORT_SCRIPT = """
+import sys
+import time
+from benchmarks import fakes
+fakes.install(pymel_import_cost=%(cost)s)
+start = time.time()
+from gozbruh import maya_tools
+from gozbruh import mayagui
+print time.time() - start
+print 'pymel.core' in sys.modules
+"""
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_pymel_not_imported(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT % {'cost': PYMEL_IMPORT_COST}],
+            cwd=ROOT)
+        elapsed, pymel_loaded = output.split()[-2:]
+        self.assertEqual(pymel_loaded, 'False')
+        self.assertLess(float(elapsed), PYMEL_IMPORT_COST / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Tests of gozbruh.maya_tools against the fake maya of benchmarks.fakes, run
+from the root of the repository:
+    python -m unittest tests.test_maya_tools
+"""
+
+import os
+import time
+import unittest
+
+from tests import fixtures
+
+fixtures.get_scene()
+
+from benchmarks import fakes
+from gozbruh import errs
+from gozbruh import lifecycle
+from gozbruh import maya_tools
+from gozbruh import utils
+from gozbruh import zbrush_tools
+
+
+class SendTest(fixtures.SandboxTest):
+
+    def setUp(self):
+        fixtures.SandboxTest.setUp(self)
+        # slow enough for a second send to start while ZBrush imports
+        self.zbrush = fakes.FakeZBrush(base_cost=0.2)
+        self.send_osa = utils.send_osa
+        utils.send_osa = self.zbrush.send_osa
+        self.server = zbrush_tools.ZBrushServer('localhost',
+                                                self.env['zbrush_port'])
+        self.server.start()
+        self.errors = []
+        self.error_gui = maya_tools.error_gui
+        maya_tools.error_gui = self.errors.append
+        self.client = maya_tools.MayaToZBrushClient()
+        self.client.connect()
+
+    def tearDown(self):
+        if self.client.sock is not None:
+            self.client.sock.close()
+        self.server.stop()
+        maya_tools.error_gui = self.error_gui
+        utils.send_osa = self.send_osa
+        fixtures.SandboxTest.tearDown(self)
+
+    def wait_for_imports(self, count):
+        deadline = time.time() + 10
+        while self.zbrush.imports < count and not self.errors:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def test_sends_without_waiting(self):
+        self.scene.create_mesh('first', 100)
+        self.scene.create_mesh('second', 100)
+
+        self.client.send(['first'], wait=False)
+        # the send is waiting for 'loaded' on the socket meanwhile
+        time.sleep(0.1)
+        self.client.check_socket()
+        self.client.send(['second'], wait=False)
+        self.wait_for_imports(2)
+
+        self.assertEqual(self.errors, [])
+        self.assertTrue(self.client.status)
+        self.assertNotEqual(self.client.sock, None)
+        self.assertEqual(sorted(self.zbrush.tools), ['first', 'second'])
+
+    def test_reports_failed_imports(self):
+        self.scene.create_mesh('good', 100)
+        self.scene.create_mesh('bad', 100)
+        send_osa = utils.send_osa
+
+        def fail_bad(script_path):
+            if 'bad.ma' in open(script_path).read():
+                raise OSError('osascript failed')
+            send_osa(script_path)
+        utils.send_osa = fail_bad
+
+        with self.assertRaises(errs.ZBrushServerError) as caught:
+            self.client.send(['good', 'bad'])
+        self.assertIn('bad (osascript failed)', caught.exception.msg)
+        self.assertNotIn('good', caught.exception.msg)
+        # ZBrushServer answered, it is not down
+        self.assertTrue(self.client.status)
+        self.assertEqual(self.zbrush.tools.keys(), ['good'])
+
+    def test_keeps_files_zbrush_has_not_loaded(self):
+        self.zbrush.base_cost = 1.0
+        self.scene.create_mesh('ball', 100)
+        path = utils.make_maya_filepath('ball', self.client.session)
+
+        self.client.send(['ball'], wait=False)
+        deadline = time.time() + 10
+        while not os.path.exists(path):
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+        # ZBrush is busy for longer than lifecycle.MIN_AGE
+        hour_ago = time.time() - 3600
+        os.utime(path, (hour_ago, hour_ago))
+        lifecycle.collect(max_age=0, protected=maya_tools._get_pending_files())
+        self.assertTrue(os.path.exists(path))
+
+        self.wait_for_imports(1)
+        self.assertEqual(self.errors, [])
+        deadline = time.time() + 10
+        while path in maya_tools._get_pending_files():
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+
+class ImportQueueTest(fixtures.SandboxTest):
+
+    def setUp(self):
+        fixtures.SandboxTest.setUp(self)
+        self.errors = []
+        self.error_gui = maya_tools.error_gui
+        maya_tools.error_gui = self.errors.append
+        self.load_many = maya_tools.load_many
+        self.loads = []
+        maya_tools.load_many = self.fail_full_loads
+
+    def tearDown(self):
+        maya_tools.error_gui = self.error_gui
+        maya_tools.load_many = self.load_many
+        fixtures.SandboxTest.tearDown(self)
+
+    def fail_full_loads(self, entries, proxy=False):
+        if not proxy:
+            raise IOError('file is truncated')
+        self.loads.extend(entry[1] for entry in entries)
+
+    def test_reports_failed_loads(self):
+        queue = maya_tools.ImportQueue()
+        queue.put('ball.ma', 'ball', 'ball')
+        queue.put('cube.ma', 'cube', 'cube', proxy=True)
+        queue.drain()
+
+        self.assertEqual(self.loads, ['cube'])
+        self.assertEqual(len(self.errors), 1)
+        self.assertIn('ball', self.errors[0])
+        self.assertIn('file is truncated', self.errors[0])
+        stats = queue.get_stats()
+        self.assertEqual((stats['depth'], stats['loaded'], stats['failed']),
+                         (0, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""
+Tests of switching gozbruh.profiling on, run from the root of the
+repository:
+    python -m unittest tests.test_profiling
+"""
+
+import os
+import unittest
+
+from tests import fixtures
+
+from gozbruh import profiling
+from gozbruh import utils
+
+
+class IsEnabledTest(fixtures.SandboxTest):
+
+    def setUp(self):
+        fixtures.SandboxTest.setUp(self)
+        os.environ.pop(utils.PROFILE_ENV, None)
+        profiling._config_state[:] = [0.0, False]
+
+    def tearDown(self):
+        os.environ.pop(utils.PROFILE_ENV, None)
+        profiling._config_state[:] = [0.0, False]
+        fixtures.SandboxTest.tearDown(self)
+
+    def test_config_file(self):
+        self.assertFalse(profiling.is_enabled())
+        utils.config_write(utils.PROFILE_ENV, '1')
+        # read again once PROFILE_RECHECK passed
+        self.assertFalse(profiling.is_enabled())
+        profiling._config_state[0] = 0.0
+        self.assertTrue(profiling.is_enabled())
+        self.assertTrue(utils.is_profiling_enabled())
+
+    def test_environment_overrides_config_file(self):
+        utils.config_write(utils.PROFILE_ENV, '1')
+        os.environ[utils.PROFILE_ENV] = '0'
+        self.assertFalse(profiling.is_enabled())
+        self.assertFalse(utils.is_profiling_enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
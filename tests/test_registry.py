@@ -0,0 +1,79 @@
+"""
+Tests of the registry lookups of gozbruh.maya_tools, run from the root of
+the repository:
+    python -m unittest tests.test_registry
+"""
+
+import unittest
+
+from tests import fixtures
+
+fixtures.get_scene()
+
+from gozbruh import maya_tools
+from gozbruh import registry
+from gozbruh import utils
+
+
+class RegistryLookupTest(fixtures.SandboxTest):
+
+    def setUp(self):
+        fixtures.SandboxTest.setUp(self)
+        self.reg = registry.get_registry()
+        self.session = utils.get_session_id()
+        # a fresh index, without the maya callbacks the fake lacks
+        self.gozid_index = maya_tools._gozid_index
+        maya_tools._gozid_index = maya_tools.GozIdIndex()
+        maya_tools._gozid_index.callback_ids = ['none']
+
+    def tearDown(self):
+        maya_tools._gozid_index = self.gozid_index
+        fixtures.SandboxTest.tearDown(self)
+
+    def record(self, obj, subtool, session, uuid=None):
+        if uuid is None:
+            uuid = self.scene.nodes[obj]['uuid']
+        self.reg.record_many([(uuid, obj, subtool, subtool, None, None)],
+                             session)
+
+    def set_gozid(self, obj, goz_id):
+        self.scene.nodes[obj]['attrs']['gozbruhBrushID'] = goz_id
+
+    def test_registered_names_of_this_session(self):
+        self.scene.create_mesh('ball', 100)
+        self.record('ball', 'sphere', self.session)
+        # more recent, from another artist's scene
+        self.record('other', 'sphere', 'someone@elsewhere', 'OTHER-UUID')
+
+        renames = maya_tools._get_registered_names(
+            [('sphere.ma', 'sphere', 'sphere')])
+        self.assertEqual(renames, {'sphere': 'ball'})
+
+    def test_registered_names_skip_missing_nodes(self):
+        self.scene.create_mesh('ball', 100)
+        self.record('ball', 'sphere', self.session)
+        # more recent, deleted since
+        self.record('old', 'sphere', self.session, 'DELETED-UUID')
+
+        renames = maya_tools._get_registered_names(
+            [('sphere.ma', 'sphere', 'sphere')])
+        self.assertEqual(renames, {'sphere': 'ball'})
+
+    def test_mismatch_registered_in_this_session(self):
+        self.scene.create_mesh('ball', 100)
+        self.set_gozid('ball', 'sphere')
+        self.record('ball', 'sphere', self.session)
+
+        self.assertEqual(maya_tools._get_gozid_mismatches(['ball']), [])
+
+    def test_mismatch_registered_in_another_session(self):
+        self.scene.create_mesh('ball', 100)
+        self.set_gozid('ball', 'sphere')
+        self.record('ball', 'sphere', 'someone@elsewhere')
+
+        self.assertEqual(maya_tools._get_gozid_mismatches(['ball']),
+                         [('ball', 'sphere')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests of gozbruh.relay on localhost, run from the root of the repository:
+    python -m unittest tests.test_relay
+"""
+
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import unittest
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from gozbruh import errs
+from gozbruh import protocol
+from gozbruh import relay
+
+
+class RelayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = relay.RelayServer(('localhost', 0))
+        self.port = self.server.server_address[1]
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.file_dir = tempfile.mkdtemp()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.file_dir)
+
+    def connect(self, role, receive=False):
+        client = relay.RelayClient('localhost', self.port, role,
+                                   artist='jane', session=role + '@test',
+                                   receive=receive)
+        client.connect()
+        self.clients.append(client)
+        return client
+
+    def serve(self, client, handle_delivery):
+        thread = Thread(target=client.serve,
+                        args=(handle_delivery, lambda *args: self.file_dir))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def wait_for_receivers(self, count):
+        deadline = time.time() + 5
+        while len(self.server.get_stats()['receivers']) != count:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def test_ack(self):
+        receiver = self.connect('zbrush', receive=True)
+        self.serve(receiver, lambda message, paths, sender: (True, 'loaded'))
+        self.wait_for_receivers(1)
+
+        acks = self.connect('maya').send('zbrush', {'command': 'open'})
+        self.assertEqual([(ack['ok'], ack['result']) for ack in acks],
+                         [(True, 'loaded')])
+
+    def test_receiver_disconnects_before_ack(self):
+        receiver = self.connect('zbrush', receive=True)
+        self.wait_for_receivers(1)
+
+        def drop():
+            # read the delivery, then go away without an ack
+            delivery = protocol.recv_message(receiver.sock)
+            self.assertEqual(delivery['command'], 'deliver')
+            receiver.sock.shutdown(socket.SHUT_RDWR)
+            receiver.close()
+        thread = Thread(target=drop)
+        thread.daemon = True
+        thread.start()
+
+        started = time.time()
+        acks = self.connect('maya').send('zbrush', {'command': 'open'},
+                                         timeout=5)
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(len(acks), 1)
+        self.assertFalse(acks[0]['ok'])
+        self.assertEqual(self.server.pending, {})
+
+    def test_timeout(self):
+        # a receiver that never answers
+        self.connect('zbrush', receive=True)
+        self.wait_for_receivers(1)
+
+        sender = self.connect('maya')
+        self.assertRaises(errs.RelayError, sender.send, 'zbrush',
+                          {'command': 'open'}, timeout=0.2)
+        self.assertEqual(sender.sock, None)
+
+    def test_no_receiver(self):
+        self.assertRaises(errs.RelayError, self.connect('maya').send,
+                          'zbrush', {'command': 'open'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Tests of gozbruh.zbrush_tools, run from the root of the repository:
+    python -m unittest tests.test_zbrush_tools
+"""
+
+import unittest
+
+from tests import fixtures
+
+fixtures.get_scene()
+
+from gozbruh import zbrush_tools
+
+
+class OpenObjectsTest(fixtures.SandboxTest):
+
+    def test_scheduler_stopped(self):
+        scheduler = zbrush_tools.ZBrushImportScheduler()
+        data = {'command': 'open', 'objData': {'|': ['ball', 'cube']}}
+        failures = zbrush_tools.open_objects(scheduler, data, 'artist',
+                                             self.env['shared_dir'])
+        self.assertEqual(sorted(failures), ['ball', 'cube'])
+        self.assertEqual(zbrush_tools.format_failures(failures),
+                         'could not import ball (ZBrush server stopped), '
+                         'cube (ZBrush server stopped)')
+
+    def test_store_checkout_failed(self):
+        scheduler = zbrush_tools.ZBrushImportScheduler()
+        scheduler.start()
+        try:
+            data = {'command': 'open',
+                    'objData': {'|': ['ball']},
+                    'store': {'ball': 'missing'}}
+            failures = zbrush_tools.open_objects(scheduler, data, 'artist',
+                                                 self.env['shared_dir'])
+        finally:
+            scheduler.stop()
+        self.assertEqual(failures.keys(), ['ball'])
+
+
+if __name__ == '__main__':
+    unittest.main()